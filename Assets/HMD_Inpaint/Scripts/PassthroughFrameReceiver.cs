@@ -21,7 +21,13 @@ public class PassthroughFrameReceiver : MonoBehaviour
     private MaterialPropertyBlock _propertyBlock;
     private Texture2D _outputTexture;
     private byte[] _pendingFrame;
+    private int _pendingWidth;   // > 0 for raw GRAY8 frames, 0 for encoded (JPEG/PNG) frames
+    private int _pendingHeight;
     private bool _hasNewFrame;
+    private byte[] _pendingPatch;  // encoded patch to decode over _pendingFrame (raw) at _pendingRoi
+    private RectInt _pendingRoi;
+    private Color32[] _rawPixels;
+    private Texture2D _patchTexture;
 
     public Texture2D CurrentTexture => _outputTexture;
 
@@ -55,6 +61,9 @@ public class PassthroughFrameReceiver : MonoBehaviour
         lock (_lock)
         {
             _pendingFrame = data;
+            _pendingWidth = 0;
+            _pendingHeight = 0;
+            _pendingPatch = null;
             _hasNewFrame = true;
         }
 
@@ -64,6 +73,57 @@ public class PassthroughFrameReceiver : MonoBehaviour
         }
     }
 
+    /// <summary>
+    /// Queues an uncompressed 8-bit grayscale frame, rows ordered top to bottom.
+    /// </summary>
+    public void QueueRawGray8Frame(byte[] data, int width, int height)
+    {
+        if (data == null || width <= 0 || height <= 0 || data.Length != width * height)
+        {
+            if (m_logDebug)
+            {
+                Debug.LogWarning($"PassthroughFrameReceiver: raw frame size mismatch ({data?.Length ?? 0} bytes for {width}x{height})");
+            }
+            return;
+        }
+
+        lock (_lock)
+        {
+            _pendingFrame = data;
+            _pendingWidth = width;
+            _pendingHeight = height;
+            _pendingPatch = null;
+            _hasNewFrame = true;
+        }
+    }
+
+    /// <summary>
+    /// Queues a raw GRAY8 frame with an encoded (JPEG/PNG) patch to paste over it at
+    /// <paramref name="roi"/> (top-left origin). The patch is decoded on the main thread.
+    /// </summary>
+    public void QueueRawGray8Patch(byte[] baseFrame, int width, int height, byte[] patch, RectInt roi)
+    {
+        if (baseFrame == null || width <= 0 || height <= 0 || baseFrame.Length != width * height ||
+            patch == null || patch.Length == 0 || roi.xMin < 0 || roi.yMin < 0 || roi.xMax > width || roi.yMax > height)
+        {
+            if (m_logDebug)
+            {
+                Debug.LogWarning($"PassthroughFrameReceiver: invalid patch {roi} for {width}x{height} frame");
+            }
+            return;
+        }
+
+        lock (_lock)
+        {
+            _pendingFrame = baseFrame;
+            _pendingWidth = width;
+            _pendingHeight = height;
+            _pendingPatch = patch;
+            _pendingRoi = roi;
+            _hasNewFrame = true;
+        }
+    }
+
     private void Update()
     {
         if (!_hasNewFrame)
@@ -72,6 +132,10 @@ public class PassthroughFrameReceiver : MonoBehaviour
         }
 
         byte[] frame;
+        byte[] patch;
+        RectInt roi;
+        int rawWidth;
+        int rawHeight;
         lock (_lock)
         {
             if (!_hasNewFrame)
@@ -80,7 +144,12 @@ public class PassthroughFrameReceiver : MonoBehaviour
             }
 
             frame = _pendingFrame;
+            rawWidth = _pendingWidth;
+            rawHeight = _pendingHeight;
+            patch = _pendingPatch;
+            roi = _pendingRoi;
             _pendingFrame = null;
+            _pendingPatch = null;
             _hasNewFrame = false;
         }
 
@@ -92,7 +161,20 @@ public class PassthroughFrameReceiver : MonoBehaviour
         try
         {
             EnsureOutputTexture();
-            if (!_outputTexture.LoadImage(frame, false))
+            if (patch != null && !PastePatch(frame, rawWidth, patch, roi))
+            {
+                if (m_logDebug)
+                {
+                    Debug.LogWarning("PassthroughFrameReceiver: failed to decode patch");
+                }
+                return;
+            }
+
+            if (rawWidth > 0)
+            {
+                LoadRawGray8(frame, rawWidth, rawHeight);
+            }
+            else if (!_outputTexture.LoadImage(frame, false))
             {
                 if (m_logDebug)
                 {
@@ -160,6 +242,60 @@ public class PassthroughFrameReceiver : MonoBehaviour
         };
     }
 
+    private void LoadRawGray8(byte[] frame, int width, int height)
+    {
+        if (_outputTexture.width != width || _outputTexture.height != height)
+        {
+            _outputTexture.Reinitialize(width, height);
+        }
+
+        int pixelCount = width * height;
+        if (_rawPixels == null || _rawPixels.Length != pixelCount)
+        {
+            _rawPixels = new Color32[pixelCount];
+        }
+
+        // Texture rows run bottom to top.
+        for (int y = 0; y < height; y++)
+        {
+            int srcOffset = (height - 1 - y) * width;
+            int dstOffset = y * width;
+            for (int x = 0; x < width; x++)
+            {
+                byte value = frame[srcOffset + x];
+                _rawPixels[dstOffset + x] = new Color32(value, value, value, 255);
+            }
+        }
+
+        _outputTexture.SetPixels32(_rawPixels);
+        _outputTexture.Apply(false, false);
+    }
+
+    private bool PastePatch(byte[] frame, int width, byte[] patch, RectInt roi)
+    {
+        if (_patchTexture == null)
+        {
+            _patchTexture = new Texture2D(2, 2, TextureFormat.RGBA32, false);
+        }
+        if (!_patchTexture.LoadImage(patch, false) || _patchTexture.width != roi.width || _patchTexture.height != roi.height)
+        {
+            return false;
+        }
+
+        // Decoded texture rows run bottom to top, frame rows top to bottom.
+        var pixels = _patchTexture.GetPixels32();
+        for (int y = 0; y < roi.height; y++)
+        {
+            int srcOffset = (roi.height - 1 - y) * roi.width;
+            int dstOffset = (roi.y + y) * width + roi.x;
+            for (int x = 0; x < roi.width; x++)
+            {
+                frame[dstOffset + x] = pixels[srcOffset + x].r;
+            }
+        }
+        return true;
+    }
+
     private void ApplyTexture(Texture texture)
     {
         if (m_targetRenderer != null)
@@ -185,5 +321,11 @@ public class PassthroughFrameReceiver : MonoBehaviour
             Destroy(_outputTexture);
             _outputTexture = null;
         }
+
+        if (_patchTexture != null)
+        {
+            Destroy(_patchTexture);
+            _patchTexture = null;
+        }
     }
 }
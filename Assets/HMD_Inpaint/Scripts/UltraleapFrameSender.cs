@@ -1,6 +1,8 @@
 using System;
 using System.Collections;
+using System.Collections.Generic;
 using System.IO;
+using System.IO.MemoryMappedFiles;
 using System.Net;
 using System.Net.Sockets;
 using System.Threading.Tasks;
@@ -26,6 +28,8 @@ public class UltraleapFrameSender : MonoBehaviour
     [SerializeField] private MaskCaptureProvider m_geometryMaskProvider;
     [SerializeField] private bool m_includeSkeletonMask = true;
     [SerializeField] private bool m_flipMaskHorizontally = true;
+    [Tooltip("Bit-packed and RLE masks are a fraction of the raw width*height bytes.")]
+    [SerializeField] private MaskEncoding m_maskEncoding = MaskEncoding.Rle;
 
     [Header("Networking")]
     [SerializeField] private string m_host = "127.0.0.1";
@@ -33,10 +37,19 @@ public class UltraleapFrameSender : MonoBehaviour
     [SerializeField] private bool m_waitForResponse = true;
 
     [Header("Encoding")]
+    [Tooltip("Raw GRAY8 skips JPEG on both ends; use it when the server runs on this PC. " +
+             "SharedMemoryGray8 also keeps the pixels off the socket (server needs --shm).")]
+    [SerializeField] private FrameEncoding m_frameEncoding = FrameEncoding.Jpeg;
+    [Tooltip("Ask the server for a raw GRAY8 reply instead of JPEG (raw/shared-memory encodings only).")]
+    [SerializeField] private bool m_rawResponse;
+    [Tooltip("Ask for the inpainted rectangle only and paste it over the sent frame (raw/shared-memory encodings only).")]
+    [SerializeField] private bool m_roiResponse;
     [SerializeField, Range(1, 100)] private int m_jpegQuality = 80;
 
     [Header("Diagnostics")]
     [SerializeField] private bool m_logDebug;
+    [Tooltip("Tag raw/shared-memory frames with an id and capture time; the server returns its per-stage timings.")]
+    [SerializeField] private bool m_reportLatency;
 
     private enum EyeSelection
     {
@@ -44,9 +57,48 @@ public class UltraleapFrameSender : MonoBehaviour
         Right
     }
 
+    private enum MaskEncoding : byte
+    {
+        Raw = 0,
+        BitPacked = 1,
+        Rle = 2  // COCO RLE counts string (column-major), as produced by pycocotools
+    }
+
+    private enum FrameEncoding
+    {
+        Jpeg,
+        RawGray8,
+        SharedMemoryGray8
+    }
+
     private const int RequestHeaderSize = 8;   // [imageLength(int)][maskLength(int)]
     private const int ResponseHeaderSize = 4;  // [imageLength(int)]
 
+    // Protocol v2 (see InpaintServer/PC_Inpaint/frame_protocol.py):
+    // request  [magic][pixelFormat][replyFormat][maskFormat][flags][width(u16)][height(u16)][imageLength][maskLength]
+    // response [magic][pixelFormat][flags][pad(2)][width(u16)][height(u16)][imageLength]
+    private const int RequestHeaderSizeV2 = 20;
+    private const int ResponseHeaderSizeV2 = 16;
+    private static readonly byte[] MagicV2 = { (byte)'H', (byte)'R', (byte)'V', (byte)'2' };
+    private const byte PixelFormatJpeg = 0;
+    private const byte PixelFormatGray8 = 1;
+    private const byte FlagShm = 0x01;        // pixels are in a ring slot, the socket carries [slot(int)]
+    private const byte FlagShmAttach = 0x02;  // payload is the ring file path
+    private const byte FlagRoi = 0x04;        // request: reply with the changed rectangle; reply: [x][y][w][h](u16) follow
+    private const byte FlagUnchanged = 0x08;  // reply: nothing was inpainted, show the sent frame
+    private const int RoiSize = 8;
+    private const byte FlagTiming = 0x10;     // request: [frameId(u32)][captureUs(u64)] follow; reply: echoed + 6 x stage us(u32)
+    private const int FrameInfoSize = 12;
+    private const int TimingReplySize = 36;
+    private const int LatencyLogInterval = 30;
+
+    // Ring file (see InpaintServer/PC_Inpaint/shm_ring.py):
+    // [magic][version(u16)][slotCount(u16)][frameCapacity][maskCapacity][responseCapacity], padded to 64 bytes,
+    // then slotCount x [frame][mask][response].
+    private static readonly byte[] RingMagic = { (byte)'H', (byte)'R', (byte)'S', (byte)'M' };
+    private const int RingHeaderSize = 64;
+    private const int RingSlotCount = 4;
+
     private TcpClient _client;
     private NetworkStream _stream;
     private Coroutine _sendCoroutine;
@@ -56,6 +108,42 @@ public class UltraleapFrameSender : MonoBehaviour
     private Color32[] _rgbBuffer;
     private byte[] _rawBuffer;
     private byte[] _maskBuffer;
+    private int _frameWidth;
+    private int _frameHeight;
+    private bool _sentRawFrame;
+    private bool _sentViaRing;
+    private byte[] _sentFrame;  // raw GRAY8 frame the pending reply's ROI is pasted over
+    private uint _frameId;
+    private long _captureMicros;
+    private double _latencySumMs;
+    private int _latencyCount;
+    private byte _maskFormat;
+
+    private FileStream _ringFile;
+    private MemoryMappedFile _ring;
+    private MemoryMappedViewAccessor _ringView;
+    private string _ringPath;
+    private int _ringFrameCapacity;
+    private int _ringMaskCapacity;
+    private int _ringResponseCapacity;
+    private int _nextRingSlot;
+    private bool _ringAttached;
+
+    private struct FrameReply
+    {
+        public byte[] Data;
+        public byte PixelFormat;
+        public byte Flags;
+        public RectInt Roi;
+        public int Width;
+        public int Height;
+        public uint FrameId;
+        public long CaptureMicros;
+        public int[] StageMicros;  // recv, decode, infer, post, inpaint, encode
+    }
+
+    /// <summary>Capture-to-reply latency of the last frame the server returned timings for.</summary>
+    public float LastLatencyMs { get; private set; }
 
     private void Awake()
     {
@@ -103,6 +191,7 @@ public class UltraleapFrameSender : MonoBehaviour
 
         CloseConnection();
         DisposeScratchResources();
+        DisposeRing();
     }
 
     private IEnumerator SendLoop()
@@ -162,11 +251,8 @@ public class UltraleapFrameSender : MonoBehaviour
                 }
                 else
                 {
-                    var result = readTask.Result;
-                    if (result != null && result.Length > 0)
-                    {
-                        _receiver.QueueFrame(result);
-                    }
+                    QueueReply(readTask.Result);
+                    RecordLatency(readTask.Result);
                 }
             }
 
@@ -174,6 +260,94 @@ public class UltraleapFrameSender : MonoBehaviour
         }
     }
 
+    private void QueueReply(FrameReply result)
+    {
+        if ((result.Flags & FlagUnchanged) != 0)
+        {
+            if (_sentFrame != null)
+            {
+                _receiver.QueueRawGray8Frame(_sentFrame, _frameWidth, _frameHeight);
+            }
+            return;
+        }
+
+        if (result.Data == null || result.Data.Length == 0)
+        {
+            return;
+        }
+
+        if ((result.Flags & FlagRoi) != 0)
+        {
+            if (_sentFrame == null)
+            {
+                return;
+            }
+            if (result.PixelFormat != PixelFormatGray8)
+            {
+                _receiver.QueueRawGray8Patch(_sentFrame, _frameWidth, _frameHeight, result.Data, result.Roi);
+                return;
+            }
+
+            // The sent buffer is not reused, so the patch goes straight into it.
+            var roi = result.Roi;
+            if (roi.xMin < 0 || roi.yMin < 0 || roi.xMax > _frameWidth || roi.yMax > _frameHeight ||
+                result.Data.Length != roi.width * roi.height)
+            {
+                return;
+            }
+            for (int y = 0; y < roi.height; y++)
+            {
+                Buffer.BlockCopy(result.Data, y * roi.width, _sentFrame, (roi.y + y) * _frameWidth + roi.x, roi.width);
+            }
+            _receiver.QueueRawGray8Frame(_sentFrame, _frameWidth, _frameHeight);
+            return;
+        }
+
+        if (result.PixelFormat == PixelFormatGray8)
+        {
+            _receiver.QueueRawGray8Frame(result.Data, result.Width, result.Height);
+        }
+        else
+        {
+            _receiver.QueueFrame(result.Data);
+        }
+    }
+
+    private void RecordLatency(FrameReply result)
+    {
+        if ((result.Flags & FlagTiming) == 0 || result.StageMicros == null)
+        {
+            return;
+        }
+
+        if (result.FrameId != _frameId && m_logDebug)
+        {
+            Debug.LogWarning($"UltraleapFrameSender: reply for frame {result.FrameId} while waiting for {_frameId}");
+        }
+
+        LastLatencyMs = (NowMicros() - result.CaptureMicros) / 1000f;
+        _latencySumMs += LastLatencyMs;
+        if (++_latencyCount < LatencyLogInterval)
+        {
+            return;
+        }
+
+        if (m_logDebug)
+        {
+            var stages = result.StageMicros;
+            Debug.Log($"UltraleapFrameSender: capture->reply {_latencySumMs / _latencyCount:F1} ms avg over {_latencyCount} frames; " +
+                      $"last server stages (ms) recv={stages[0] / 1000f:F1} decode={stages[1] / 1000f:F1} infer={stages[2] / 1000f:F1} " +
+                      $"post={stages[3] / 1000f:F1} inpaint={stages[4] / 1000f:F1} encode={stages[5] / 1000f:F1}");
+        }
+        _latencySumMs = 0;
+        _latencyCount = 0;
+    }
+
+    private static long NowMicros()
+    {
+        return System.Diagnostics.Stopwatch.GetTimestamp() * 1000000L / System.Diagnostics.Stopwatch.Frequency;
+    }
+
     private bool TryCaptureFrame(out byte[] frameBytes, out byte[] maskBytes)
     {
         frameBytes = null;
@@ -208,27 +382,20 @@ public class UltraleapFrameSender : MonoBehaviour
             return false;
         }
 
-        EnsureScratchResources(combinedWidth, singleHeight, pixelCount);
-        raw.CopyTo(_rawBuffer);
-
         int offset = m_eye == EyeSelection.Right ? pixelCount : 0;
-        for (int y = 0; y < singleHeight; y++)
+        _captureMicros = NowMicros();
+        _frameId++;
+        _frameWidth = combinedWidth;
+        _frameHeight = singleHeight;
+
+        if (m_frameEncoding != FrameEncoding.Jpeg)
         {
-            int srcRow = singleHeight - 1 - y;
-            int srcOffset = offset + srcRow * combinedWidth;
-            int dstOffset = y * combinedWidth;
-            for (int x = 0; x < combinedWidth; x++)
-            {
-                byte value = _rawBuffer[srcOffset + x];
-                _rgbBuffer[dstOffset + x] = new Color32(value, value, value, 255);
-            }
+            // The rows are already in the order the JPEG path produces, so the
+            // eye's half of the buffer goes out as is.
+            frameBytes = new byte[pixelCount];
+            NativeArray<byte>.Copy(raw, offset, frameBytes, 0, pixelCount);
         }
-
-        _scratchTexture.SetPixels32(_rgbBuffer);
-        _scratchTexture.Apply(false, false);
-
-        frameBytes = ImageConversion.EncodeToJPG(_scratchTexture, m_jpegQuality);
-        if (frameBytes == null || frameBytes.Length == 0)
+        else if (!TryEncodeJpeg(raw, offset, combinedWidth, singleHeight, pixelCount, out frameBytes))
         {
             return false;
         }
@@ -264,10 +431,43 @@ public class UltraleapFrameSender : MonoBehaviour
         }
 
         maskBytes = MergeMasks(skeletonMask, geometryMask);
+        _maskFormat = (byte)m_maskEncoding;
+        if (maskBytes != null && m_maskEncoding == MaskEncoding.BitPacked)
+        {
+            maskBytes = PackMaskBits(maskBytes);
+        }
+        else if (maskBytes != null && m_maskEncoding == MaskEncoding.Rle)
+        {
+            maskBytes = EncodeMaskRle(maskBytes, combinedWidth, singleHeight);
+        }
 
         return true;
     }
 
+    private bool TryEncodeJpeg(NativeArray<byte> raw, int offset, int width, int height, int pixelCount, out byte[] frameBytes)
+    {
+        EnsureScratchResources(width, height, pixelCount);
+        raw.CopyTo(_rawBuffer);
+
+        for (int y = 0; y < height; y++)
+        {
+            int srcRow = height - 1 - y;
+            int srcOffset = offset + srcRow * width;
+            int dstOffset = y * width;
+            for (int x = 0; x < width; x++)
+            {
+                byte value = _rawBuffer[srcOffset + x];
+                _rgbBuffer[dstOffset + x] = new Color32(value, value, value, 255);
+            }
+        }
+
+        _scratchTexture.SetPixels32(_rgbBuffer);
+        _scratchTexture.Apply(false, false);
+
+        frameBytes = ImageConversion.EncodeToJPG(_scratchTexture, m_jpegQuality);
+        return frameBytes != null && frameBytes.Length > 0;
+    }
+
     private static byte[] MergeMasks(byte[] skeletonMask, byte[] geometryMask)
     {
         if ((skeletonMask == null || skeletonMask.Length == 0) && (geometryMask == null || geometryMask.Length == 0))
@@ -310,6 +510,67 @@ public class UltraleapFrameSender : MonoBehaviour
         return result;
     }
 
+    private static byte[] PackMaskBits(byte[] mask)
+    {
+        var packed = new byte[(mask.Length + 7) / 8];
+        for (int i = 0; i < mask.Length; i++)
+        {
+            if (mask[i] != 0)
+            {
+                packed[i >> 3] |= (byte)(0x80 >> (i & 7));
+            }
+        }
+        return packed;
+    }
+
+    private static byte[] EncodeMaskRle(byte[] mask, int width, int height)
+    {
+        // Column-major runs starting with a (possibly empty) run of zeros.
+        var counts = new List<int>();
+        bool previous = false;
+        int run = 0;
+        for (int x = 0; x < width; x++)
+        {
+            for (int y = 0; y < height; y++)
+            {
+                bool value = mask[y * width + x] != 0;
+                if (value != previous)
+                {
+                    counts.Add(run);
+                    run = 0;
+                    previous = value;
+                }
+                run++;
+            }
+        }
+        counts.Add(run);
+
+        // Same string encoding as pycocotools' rleToString.
+        var output = new List<byte>(counts.Count * 2);
+        for (int i = 0; i < counts.Count; i++)
+        {
+            long value = counts[i];
+            if (i > 2)
+            {
+                value -= counts[i - 2];
+            }
+
+            bool more = true;
+            while (more)
+            {
+                long c = value & 0x1f;
+                value >>= 5;
+                more = (c & 0x10) != 0 ? value != -1 : value != 0;
+                if (more)
+                {
+                    c |= 0x20;
+                }
+                output.Add((byte)(c + 48));
+            }
+        }
+        return output.ToArray();
+    }
+
     private static byte[] ResizeMask(byte[] source, int srcWidth, int srcHeight, int dstWidth, int dstHeight)
     {
         var resized = new byte[dstWidth * dstHeight];
@@ -386,7 +647,8 @@ public class UltraleapFrameSender : MonoBehaviour
     {
         CloseConnection();
 
-        _client = new TcpClient();
+        // Header and frame go out as separate writes; do not let Nagle hold the tail of the frame.
+        _client = new TcpClient { NoDelay = true };
         var connectTask = _client.ConnectAsync(m_host, m_port);
         while (!connectTask.IsCompleted)
         {
@@ -405,6 +667,7 @@ public class UltraleapFrameSender : MonoBehaviour
         }
 
         _stream = _client.GetStream();
+        _ringAttached = false;
         if (m_logDebug)
         {
             Debug.Log($"UltraleapFrameSender: connected to {m_host}:{m_port}");
@@ -419,9 +682,25 @@ public class UltraleapFrameSender : MonoBehaviour
         }
 
         int maskLength = mask?.Length ?? 0;
-        var header = new byte[RequestHeaderSize];
-        Buffer.BlockCopy(BitConverter.GetBytes(IPAddress.HostToNetworkOrder(frame.Length)), 0, header, 0, 4);
-        Buffer.BlockCopy(BitConverter.GetBytes(IPAddress.HostToNetworkOrder(maskLength)), 0, header, 4, 4);
+        _sentRawFrame = m_frameEncoding != FrameEncoding.Jpeg;
+        _sentViaRing = m_frameEncoding == FrameEncoding.SharedMemoryGray8;
+        _sentFrame = _sentRawFrame && m_roiResponse ? frame : null;
+        if (_sentViaRing)
+        {
+            await WriteFrameToRingAsync(frame, mask, maskLength).ConfigureAwait(false);
+            return;
+        }
+
+        var header = _sentRawFrame
+            ? BuildRawRequestHeader(frame.Length, maskLength, 0)
+            : new byte[RequestHeaderSize];
+        if (!_sentRawFrame)
+        {
+            Buffer.BlockCopy(BitConverter.GetBytes(IPAddress.HostToNetworkOrder(frame.Length)), 0, header, 0, 4);
+            // v1 keeps the mask encoding in the top byte of the mask length.
+            int maskField = maskLength > 0 ? (_maskFormat << 24) | maskLength : 0;
+            Buffer.BlockCopy(BitConverter.GetBytes(IPAddress.HostToNetworkOrder(maskField)), 0, header, 4, 4);
+        }
 
         await _stream.WriteAsync(header, 0, header.Length).ConfigureAwait(false);
         await _stream.WriteAsync(frame, 0, frame.Length).ConfigureAwait(false);
@@ -432,21 +711,172 @@ public class UltraleapFrameSender : MonoBehaviour
         await _stream.FlushAsync().ConfigureAwait(false);
     }
 
-    private async Task<byte[]> ReadFrameAsync()
+    private byte[] BuildRawRequestHeader(int frameLength, int maskLength, byte flags, int extraBytes = 0)
+    {
+        bool timed = m_reportLatency && (flags & FlagShmAttach) == 0;
+        var header = new byte[RequestHeaderSizeV2 + extraBytes + (timed ? FrameInfoSize : 0)];
+        Buffer.BlockCopy(MagicV2, 0, header, 0, 4);
+        header[4] = PixelFormatGray8;
+        header[5] = m_rawResponse ? PixelFormatGray8 : PixelFormatJpeg;
+        header[6] = _maskFormat;
+        if ((flags & FlagShmAttach) == 0)
+        {
+            flags |= (byte)((m_roiResponse ? FlagRoi : 0) | (timed ? FlagTiming : 0));
+        }
+        header[7] = flags;
+        Buffer.BlockCopy(BitConverter.GetBytes(IPAddress.HostToNetworkOrder((short)_frameWidth)), 0, header, 8, 2);
+        Buffer.BlockCopy(BitConverter.GetBytes(IPAddress.HostToNetworkOrder((short)_frameHeight)), 0, header, 10, 2);
+        Buffer.BlockCopy(BitConverter.GetBytes(IPAddress.HostToNetworkOrder(frameLength)), 0, header, 12, 4);
+        Buffer.BlockCopy(BitConverter.GetBytes(IPAddress.HostToNetworkOrder(maskLength)), 0, header, 16, 4);
+        if (timed)
+        {
+            // After the slot index, which the caller writes into the extra bytes.
+            int info = RequestHeaderSizeV2 + extraBytes;
+            Buffer.BlockCopy(BitConverter.GetBytes(IPAddress.HostToNetworkOrder((int)_frameId)), 0, header, info, 4);
+            Buffer.BlockCopy(BitConverter.GetBytes(IPAddress.HostToNetworkOrder(_captureMicros)), 0, header, info + 4, 8);
+        }
+        return header;
+    }
+
+    private async Task WriteFrameToRingAsync(byte[] frame, byte[] mask, int maskLength)
     {
-        var header = await ReadExactAsync(ResponseHeaderSize).ConfigureAwait(false);
-        if (header == null || header.Length != ResponseHeaderSize)
+        // Runs synchronously up to the first await, i.e. on the main thread.
+        EnsureRing(frame.Length);
+        if (!_ringAttached)
         {
-            return null;
+            var path = System.Text.Encoding.UTF8.GetBytes(_ringPath);
+            var attach = BuildRawRequestHeader(path.Length, 0, FlagShmAttach);
+            await _stream.WriteAsync(attach, 0, attach.Length).ConfigureAwait(false);
+            await _stream.WriteAsync(path, 0, path.Length).ConfigureAwait(false);
+            _ringAttached = true;
+        }
+
+        int slot = _nextRingSlot;
+        _nextRingSlot = (_nextRingSlot + 1) % RingSlotCount;
+        long offset = RingSlotOffset(slot);
+        _ringView.WriteArray(offset, frame, 0, frame.Length);
+        if (maskLength > _ringMaskCapacity)
+        {
+            maskLength = 0;
+        }
+        if (maskLength > 0)
+        {
+            _ringView.WriteArray(offset + _ringFrameCapacity, mask, 0, maskLength);
+        }
+
+        var header = BuildRawRequestHeader(frame.Length, maskLength, FlagShm, 4);
+        Buffer.BlockCopy(BitConverter.GetBytes(IPAddress.HostToNetworkOrder(slot)), 0, header, RequestHeaderSizeV2, 4);
+        await _stream.WriteAsync(header, 0, header.Length).ConfigureAwait(false);
+        await _stream.FlushAsync().ConfigureAwait(false);
+    }
+
+    private void EnsureRing(int frameLength)
+    {
+        if (_ring != null && frameLength <= _ringFrameCapacity)
+        {
+            return;
+        }
+
+        DisposeRing();
+        _ringFrameCapacity = frameLength;
+        _ringMaskCapacity = frameLength;
+        _ringResponseCapacity = frameLength * 3; // room for a BGR24 or JPEG reply
+        long size = RingHeaderSize + (long)RingSlotCount * (_ringFrameCapacity + _ringMaskCapacity + _ringResponseCapacity);
+
+        _ringPath = Path.Combine(Application.temporaryCachePath, $"inpaint_ring_{m_eye}_{m_port}.bin");
+        _ringFile = new FileStream(_ringPath, FileMode.Create, FileAccess.ReadWrite, FileShare.ReadWrite);
+        _ringFile.SetLength(size);
+        _ring = MemoryMappedFile.CreateFromFile(_ringFile, null, size, MemoryMappedFileAccess.ReadWrite, HandleInheritability.None, true);
+        _ringView = _ring.CreateViewAccessor(0, size);
+
+        var header = new byte[20];
+        Buffer.BlockCopy(RingMagic, 0, header, 0, 4);
+        Buffer.BlockCopy(BitConverter.GetBytes(IPAddress.HostToNetworkOrder((short)1)), 0, header, 4, 2);
+        Buffer.BlockCopy(BitConverter.GetBytes(IPAddress.HostToNetworkOrder((short)RingSlotCount)), 0, header, 6, 2);
+        Buffer.BlockCopy(BitConverter.GetBytes(IPAddress.HostToNetworkOrder(_ringFrameCapacity)), 0, header, 8, 4);
+        Buffer.BlockCopy(BitConverter.GetBytes(IPAddress.HostToNetworkOrder(_ringMaskCapacity)), 0, header, 12, 4);
+        Buffer.BlockCopy(BitConverter.GetBytes(IPAddress.HostToNetworkOrder(_ringResponseCapacity)), 0, header, 16, 4);
+        _ringView.WriteArray(0, header, 0, header.Length);
+        _ringView.Flush();
+
+        _nextRingSlot = 0;
+        _ringAttached = false;
+    }
+
+    private long RingSlotOffset(int slot)
+    {
+        return RingHeaderSize + (long)slot * (_ringFrameCapacity + _ringMaskCapacity + _ringResponseCapacity);
+    }
+
+    private async Task<FrameReply> ReadFrameAsync()
+    {
+        var reply = new FrameReply { PixelFormat = PixelFormatJpeg };
+        int headerSize = _sentRawFrame ? ResponseHeaderSizeV2 : ResponseHeaderSize;
+        if (_sentViaRing)
+        {
+            headerSize += 4; // [slot(int)]
+        }
+        var header = await ReadExactAsync(headerSize).ConfigureAwait(false);
+        if (header == null || header.Length != headerSize)
+        {
+            return reply;
+        }
+
+        int length;
+        if (_sentRawFrame)
+        {
+            reply.PixelFormat = header[4];
+            reply.Flags = header[5];
+            reply.Width = (ushort)IPAddress.NetworkToHostOrder(BitConverter.ToInt16(header, 8));
+            reply.Height = (ushort)IPAddress.NetworkToHostOrder(BitConverter.ToInt16(header, 10));
+            length = IPAddress.NetworkToHostOrder(BitConverter.ToInt32(header, 12));
+        }
+        else
+        {
+            length = IPAddress.NetworkToHostOrder(BitConverter.ToInt32(header, 0));
+        }
+
+        if ((reply.Flags & FlagRoi) != 0)
+        {
+            var roi = await ReadExactAsync(RoiSize).ConfigureAwait(false);
+            reply.Roi = new RectInt(
+                (ushort)IPAddress.NetworkToHostOrder(BitConverter.ToInt16(roi, 0)),
+                (ushort)IPAddress.NetworkToHostOrder(BitConverter.ToInt16(roi, 2)),
+                (ushort)IPAddress.NetworkToHostOrder(BitConverter.ToInt16(roi, 4)),
+                (ushort)IPAddress.NetworkToHostOrder(BitConverter.ToInt16(roi, 6)));
+        }
+
+        if ((reply.Flags & FlagTiming) != 0)
+        {
+            var timing = await ReadExactAsync(TimingReplySize).ConfigureAwait(false);
+            reply.FrameId = (uint)IPAddress.NetworkToHostOrder(BitConverter.ToInt32(timing, 0));
+            reply.CaptureMicros = IPAddress.NetworkToHostOrder(BitConverter.ToInt64(timing, 4));
+            reply.StageMicros = new int[6];
+            for (int i = 0; i < reply.StageMicros.Length; i++)
+            {
+                reply.StageMicros[i] = IPAddress.NetworkToHostOrder(BitConverter.ToInt32(timing, 12 + i * 4));
+            }
         }
 
-        int length = IPAddress.NetworkToHostOrder(BitConverter.ToInt32(header, 0));
         if (length <= 0)
         {
-            return null;
+            return reply;
+        }
+
+        if (_sentViaRing)
+        {
+            int slot = IPAddress.NetworkToHostOrder(BitConverter.ToInt32(header, ResponseHeaderSizeV2));
+            if (slot < 0 || slot >= RingSlotCount || length > _ringResponseCapacity)
+            {
+                throw new IOException($"Invalid shared-memory reply (slot {slot}, {length} bytes)");
+            }
+            reply.Data = new byte[length];
+            _ringView.ReadArray(RingSlotOffset(slot) + _ringFrameCapacity + _ringMaskCapacity, reply.Data, 0, length);
+            return reply;
         }
 
-        return await ReadExactAsync(length).ConfigureAwait(false);
+        reply.Data = await ReadExactAsync(length).ConfigureAwait(false);
+        return reply;
     }
 
     private async Task<byte[]> ReadExactAsync(int length)
@@ -502,4 +932,15 @@ public class UltraleapFrameSender : MonoBehaviour
         _maskBuffer = null;
     }
 
+    private void DisposeRing()
+    {
+        _ringView?.Dispose();
+        _ringView = null;
+        _ring?.Dispose();
+        _ring = null;
+        _ringFile?.Dispose();
+        _ringFile = null;
+        _ringAttached = false;
+    }
+
 }
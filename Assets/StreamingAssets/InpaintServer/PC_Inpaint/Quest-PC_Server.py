@@ -7,14 +7,17 @@ the headset.
 from __future__ import annotations
 
 import argparse
+import asyncio
 import socket
 import struct
 import threading
-from typing import Optional, Sequence, Tuple
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
 
 import cv2
 import numpy as np
 
+from async_frame_server import AsyncFrameServer
 from rtmdet_inpainter import RTMDetInpainter
 
 
@@ -72,6 +75,15 @@ def build_inpainter(args: argparse.Namespace) -> RTMDetInpainter:
         inpaint_radius=args.inpaint_radius,
         inpaint_flags=cv2.INPAINT_TELEA,
         warmup=args.warmup,
+        direct_inference=args.direct,
+        max_detections=args.max_detections,
+        mask_threshold=args.mask_threshold,
+        native_masks=args.native_masks,
+        lean_preprocess=args.lean_preprocess,
+        onnx_path=args.onnx,
+        channels_last=args.channels_last,
+        compile_mode=args.compile,
+        num_threads=args.threads,
     )
 
 
@@ -119,6 +131,71 @@ def handle_client(
         conn.close()
 
 
+@dataclass
+class FrameJob:
+    payload: bytes
+    image: Optional[np.ndarray] = None
+    processed: Optional[np.ndarray] = None
+
+
+class AsyncClientSession:
+    """Per-connection hooks for the asyncio server (see async_frame_server)."""
+
+    def __init__(
+        self,
+        addr: Tuple[str, int],
+        *,
+        inpainter: RTMDetInpainter,
+        infer_lock: threading.Lock,
+        jpeg_quality: int,
+    ) -> None:
+        self.addr = addr
+        self.inpainter = inpainter
+        self.infer_lock = infer_lock
+        self.jpeg_quality = jpeg_quality
+
+    async def read(self, reader: asyncio.StreamReader) -> Optional[FrameJob]:
+        header = await reader.readexactly(4)
+        (length,) = struct.unpack("!I", header)
+        if length <= 0:
+            print(f"[warn] invalid frame length {length}, closing {self.addr}")
+            return None
+        return FrameJob(payload=await reader.readexactly(length))
+
+    def decode(self, job: FrameJob) -> FrameJob:
+        job.image = decode_image(job.payload)
+        return job
+
+    def process(self, job: FrameJob) -> FrameJob:
+        if job.image is None:
+            return job
+        try:
+            with self.infer_lock:
+                job.processed = self.inpainter.inpaint(job.image)
+        except Exception as exc:  # pragma: no cover - runtime safeguard
+            print(f"[error] inference failed: {exc}")
+            job.processed = job.image
+        return job
+
+    def mark_stale(self, job: FrameJob) -> FrameJob:
+        return job
+
+    def encode(self, job: FrameJob) -> List[bytes]:
+        payload = job.payload
+        if job.image is None:
+            print(f"[warn] decode failed, echoing raw payload to {self.addr}")
+        else:
+            encoded = encode_image(job.processed, self.jpeg_quality)
+            if encoded is None:
+                print(f"[warn] encode failed, echoing raw payload to {self.addr}")
+            else:
+                payload = encoded
+        return [struct.pack("!I", len(payload)), payload]
+
+    def close(self) -> None:
+        pass
+
+
 def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="RTMDet inpainting TCP server")
     parser.add_argument("--host", default="0.0.0.0", help="Address to bind")
@@ -128,19 +205,45 @@ def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
     parser.add_argument("--device", default="cuda:0", help="Device for inference, e.g. cuda:0 or cpu")
     parser.add_argument("--target-label", dest="target_label", action="append", help="Label(s) to inpaint; repeat for multiple")
     parser.add_argument("--score-threshold", type=float, default=0.3, help="Ignore detections below this score")
+    parser.add_argument("--max-detections", type=int, help="Keep at most this many instances after NMS (overrides the config's max_per_img)")
+    parser.add_argument("--mask-threshold", type=float, help="Mask binarisation threshold (overrides the config's mask_thr_binary)")
     parser.add_argument("--inference-width", type=int, help="Optional resize width before inference")
     parser.add_argument("--inference-height", type=int, help="Optional resize height before inference")
     parser.add_argument("--inpaint-radius", type=int, default=3, help="OpenCV inpaint radius")
     parser.add_argument("--jpeg-quality", type=int, default=80, help="JPEG quality for the response")
     parser.add_argument("--warmup", action="store_true", help="Run one warmup inference during startup")
+    parser.add_argument("--direct", action="store_true", help="Run the model's data_preprocessor and predict directly under inference_mode, skipping DetInferencer's RLE round-trip")
+    parser.add_argument("--native-masks", action="store_true", help="OR instance masks at the model's input resolution and upsample the union once (implies --direct)")
+    parser.add_argument("--lean-preprocess", action="store_true", help="Resize BGR frames once, straight to the padded model input, skipping the mmcv pipeline (implies --direct)")
+    parser.add_argument("--onnx", default="", help="Run this graph from export_onnx.py on onnxruntime (CPU) instead of PyTorch")
+    parser.add_argument("--channels-last", action="store_true", help="Run the model in channels_last (NHWC) memory format (implies --direct)")
+    parser.add_argument("--compile", nargs="?", const="default", default="", choices=("default", "reduce-overhead", "max-autotune"), help="torch.compile the backbone/neck and head, warmed up at startup (implies --direct)")
+    parser.add_argument("--threads", type=int, default=0, help="Intra-op threads for torch or onnxruntime (0 = library default)")
+    parser.add_argument("--asyncio", action="store_true", help="Serve all clients from one asyncio event loop instead of a thread each")
+    parser.add_argument("--queue-size", type=int, default=2, help="Frames buffered per connection in asyncio mode")
     return parser.parse_args(argv)
 
 
 def main(argv: Optional[Sequence[str]] = None) -> None:
     args = parse_args(argv)
     inpainter = build_inpainter(args)
+    if inpainter.warmup_ms:
+        passes = ", ".join(f"{ms:.0f}" for ms in inpainter.warmup_ms)
+        print(f"[*] warmup passes: {passes} ms")
     infer_lock = threading.Lock()
 
+    if args.asyncio:
+        AsyncFrameServer(
+            lambda addr: AsyncClientSession(
+                addr,
+                inpainter=inpainter,
+                infer_lock=infer_lock,
+                jpeg_quality=args.jpeg_quality,
+            ),
+            queue_size=args.queue_size,
+        ).run(args.host, args.port)
+        return
+
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server:
         server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         server.bind((args.host, args.port))
@@ -0,0 +1,227 @@
+"""asyncio TCP core shared by the inpainting servers.
+
+The threaded servers spawn one daemon thread per client and block in
+``recv_exact``/``sendall``. Here a single event loop accepts every connection
+and does the framing; the blocking work is pushed to executors:
+
+- decode and encode run on a shared thread pool (OpenCV releases the GIL),
+- ``process`` (the model) runs on a single-thread executor, which serializes
+  inference across connections the same way ``infer_lock`` does. Servers that
+  serialize the model themselves (e.g. through a DetectionBatcher) raise
+  ``infer_workers`` so several connections can wait on the model at once.
+
+Each connection is a small pipeline of three tasks (read -> process -> write)
+joined by bounded queues, with the same optional latest-frame-wins policy as
+frame_pipeline.FramePipeline. When a client disconnects its tasks are
+cancelled, so frames still waiting in its queues are never inferred.
+
+Servers plug in through a per-connection session object, see ``FrameSession``.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import socket
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional, Protocol, Sequence, Tuple
+
+_STOP = object()
+
+
+class FrameSession(Protocol):
+    """Per-connection hooks supplied by a server.
+
+    ``read`` does the framing on the event loop and returns ``None`` when the
+    stream should close; ``decode``/``process``/``encode`` are blocking and run
+    in executors. ``encode`` returns the buffers to write for one reply and is
+    called in request order, once per job (stale jobs included).
+    """
+
+    async def read(self, reader: asyncio.StreamReader) -> Optional[Any]: ...
+
+    def decode(self, job: Any) -> Any: ...
+
+    def process(self, job: Any) -> Any: ...
+
+    def mark_stale(self, job: Any) -> Any: ...
+
+    def encode(self, job: Any) -> Sequence[bytes]: ...
+
+    def close(self) -> None: ...
+
+
+class _Slot:
+    __slots__ = ("job", "claimed", "stale")
+
+    def __init__(self, job: Any) -> None:
+        self.job = job
+        self.claimed = False
+        self.stale = False
+
+
+class AsyncFrameServer:
+    """Serve ``FrameSession`` objects from one asyncio event loop."""
+
+    def __init__(
+        self,
+        session_factory: Callable[[Tuple[str, int]], FrameSession],
+        *,
+        queue_size: int = 2,
+        drop_stale: bool = False,
+        io_workers: Optional[int] = None,
+        infer_workers: int = 1,
+    ) -> None:
+        self._session_factory = session_factory
+        self._queue_size = max(1, int(queue_size))
+        self._drop_stale = bool(drop_stale)
+        self._io_executor = ThreadPoolExecutor(
+            max_workers=io_workers or min(8, os.cpu_count() or 4),
+            thread_name_prefix="frame-io",
+        )
+        self._infer_executor = ThreadPoolExecutor(
+            max_workers=max(1, int(infer_workers)),
+            thread_name_prefix="frame-infer",
+        )
+
+    def run(self, host: str, port: int) -> None:
+        try:
+            asyncio.run(self.serve(host, port))
+        finally:
+            self._io_executor.shutdown(wait=False, cancel_futures=True)
+            self._infer_executor.shutdown(wait=False, cancel_futures=True)
+
+    async def serve(self, host: str, port: int) -> None:
+        server = await asyncio.start_server(self._handle, host, port, reuse_address=True)
+        print(f"[*] listening on {host}:{port} (asyncio)")
+        async with server:
+            await server.serve_forever()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        addr = writer.get_extra_info("peername")
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        print(f"[+] connected from {addr}")
+        session = self._session_factory(addr)
+        conn = _Connection(self, session, reader, writer)
+        try:
+            await conn.run()
+        except (ConnectionError, asyncio.IncompleteReadError) as exc:
+            print(f"[-] {addr} disconnected: {exc}")
+        finally:
+            if self._drop_stale:
+                print(
+                    f"[stats] {addr} processed={conn.processed} dropped={conn.dropped} coalesced={conn.coalesced}",
+                )
+            session.close()
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+
+
+class _Connection:
+    """The read -> process -> write tasks of one client."""
+
+    def __init__(
+        self,
+        server: AsyncFrameServer,
+        session: FrameSession,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        self._server = server
+        self._session = session
+        self._reader = reader
+        self._writer = writer
+        self._drop_stale = server._drop_stale
+        # Drop mode keeps reading regardless of the model, see FramePipeline.
+        self._work: "asyncio.Queue[Any]" = asyncio.Queue(0 if self._drop_stale else server._queue_size)
+        self._send: "asyncio.Queue[Any]" = asyncio.Queue(server._queue_size)
+        self._pending: Optional[_Slot] = None
+        self._stale_since_claim = 0
+        self.processed = 0
+        self.dropped = 0
+        self.coalesced = 0
+
+    async def run(self) -> None:
+        tasks = [
+            asyncio.create_task(self._read_loop()),
+            asyncio.create_task(self._process_loop()),
+            asyncio.create_task(self._write_loop()),
+        ]
+        try:
+            # The writer finishes last on a clean close; any failure ends the connection.
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                if task.exception() is not None:
+                    raise task.exception()  # type: ignore[misc]
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _in_executor(self, executor: ThreadPoolExecutor, fn: Callable[[Any], Any], job: Any) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(executor, fn, job)
+
+    async def _read_loop(self) -> None:
+        while True:
+            job = await self._session.read(self._reader)
+            if job is None:
+                break
+            if not self._drop_stale:
+                # In drop mode most frames are never inferred, so decoding
+                # waits until the process task claims the frame.
+                job = await self._in_executor(self._server._io_executor, self._session.decode, job)
+            await self._work.put(self._enqueue(job))
+        # Clean close: let the queued frames drain before the writer exits.
+        await self._work.put(_STOP)
+
+    def _enqueue(self, job: Any) -> _Slot:
+        slot = _Slot(job)
+        if self._drop_stale:
+            pending = self._pending
+            if pending is not None and not pending.claimed and not pending.stale:
+                pending.stale = True
+                self.dropped += 1
+                self._stale_since_claim += 1
+            self._pending = slot
+        return slot
+
+    def _claim(self, slot: _Slot) -> bool:
+        if slot.stale:
+            return False
+        slot.claimed = True
+        if self._stale_since_claim:
+            self.coalesced += 1
+            self._stale_since_claim = 0
+        return True
+
+    async def _process_loop(self) -> None:
+        while True:
+            slot = await self._work.get()
+            if slot is _STOP:
+                await self._send.put(_STOP)
+                return
+            if self._claim(slot):
+                job = slot.job
+                if self._drop_stale:
+                    job = await self._in_executor(self._server._io_executor, self._session.decode, job)
+                job = await self._in_executor(self._server._infer_executor, self._session.process, job)
+                self.processed += 1
+            else:
+                job = self._session.mark_stale(slot.job)
+            await self._send.put(job)
+
+    async def _write_loop(self) -> None:
+        while True:
+            job = await self._send.get()
+            if job is _STOP:
+                return
+            buffers: List[bytes] = list(
+                await self._in_executor(self._server._io_executor, self._session.encode, job)
+            )
+            self._writer.writelines(buffers)
+            await self._writer.drain()
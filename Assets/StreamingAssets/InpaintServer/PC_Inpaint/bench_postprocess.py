@@ -0,0 +1,153 @@
+"""Equivalence check and timing: ROI-restricted mask post-processing of RTMDetInpainterStable.
+
+``_postprocess`` runs the small-component filter, close and dilate on the
+mask's bounding box padded by twice the kernel radius. This script runs the
+same steps over the whole frame (what ``inpaint`` did before), checks that the
+masks are identical for random hand masks (with holes, speckles and blobs
+touching the frame border) under several close/dilate/min-area settings, and
+compares the time of both.
+
+``--inference-size`` also compares the two ways of handling a mask detected at
+a lower resolution: upsample it to the frame and post-process there (default),
+or post-process at the detection resolution with scaled kernels and
+``min_area`` and upsample the final mask (``native_postprocess``). Those are
+not meant to be identical; the mask IoU between them is reported.
+
+    python bench_postprocess.py --frames 200 --sizes 640x480 1280x960 --inference-size 384x288
+"""
+from __future__ import annotations
+
+import argparse
+import statistics
+import time
+from typing import List, Tuple
+
+import cv2
+import numpy as np
+
+from rtmdet_inpainter_stable import RTMDetInpainterStable, TemporalState  # type: ignore
+
+# (mask_close, mask_dilate, min_area)
+SETTINGS: Tuple[Tuple[int, int, int], ...] = ((3, 2, 64), (0, 5, 64), (6, 0, 1), (3, 2, 1), (0, 0, 64), (8, 8, 200))
+
+
+def full_frame(inpainter: RTMDetInpainterStable, mask: np.ndarray, state: TemporalState) -> np.ndarray:
+    """The full-frame post-processing ``inpaint`` ran before the ROI version."""
+    if inpainter.min_area > 1:
+        mask = inpainter._filter_small_components(mask, inpainter.min_area, state)
+    k = max(inpainter.mask_close, inpainter.mask_dilate)
+    if k > 0:
+        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (k * 2 + 1, k * 2 + 1))
+        mu8 = (mask.astype(np.uint8)) * 255
+        if inpainter.mask_close > 0:
+            mu8 = cv2.morphologyEx(mu8, cv2.MORPH_CLOSE, kernel, iterations=1)
+        if inpainter.mask_dilate > 0:
+            mu8 = cv2.dilate(mu8, kernel, iterations=1)
+        mask = mu8 > 0
+    return mask
+
+
+def make_mask(rng: np.random.Generator, width: int, height: int) -> np.ndarray:
+    """A hand-sized ellipse with holes and a few speckles, sometimes clipped by the frame border."""
+    mask = np.zeros((height, width), dtype=np.uint8)
+    cx = int(rng.integers(-width // 10, width + width // 10))
+    cy = int(rng.integers(-height // 10, height + height // 10))
+    axes = (int(rng.integers(width // 20, width // 6)), int(rng.integers(height // 20, height // 4)))
+    cv2.ellipse(mask, (cx, cy), axes, float(rng.uniform(0, 180)), 0, 360, 1, -1)
+    for _ in range(int(rng.integers(0, 8))):
+        x = cx + int(rng.integers(-axes[0], axes[0] + 1))
+        y = cy + int(rng.integers(-axes[1], axes[1] + 1))
+        cv2.circle(mask, (x, y), int(rng.integers(1, 5)), 0, -1)
+    for _ in range(int(rng.integers(0, 12))):
+        x = cx + int(rng.integers(-2 * axes[0], 2 * axes[0] + 1))
+        y = cy + int(rng.integers(-2 * axes[1], 2 * axes[1] + 1))
+        cv2.circle(mask, (x, y), int(rng.integers(0, 6)), 1, -1)
+    return mask.astype(bool)
+
+
+def post_then_upsample(inpainter: RTMDetInpainterStable, small: np.ndarray, shape: Tuple[int, int], state: TemporalState) -> np.ndarray:
+    """``native_postprocess``: clean up at the detection resolution, upsample the result."""
+    h, w = shape
+    box = inpainter._mask_box(small)
+    if box is None:
+        return np.zeros(shape, dtype=bool)
+    scale = (small.size / (h * w)) ** 0.5
+    small = inpainter._postprocess(small, box, state, scale)[0]
+    return cv2.resize(small.view(np.uint8) * 255, (w, h), interpolation=cv2.INTER_LINEAR) > 127
+
+
+def upsample_then_post(inpainter: RTMDetInpainterStable, small: np.ndarray, shape: Tuple[int, int], state: TemporalState) -> np.ndarray:
+    """Default: upsample the detection to the frame, clean up there."""
+    h, w = shape
+    mask = cv2.resize(small.astype(np.uint8), (w, h), interpolation=cv2.INTER_NEAREST).astype(bool)
+    box = inpainter._mask_box(mask)
+    return inpainter._postprocess(mask, box, state)[0] if box is not None else mask
+
+
+def compare_native(inpainter: RTMDetInpainterStable, masks: List[np.ndarray], inference: Tuple[int, int], state: TemporalState) -> None:
+    h, w = masks[0].shape
+    iw, ih = inference
+    small_masks = [cv2.resize(m.view(np.uint8), (iw, ih), interpolation=cv2.INTER_NEAREST).astype(bool) for m in masks]
+    frame_ms: List[float] = []
+    native_ms: List[float] = []
+    ious: List[float] = []
+    for small in small_masks:
+        t0 = time.perf_counter()
+        reference = upsample_then_post(inpainter, small, (h, w), state)
+        t1 = time.perf_counter()
+        result = post_then_upsample(inpainter, small, (h, w), state)
+        t2 = time.perf_counter()
+        frame_ms.append((t1 - t0) * 1000.0)
+        native_ms.append((t2 - t1) * 1000.0)
+        union = np.count_nonzero(reference | result)
+        ious.append(1.0 if union == 0 else np.count_nonzero(reference & result) / union)
+    full, native = statistics.median(frame_ms), statistics.median(native_ms)
+    print(
+        f"[{w}x{h} from {iw}x{ih}] close={inpainter.mask_close} dilate={inpainter.mask_dilate} "
+        f"min_area={inpainter.min_area:3d} | frame-res {full:6.2f} ms | native {native:6.2f} ms | "
+        f"x{full / native:5.1f} | IoU mean={statistics.mean(ious):.4f} min={min(ious):.4f}",
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="ROI post-processing equivalence check and benchmark")
+    parser.add_argument("--sizes", nargs="+", default=["640x480", "1280x960"], help="Frame sizes as WxH")
+    parser.add_argument("--frames", type=int, default=200, help="Random masks per size and setting")
+    parser.add_argument("--inference-size", default="", help="Also compare native_postprocess for masks detected at WxH")
+    args = parser.parse_args()
+    inference = tuple(int(v) for v in args.inference_size.lower().split("x")) if args.inference_size else None
+
+    rng = np.random.default_rng(0)
+    # Only the attributes _postprocess reads; no model is loaded.
+    inpainter = RTMDetInpainterStable.__new__(RTMDetInpainterStable)
+    inpainter._kernels = {}
+    state = TemporalState()
+    for size in args.sizes:
+        w, h = (int(v) for v in size.lower().split("x"))
+        masks = [make_mask(rng, w, h) for _ in range(args.frames)]
+        for close, dilate, min_area in SETTINGS:
+            inpainter.mask_close, inpainter.mask_dilate, inpainter.min_area = close, dilate, min_area
+            mismatches = 0
+            full_ms: List[float] = []
+            roi_ms: List[float] = []
+            for mask in masks:
+                t0 = time.perf_counter()
+                reference = full_frame(inpainter, mask, state)
+                t1 = time.perf_counter()
+                box = inpainter._mask_box(mask)
+                result = inpainter._postprocess(mask, box, state)[0] if box is not None else mask
+                t2 = time.perf_counter()
+                full_ms.append((t1 - t0) * 1000.0)
+                roi_ms.append((t2 - t1) * 1000.0)
+                mismatches += int(not np.array_equal(reference, result))
+            full, roi = statistics.median(full_ms), statistics.median(roi_ms)
+            print(
+                f"[{w}x{h}] close={close} dilate={dilate} min_area={min_area:3d} | full {full:6.2f} ms | "
+                f"roi {roi:6.2f} ms | x{full / roi:5.1f} | mismatches {mismatches}/{len(masks)}",
+            )
+            if inference is not None:
+                compare_native(inpainter, masks, inference, state)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Microbenchmark: per-stage cost of turning a BGR frame into the model input batch.
+
+- pipeline: ``cv2.resize`` to --inference-width/height, ``cvtColor`` BGR->RGB,
+  DetInferencer's test pipeline (Resize + Pad + PackDetInputs), collate, then
+  the model's data_preprocessor (the default inpainter path);
+- lean: ``RTMDetInpainter(lean_preprocess=True)``: one ``cv2.resize`` of the BGR
+  frame into a padded buffer, ``torch.from_numpy``, collate, data_preprocessor.
+
+Also checks that the lean input equals the test pipeline's output for the same
+BGR frame (the model is trained on BGR; the pipeline path feeds it RGB).
+
+    python bench_preprocess.py --device cuda:0 --width 1280 --height 960 \\
+        --inference-width 640 --inference-height 480
+"""
+from __future__ import annotations
+
+import argparse
+import statistics
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import cv2
+import numpy as np
+import torch
+from mmengine.dataset import pseudo_collate
+
+from rtmdet_inpainter import RTMDetInpainter  # type: ignore
+
+HERE = Path(__file__).resolve().parent
+
+
+def timed(stages: Dict[str, List[float]], name: str, fn: Callable, *args):
+    start = time.perf_counter()
+    out = fn(*args)
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+    stages.setdefault(name, []).append((time.perf_counter() - start) * 1000.0)
+    return out
+
+
+def pipeline_frame(inpainter: RTMDetInpainter, frame: np.ndarray, stages: Dict[str, List[float]]) -> torch.Tensor:
+    model = inpainter.inferencer.model
+    working = frame
+    if inpainter.inference_size:
+        working = timed(stages, "resize", cv2.resize, frame, inpainter.inference_size, None, 0, 0, cv2.INTER_LINEAR)
+    rgb = timed(stages, "cvtColor", cv2.cvtColor, working, cv2.COLOR_BGR2RGB)
+    packed = timed(stages, "mmcv pipeline", inpainter.inferencer.pipeline, rgb)
+    batch = timed(stages, "collate", pseudo_collate, [packed])
+    return timed(stages, "data_preprocessor", model.data_preprocessor, batch, False)["inputs"]
+
+
+def lean_frame(inpainter: RTMDetInpainter, frame: np.ndarray, stages: Dict[str, List[float]]) -> torch.Tensor:
+    model = inpainter.inferencer.model
+    packed = timed(stages, "resize+pad+from_numpy", inpainter._lean_input, frame)
+    batch = timed(stages, "collate", pseudo_collate, [packed])
+    return timed(stages, "data_preprocessor", model.data_preprocessor, batch, False)["inputs"]
+
+
+def report(name: str, stages: Dict[str, List[float]], warm: int) -> None:
+    total = 0.0
+    print(f"  {name}")
+    for stage, samples in stages.items():
+        median = statistics.median(samples[warm:])
+        total += median
+        print(f"    {stage:24s} {median:7.3f} ms")
+    print(f"    {'total':24s} {total:7.3f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Preprocessing microbenchmark (mmcv pipeline vs lean path)")
+    parser.add_argument("--config", default=str(HERE / "config" / "rtmdet-ins_s.py"), help="Model config path")
+    parser.add_argument("--weights", default=str(HERE / "weights" / "rtmdet-ins_s.pth"), help="Model weights path")
+    parser.add_argument("--device", default="cuda:0", help="Device for inference, e.g. cuda:0 or cpu")
+    parser.add_argument("--width", type=int, default=640, help="Frame width")
+    parser.add_argument("--height", type=int, default=480, help="Frame height")
+    parser.add_argument("--inference-width", type=int, help="Resize width before the pipeline (pipeline path only)")
+    parser.add_argument("--inference-height", type=int, help="Resize height before the pipeline (pipeline path only)")
+    parser.add_argument("--frames", type=int, default=200)
+    args = parser.parse_args()
+
+    inference_size = None
+    if args.inference_width and args.inference_height:
+        inference_size = (args.inference_width, args.inference_height)
+    inpainter = RTMDetInpainter(
+        config_path=args.config,
+        weights_path=args.weights,
+        device=args.device,
+        inference_size=inference_size,
+        lean_preprocess=True,
+    )
+
+    gradient = np.tile(np.linspace(0, 255, args.width, dtype=np.uint8), (args.height, 1))
+    noise = np.random.default_rng(0).integers(0, 32, (args.height, args.width, 3), dtype=np.uint8)
+    frame = cv2.add(cv2.cvtColor(gradient, cv2.COLOR_GRAY2BGR), noise)
+
+    lean = lean_frame(inpainter, frame, {})
+    reference = inpainter.inferencer.model.data_preprocessor(
+        pseudo_collate([inpainter.inferencer.pipeline(frame)]), False,
+    )["inputs"]
+    if lean.shape == reference.shape:
+        print(f"[check] lean vs test pipeline on the BGR frame: max |diff| = {float((lean - reference).abs().max()):.4f}")
+    else:
+        print(f"[check] shape mismatch: lean {tuple(lean.shape)} vs pipeline {tuple(reference.shape)}")
+
+    warm = min(10, args.frames // 10)
+    print(f"[{args.width}x{args.height}] {args.frames} frames, device {args.device}")
+    for name, run in (("pipeline", pipeline_frame), ("lean", lean_frame)):
+        stages: Dict[str, List[float]] = {}
+        for _ in range(args.frames):
+            run(inpainter, frame, stages)
+        report(name, stages, warm)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Microbenchmark: RTMDetInpainterStable._filter_small_components on speckled masks.
+
+Low score thresholds (e.g. --score-threshold 0.08) leave hundreds of small
+blobs around the hand. The previous filter OR-ed one full-frame ``labels == i``
+comparison per component; the current one labels the mask's bounding box and
+keeps components with a single lookup-table pass. Both are run on a hand-sized
+blob plus N random speckles and checked to give the same mask.
+
+    python bench_small_components.py --speckles 0 100 300 1000 --min-area 64
+"""
+from __future__ import annotations
+
+import argparse
+import statistics
+import time
+from typing import Callable, List
+
+import cv2
+import numpy as np
+
+from rtmdet_inpainter_stable import RTMDetInpainterStable, TemporalState  # type: ignore
+
+
+def loop_filter(mask: np.ndarray, min_area: int) -> np.ndarray:
+    """The per-component filter used before the lookup-table version."""
+    mu8 = mask.astype(np.uint8)
+    num, labels, stats, _ = cv2.connectedComponentsWithStats((mu8 > 0).astype(np.uint8), connectivity=8)
+    if num <= 1:
+        return mu8 > 0
+    keep = np.zeros_like(mu8, dtype=bool)
+    for i in range(1, num):
+        if stats[i, cv2.CC_STAT_AREA] >= min_area:
+            keep |= (labels == i)
+    return keep
+
+
+def make_mask(rng: np.random.Generator, width: int, height: int, speckles: int) -> np.ndarray:
+    """A hand-sized ellipse plus ``speckles`` blobs of 1-120 px scattered over the frame."""
+    mask = np.zeros((height, width), dtype=np.uint8)
+    cv2.ellipse(mask, (width // 2, height // 2), (width // 8, height // 5), 30.0, 0, 360, 1, -1)
+    for _ in range(speckles):
+        x, y = int(rng.integers(0, width)), int(rng.integers(0, height))
+        radius = int(rng.integers(0, 7))
+        cv2.circle(mask, (x, y), radius, 1, -1)
+    return mask.astype(bool)
+
+
+def median_ms(fn: Callable[[], np.ndarray], repeats: int) -> float:
+    samples: List[float] = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000.0)
+    return statistics.median(samples)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Small-component filter microbenchmark")
+    parser.add_argument("--speckles", type=int, nargs="+", default=[0, 100, 300, 1000], help="Speckle counts")
+    parser.add_argument("--sizes", nargs="+", default=["640x480", "1280x960"], help="Mask sizes as WxH")
+    parser.add_argument("--min-area", type=int, default=64, help="Minimum component area (px)")
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    state = TemporalState()
+    flt = RTMDetInpainterStable._filter_small_components
+    for size in args.sizes:
+        w, h = (int(v) for v in size.lower().split("x"))
+        for speckles in args.speckles:
+            mask = make_mask(rng, w, h, speckles)
+            components = cv2.connectedComponents(mask.astype(np.uint8), connectivity=8)[0] - 1
+            same = np.array_equal(loop_filter(mask, args.min_area), flt(mask, args.min_area, state))
+            loop_ms = median_ms(lambda: loop_filter(mask, args.min_area), args.repeats)
+            lut_ms = median_ms(lambda: flt(mask, args.min_area, state), args.repeats)
+            print(
+                f"[{w}x{h}] {components:5d} components | loop {loop_ms:8.2f} ms | lut {lut_ms:6.2f} ms | "
+                f"x{loop_ms / lut_ms:6.1f} | identical={same}",
+            )
+
+
+if __name__ == "__main__":
+    main()
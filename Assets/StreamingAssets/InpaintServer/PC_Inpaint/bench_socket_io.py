@@ -0,0 +1,191 @@
+"""Microbenchmark: per-frame cost of the server socket I/O, before and after pooling.
+
+Runs an echo server on 127.0.0.1 in two flavours and drives it from a client
+thread with v2 frames (JPEG and raw GRAY8):
+
+- legacy: ``recv`` + ``bytearray.extend`` + ``bytes()`` copy, payload copied
+  again for the reply, header and payload sent with two ``sendall`` calls,
+  Nagle left on (the threaded servers up to now);
+- pooled: ``ReceiveBuffers`` + ``recv_into(MSG_WAITALL)``, views all the way
+  to the reply, one ``sendmsg`` gather write, TCP_NODELAY (frame_protocol now).
+
+Reported per frame: socket calls on the server side, peak Python/numpy
+allocation while serving the frame (tracemalloc; roughly the number of payload
+copies alive at once), and client-side round-trip time.
+
+    python bench_socket_io.py --frames 500
+"""
+from __future__ import annotations
+
+import argparse
+import socket
+import statistics
+import struct
+import threading
+import time
+import tracemalloc
+from typing import Callable, List
+
+import cv2
+import numpy as np
+
+from frame_protocol import (  # type: ignore
+    PIXEL_GRAY8,
+    PIXEL_JPEG,
+    ReceiveBuffers,
+    echo_reply,
+    recv_header,
+    recv_payload,
+    send_reply,
+)
+
+_V2_HEADER = struct.Struct("!4sBBBBHHII")
+_V2_RESPONSE = struct.Struct("!4sBB2xHHI")
+
+
+class CountingSocket:
+    """Socket proxy counting the calls the server makes (sendall may loop internally)."""
+
+    def __init__(self, sock: socket.socket) -> None:
+        self._sock = sock
+        self.calls = 0
+
+    def recv(self, *args):
+        self.calls += 1
+        return self._sock.recv(*args)
+
+    def recv_into(self, *args):
+        self.calls += 1
+        return self._sock.recv_into(*args)
+
+    def sendall(self, *args):
+        self.calls += 1
+        return self._sock.sendall(*args)
+
+    def sendmsg(self, *args):
+        self.calls += 1
+        return self._sock.sendmsg(*args)
+
+
+def legacy_recv_exact(sock, size: int) -> bytes:
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("remote closed the connection")
+        data.extend(chunk)
+    return bytes(data)
+
+
+def legacy_serve_one(sock, pool: ReceiveBuffers) -> bool:
+    try:
+        head = legacy_recv_exact(sock, 8)
+    except ConnectionError:
+        return False
+    head += legacy_recv_exact(sock, _V2_HEADER.size - 8)
+    _, pixel_format, _, _, _, width, height, length, _ = _V2_HEADER.unpack(head)
+    if pixel_format == PIXEL_GRAY8:
+        image = np.empty((height, width), dtype=np.uint8)
+        view = memoryview(image).cast("B")
+        offset = 0
+        while offset < length:
+            offset += sock.recv_into(view[offset:])
+        data = image.tobytes()
+    else:
+        data = legacy_recv_exact(sock, length)
+    sock.sendall(_V2_RESPONSE.pack(b"HRV2", pixel_format, 0, width, height, len(data)))
+    sock.sendall(data)
+    return True
+
+
+def pooled_serve_one(sock, pool: ReceiveBuffers) -> bool:
+    try:
+        header = recv_header(sock)
+    except ConnectionError:
+        return False
+    held: List[bytearray] = []
+    payload = recv_payload(sock, header, pool, held)
+    send_reply(sock, echo_reply(header, payload))
+    pool.release(held)
+    return True
+
+
+def run(name: str, serve_one: Callable, nodelay: bool, pixel_format: int, payload: bytes, frames: int, trace: bool) -> dict:
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(1)
+    port = listener.getsockname()[1]
+    stats = {"calls": [], "peak": []}
+
+    def server() -> None:
+        conn, _ = listener.accept()
+        if nodelay:
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        counting = CountingSocket(conn)
+        pool = ReceiveBuffers()
+        while True:
+            counting.calls = 0
+            if trace:
+                tracemalloc.reset_peak()
+                base = tracemalloc.get_traced_memory()[0]
+            if not serve_one(counting, pool):
+                break
+            stats["calls"].append(counting.calls)
+            if trace:
+                stats["peak"].append(tracemalloc.get_traced_memory()[1] - base)
+        conn.close()
+
+    thread = threading.Thread(target=server, daemon=True)
+    thread.start()
+    client = socket.create_connection(("127.0.0.1", port))
+    client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    request = _V2_HEADER.pack(b"HRV2", pixel_format, pixel_format, 0, 0, 640, 480, len(payload), 0) + payload
+    reply = bytearray(_V2_RESPONSE.size + len(payload))
+    rtts = []
+    for _ in range(frames):
+        t0 = time.perf_counter()
+        client.sendall(request)
+        view = memoryview(reply)
+        while len(view):
+            view = view[client.recv_into(view):]
+        rtts.append((time.perf_counter() - t0) * 1000.0)
+    client.close()
+    thread.join()
+    listener.close()
+    warm = slice(min(10, frames // 10), None)
+    return {
+        "name": name,
+        "calls": statistics.mean(stats["calls"][warm]),
+        "peak_kb": statistics.mean(stats["peak"][warm]) / 1024.0 if trace else float("nan"),
+        "rtt_ms": statistics.median(rtts[warm]),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Socket I/O microbenchmark (legacy vs pooled zero-copy)")
+    parser.add_argument("--frames", type=int, default=300)
+    args = parser.parse_args()
+
+    gradient = np.tile(np.arange(640, dtype=np.uint8), (480, 1))
+    noise = np.random.default_rng(0).integers(0, 32, gradient.shape, dtype=np.uint8)
+    ok, jpeg = cv2.imencode(".jpg", cv2.add(gradient, noise), [int(cv2.IMWRITE_JPEG_QUALITY), 80])
+    assert ok
+    payloads = {"jpeg": (PIXEL_JPEG, jpeg.tobytes()), "gray8": (PIXEL_GRAY8, gradient.tobytes())}
+
+    tracemalloc.start()
+    for label, (pixel_format, payload) in payloads.items():
+        print(f"[{label}] payload {len(payload)} bytes, {args.frames} frames")
+        for name, serve_one, nodelay in (("legacy", legacy_serve_one, False), ("pooled", pooled_serve_one, True)):
+            traced = run(name, serve_one, nodelay, pixel_format, payload, min(args.frames, 100), trace=True)
+            tracemalloc.stop()
+            timed = run(name, serve_one, nodelay, pixel_format, payload, args.frames, trace=False)
+            tracemalloc.start()
+            print(
+                f"  {name:7s} socket calls/frame={traced['calls']:5.1f} | peak alloc/frame={traced['peak_kb']:7.1f} KB "
+                f"({traced['peak_kb'] * 1024.0 / len(payload):4.1f}x payload) | rtt median={timed['rtt_ms']:6.3f} ms",
+            )
+    tracemalloc.stop()
+
+
+if __name__ == "__main__":
+    main()
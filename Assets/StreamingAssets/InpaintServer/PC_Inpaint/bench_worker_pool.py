@@ -0,0 +1,98 @@
+"""Benchmark: detection throughput of DetectionWorkerPool at 1/2/4/8 worker processes.
+
+    python bench_worker_pool.py --device cpu --lean-preprocess --workers 1 2 4 8
+
+Frames are kept in flight on every slot of every worker (what several
+connections, or --async-detect with a deep queue, do to the server). Unless
+--threads is given, each run splits the cores evenly between its workers, so
+the numbers compare "one process using all cores" with "N processes sharing
+them". Scaling efficiency is fps(N) / (N * fps(1)).
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import time
+from collections import deque
+from pathlib import Path
+from typing import Deque
+
+import cv2
+import numpy as np
+from concurrent.futures import Future
+
+from worker_pool import POLICIES, DetectionWorkerPool  # type: ignore
+
+HERE = Path(__file__).resolve().parent
+
+
+def run(pool: DetectionWorkerPool, frame: np.ndarray, frames: int, in_flight: int) -> float:
+    """Frames per second with ``in_flight`` frames submitted at any time."""
+    pending: Deque[Future] = deque()
+    start = time.perf_counter()
+    for _ in range(frames):
+        if len(pending) >= in_flight:
+            pending.popleft().result()
+        pending.append(pool.submit(frame))
+    while pending:
+        pending.popleft().result()
+    return frames / (time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="DetectionWorkerPool scaling benchmark")
+    parser.add_argument("--config", default=str(HERE / "config" / "rtmdet-ins_s.py"), help="Model config path")
+    parser.add_argument("--weights", default=str(HERE / "weights" / "rtmdet-ins_s.pth"), help="Model weights path")
+    parser.add_argument("--device", default="cpu", help="Device for inference")
+    parser.add_argument("--onnx", default="", help="Benchmark the onnxruntime backend with this graph")
+    parser.add_argument("--lean-preprocess", action="store_true", help="Use the lean preprocessing path in the workers")
+    parser.add_argument("--target-label", action="append", help="Label(s) to detect; repeat for multiple")
+    parser.add_argument("--width", type=int, default=640, help="Frame width")
+    parser.add_argument("--height", type=int, default=480, help="Frame height")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8], help="Worker counts to run")
+    parser.add_argument("--threads", type=int, default=0, help="Intra-op threads per worker (0 = cores / workers)")
+    parser.add_argument("--slots", type=int, default=2, help="Frames in flight per worker")
+    parser.add_argument("--policy", choices=POLICIES, default="least-loaded", help="Dispatch policy")
+    parser.add_argument("--frames", type=int, default=200)
+    args = parser.parse_args()
+
+    gradient = np.tile(np.linspace(0, 255, args.width, dtype=np.uint8), (args.height, 1))
+    noise = np.random.default_rng(0).integers(0, 32, (args.height, args.width, 3), dtype=np.uint8)
+    frame = cv2.add(cv2.cvtColor(gradient, cv2.COLOR_GRAY2BGR), noise)
+    if not (args.lean_preprocess or args.onnx):
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)  # what prepare_input hands the pipeline path
+
+    cores = os.cpu_count() or 1
+    print(f"[{args.width}x{args.height}] {args.frames} frames, {cores} cores, policy {args.policy}")
+    baseline = 0.0
+    for workers in args.workers:
+        threads = args.threads or max(1, cores // workers)
+        kwargs = dict(
+            config_path=args.config,
+            weights_path=args.weights,
+            device=args.device,
+            target_labels=args.target_label or ("person",),
+            lean_preprocess=args.lean_preprocess,
+            onnx_path=args.onnx or None,
+            num_threads=threads,
+        )
+        t0 = time.perf_counter()
+        pool = DetectionWorkerPool(kwargs, workers=workers, slots=args.slots, policy=args.policy)
+        startup = time.perf_counter() - t0
+        try:
+            in_flight = workers * args.slots
+            run(pool, frame, in_flight * 2, in_flight)  # first-call latency of every worker
+            fps = run(pool, frame, args.frames, in_flight)
+        finally:
+            pool.close()
+        if workers == 1 or not baseline:
+            baseline = fps / workers
+        efficiency = fps / (workers * baseline)
+        print(
+            f"  workers={workers} threads/worker={threads} | {fps:6.1f} fps | "
+            f"efficiency {efficiency:5.1%} | startup {startup:5.1f} s",
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Self-check for mask_codec: round trips and malformed client payloads.
+
+Round trips random hand-like masks through the bit-packed and RLE codecs (and,
+when pycocotools is installed, checks the RLE string byte for byte against
+``pycocotools.mask.encode``). Then feeds truncated, corrupted and inconsistent
+payloads to ``frame_protocol.decode_mask``, which must return None for every
+one of them rather than raise.
+
+    python check_mask_codec.py --masks 200
+"""
+from __future__ import annotations
+
+import argparse
+from typing import List, Tuple
+
+import cv2
+import numpy as np
+
+from frame_protocol import MASK_BITPACKED, MASK_RLE, FrameHeader, decode_mask  # type: ignore
+from mask_codec import decode_rle, encode_rle, pack_bits, unpack_bits  # type: ignore
+
+
+def make_mask(rng: np.random.Generator, width: int, height: int) -> np.ndarray:
+    mask = np.zeros((height, width), dtype=np.uint8)
+    for _ in range(int(rng.integers(0, 4))):
+        center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        axes = (int(rng.integers(1, max(2, width // 3))), int(rng.integers(1, max(2, height // 3))))
+        cv2.ellipse(mask, center, axes, float(rng.uniform(0, 180)), 0, 360, 255, -1)
+    return mask
+
+
+def round_trips(rng: np.random.Generator, count: int) -> int:
+    try:
+        from pycocotools import mask as mask_utils
+    except ImportError:
+        mask_utils = None
+    failures = 0
+    for _ in range(count):
+        h, w = int(rng.integers(1, 300)), int(rng.integers(1, 300))
+        mask = make_mask(rng, w, h)
+        rle = encode_rle(mask)
+        ok = np.array_equal(decode_rle(rle, h, w), mask)
+        ok &= np.array_equal(unpack_bits(pack_bits(mask), h, w), mask)
+        if mask_utils is not None:
+            ok &= rle == mask_utils.encode(np.asfortranarray(mask > 0, dtype=np.uint8))["counts"]
+        failures += int(not ok)
+    print(f"[check] round trip: {count - failures}/{count} masks ok" + ("" if mask_utils else " (pycocotools not installed)"))
+    return failures
+
+
+def malformed(rng: np.random.Generator) -> int:
+    h, w = 48, 64
+    mask = make_mask(rng, w, h)
+    rle = encode_rle(mask)
+    packed = pack_bits(mask)
+    cases: List[Tuple[str, int, bytes]] = [
+        ("rle truncated mid-value", MASK_RLE, rle[:-1] + bytes([rle[-1] | 0x20])),
+        ("rle continuation only", MASK_RLE, b"o"),
+        ("rle invalid byte", MASK_RLE, b"0\x00" + rle),
+        ("rle byte above range", MASK_RLE, rle + b"\xff"),
+        ("rle short total", MASK_RLE, rle[: len(rle) // 2]),
+        ("rle negative run", MASK_RLE, b"0?"),
+        ("rle huge run", MASK_RLE, b"n" * 40 + b"0"),
+        ("packed truncated", MASK_BITPACKED, packed[:-1]),
+        ("packed too long", MASK_BITPACKED, packed + b"\x00"),
+    ]
+    for _ in range(50):
+        cut = rle[: int(rng.integers(1, len(rle)))] if len(rle) > 1 else rle
+        cases.append(("rle random cut", MASK_RLE, cut))
+    failures = 0
+    for name, mask_format, data in cases:
+        header = FrameHeader(version=2, payload_length=0, mask_length=len(data), mask_format=mask_format)
+        try:
+            result = decode_mask(header, data, (h, w))
+        except Exception as exc:
+            print(f"[check] {name}: raised {exc!r}")
+            failures += 1
+            continue
+        if result is not None and not np.array_equal(result, mask):
+            # A cut can still land on a valid string; it must then decode to some mask of the right shape.
+            failures += int(result.shape != (h, w))
+    print(f"[check] malformed payloads: {len(cases) - failures}/{len(cases)} handled without raising")
+    return failures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="mask_codec round-trip and malformed-input check")
+    parser.add_argument("--masks", type=int, default=200, help="Random masks to round-trip")
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+    failures = round_trips(rng, args.masks) + malformed(rng)
+    raise SystemExit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Cross-connection micro-batching for RTMDet detection.
+
+Each eye of the stereo rig opens its own connection, and without batching the
+two frames of a stereo pair cost two forward passes back to back. The
+DetectionBatcher owns the model: connection threads call ``detect(image)``,
+which blocks until the frame has been run through the detector together with
+whatever other frames arrived within ``window_ms``. The masks are scattered
+back to the callers, which then do their own (per-connection) post-processing.
+
+A batch is closed early once it holds one frame per attached stream, so a
+single client never waits for the window. Request/response clients can fall
+out of phase (each eye's frame arrives while the other eye's batch is running);
+after a short batch the next one therefore waits up to one inference time for
+the missing stream, which pulls the eyes back into lockstep.
+"""
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+DetectBatchFn = Callable[[Sequence[np.ndarray]], List[np.ndarray]]
+
+
+class DetectionBatcher:
+    """Run ``detect_batch`` over frames submitted from several threads."""
+
+    def __init__(
+        self,
+        detect_batch: DetectBatchFn,
+        *,
+        max_batch: int = 2,
+        window_ms: float = 4.0,
+    ) -> None:
+        self._detect_batch = detect_batch
+        self.max_batch = max(1, int(max_batch))
+        self.window = max(0.0, float(window_ms)) / 1000.0
+        self._requests: "queue.Queue[Optional[Tuple[np.ndarray, Future]]]" = queue.Queue()
+        self._streams = 0
+        self._streams_lock = threading.Lock()
+        self._catch_up = 0.0
+        self.batches = 0
+        self.frames = 0
+        self._thread = threading.Thread(target=self._loop, name="detection-batcher", daemon=True)
+        self._thread.start()
+
+    def attach(self) -> None:
+        """Register a stream (connection) that will submit frames."""
+        with self._streams_lock:
+            self._streams += 1
+
+    def detach(self) -> None:
+        with self._streams_lock:
+            self._streams = max(0, self._streams - 1)
+
+    def detect(self, image: np.ndarray) -> np.ndarray:
+        """Blocking: return the combined mask for ``image`` once its batch has run."""
+        return self.submit(image).result()
+
+    def submit(self, image: np.ndarray) -> Future:
+        """Non-blocking ``detect``: the future resolves to the mask once its batch has run."""
+        future: Future = Future()
+        self._requests.put((image, future))
+        return future
+
+    def close(self) -> None:
+        self._requests.put(None)
+        self._thread.join()
+
+    @property
+    def mean_batch_size(self) -> float:
+        return self.frames / self.batches if self.batches else 0.0
+
+    def _batch_target(self) -> int:
+        with self._streams_lock:
+            streams = self._streams
+        return max(1, min(self.max_batch, streams))
+
+    def _loop(self) -> None:
+        while True:
+            first = self._requests.get()
+            if first is None:
+                return
+            batch = [first]
+            target = self._batch_target()
+            deadline = time.perf_counter() + max(self.window, self._catch_up)
+            while len(batch) < target:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._requests.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._requests.put(None)
+                    break
+                batch.append(item)
+            t0 = time.perf_counter()
+            self._run(batch)
+            self._catch_up = time.perf_counter() - t0 if len(batch) < target else 0.0
+
+    def _run(self, batch: List[Tuple[np.ndarray, Future]]) -> None:
+        images = [image for image, _ in batch]
+        try:
+            masks = self._detect_batch(images)
+        except Exception as exc:
+            for _, future in batch:
+                future.set_exception(exc)
+            return
+        self.batches += 1
+        self.frames += len(batch)
+        for (_, future), mask in zip(batch, masks):
+            future.set_result(mask)
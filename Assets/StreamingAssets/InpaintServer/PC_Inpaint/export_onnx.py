@@ -0,0 +1,151 @@
+"""Export an RTMDet-Ins checkpoint to ONNX for the onnxruntime backend (onnx_backend.py).
+
+    python export_onnx.py \\
+        --config config/rtmdet-ins_s_mhpv1_arm_only_v2_maskboost_800.py \\
+        --weights weights/rtmdet-ins_s_mhpv1_arm_only_v2_maskboost_800.pth \\
+        --frame-size 640 480
+
+The input shape is fixed: what the config's test pipeline (keep-ratio Resize,
+then Pad) makes of a --frame-size frame, e.g. 800x608 for 640x480 at the
+800 scale. Frames of another aspect ratio are letterboxed into it at runtime.
+Normalisation (and the channel flip, if the config asks for one) is folded
+into the graph, which takes uint8 BGR NCHW. Head geometry and test_cfg are
+stored as JSON in the ``rtmdet_ins`` metadata property.
+
+The exported outputs are compared against PyTorch on a random input before
+the tool exits.
+"""
+from __future__ import annotations
+
+import argparse
+import inspect
+import json
+from pathlib import Path
+from typing import Tuple
+
+import numpy as np
+import onnx
+import onnxruntime as ort
+import torch
+from mmdet.apis import init_detector
+
+from onnx_backend import METADATA_KEY, OUTPUT_NAMES  # type: ignore
+
+HERE = Path(__file__).resolve().parent
+
+
+class RTMDetInsExport(torch.nn.Module):
+    """Normalise, run backbone + neck + head, flatten the per-level outputs."""
+
+    def __init__(self, model: torch.nn.Module) -> None:
+        super().__init__()
+        self.model = model
+        preprocessor = model.data_preprocessor
+        self.register_buffer("mean", preprocessor.mean.reshape(1, -1, 1, 1).float())
+        self.register_buffer("std", preprocessor.std.reshape(1, -1, 1, 1).float())
+        self.bgr_to_rgb = bool(getattr(preprocessor, "_channel_conversion", False))
+
+    def forward(self, image: torch.Tensor) -> Tuple[torch.Tensor, ...]:
+        x = image.float()
+        if self.bgr_to_rgb:
+            x = x[:, [2, 1, 0]]
+        x = (x - self.mean) / self.std
+        cls_scores, bbox_preds, kernels, mask_feat = self.model.bbox_head(self.model.extract_feat(x))
+        return _flatten(cls_scores), _flatten(bbox_preds), _flatten(kernels), mask_feat
+
+
+def _flatten(levels) -> torch.Tensor:
+    """(1, C, H, W) per level -> (1, sum(H*W), C), row-major per level like the head's priors."""
+    return torch.cat([level.permute(0, 2, 3, 1).reshape(level.shape[0], -1, level.shape[1]) for level in levels], dim=1)
+
+
+def input_size(cfg, frame_width: int, frame_height: int) -> Tuple[Tuple[int, int], dict]:
+    """(width, height) the test pipeline produces for a frame of this size, and its Pad step."""
+    steps = {step["type"]: step for step in cfg.test_dataloader.dataset.pipeline}
+    resize = steps["Resize"]
+    if not resize.get("keep_ratio", False):
+        raise ValueError("export needs a keep_ratio Resize in the test pipeline")
+    long_edge, short_edge = max(resize["scale"]), min(resize["scale"])
+    scale = min(long_edge / max(frame_width, frame_height), short_edge / min(frame_width, frame_height))
+    width, height = int(frame_width * scale + 0.5), int(frame_height * scale + 0.5)
+    pad = steps.get("Pad") or {}
+    if pad.get("size"):
+        width, height = pad["size"]
+    else:
+        divisor = int(pad.get("size_divisor") or 1)
+        width, height = -(-width // divisor) * divisor, -(-height // divisor) * divisor
+    # The prototypes and the coarsest level must tile the input exactly.
+    width, height = -(-width // 32) * 32, -(-height // 32) * 32
+    return (width, height), pad
+
+
+def metadata(model: torch.nn.Module, size: Tuple[int, int], pad: dict) -> dict:
+    head = model.bbox_head
+    test_cfg = head.test_cfg
+    pad_val = pad.get("pad_val", 0)
+    return {
+        "input_size": list(size),
+        "classes": list((model.dataset_meta or {}).get("classes", ())),
+        "strides": [int(stride[0]) for stride in head.prior_generator.strides],
+        "prior_offset": float(head.prior_generator.offset),
+        "pad_value": pad_val.get("img", 0) if isinstance(pad_val, dict) else pad_val,
+        "num_prototypes": int(head.num_prototypes),
+        "dyconv_channels": int(head.dyconv_channels),
+        "num_dyconvs": int(head.num_dyconvs),
+        "test_cfg": {
+            "score_thr": float(test_cfg.get("score_thr", 0.0)),
+            "nms_pre": int(test_cfg.get("nms_pre", -1)),
+            "iou_threshold": float(test_cfg["nms"]["iou_threshold"]),
+            "min_bbox_size": float(test_cfg.get("min_bbox_size", -1)),
+            "max_per_img": int(test_cfg.get("max_per_img", 100)),
+            "mask_thr_binary": float(test_cfg.get("mask_thr_binary", 0.5)),
+        },
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Export RTMDet-Ins to ONNX for the onnxruntime backend")
+    parser.add_argument("--config", default=str(HERE / "config" / "rtmdet-ins_s.py"), help="Model config path")
+    parser.add_argument("--weights", default=str(HERE / "weights" / "rtmdet-ins_s.pth"), help="Model weights path")
+    parser.add_argument("--output", help="Output .onnx path (default: next to the weights)")
+    parser.add_argument("--frame-size", type=int, nargs=2, default=(640, 480), metavar=("W", "H"), help="Client frame size the input shape is derived from")
+    parser.add_argument("--opset", type=int, default=17, help="ONNX opset version")
+    args = parser.parse_args()
+
+    model = init_detector(args.config, args.weights, device="cpu")
+    model.eval()
+    size, pad = input_size(model.cfg, *args.frame_size)
+    output = Path(args.output) if args.output else Path(args.weights).with_name(
+        f"{Path(args.weights).stem}_{size[0]}x{size[1]}.onnx",
+    )
+
+    wrapper = RTMDetInsExport(model).eval()
+    dummy = torch.randint(0, 256, (1, 3, size[1], size[0]), dtype=torch.uint8)
+    # TorchScript exporter: newer torch defaults to the dynamo one, older torch has no switch.
+    exporter = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+    with torch.no_grad():
+        expected = wrapper(dummy)
+        torch.onnx.export(
+            wrapper,
+            (dummy,),
+            str(output),
+            input_names=["image"],
+            output_names=list(OUTPUT_NAMES),
+            opset_version=args.opset,
+            **exporter,
+        )
+
+    graph = onnx.load(str(output))
+    onnx.helper.set_model_props(graph, {METADATA_KEY: json.dumps(metadata(model, size, pad))})
+    onnx.save(graph, str(output))
+    print(f"[export] {output} ({size[0]}x{size[1]})")
+
+    session = ort.InferenceSession(str(output), providers=["CPUExecutionProvider"])
+    actual = session.run(list(OUTPUT_NAMES), {"image": dummy.numpy()})
+    for name, ref, got in zip(OUTPUT_NAMES, expected, actual):
+        diff = float(np.abs(ref.numpy() - got).max())
+        print(f"[check] {name:10s} {tuple(got.shape)} max |onnx - torch| = {diff:.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""Staged receive / process / send pipeline for a single TCP connection.
+
+The sequential servers alternate between waiting on the socket and waiting on
+the model. FramePipeline splits one connection into three threads connected by
+bounded queues, so frame N+1 is received and decoded while frame N is being
+inpainted and frame N-1 is being encoded and sent:
+
+    receiver --(work queue)--> worker --(send queue)--> sender
+
+Responses leave in the same order the requests arrived, so the existing wire
+protocol (responses matched to requests by ordering) keeps working unchanged.
+The server supplies the three stage callables; this module only owns the
+threads, the queues and shutdown.
+
+With ``drop_stale`` the pipeline switches to latest-frame-wins: the receiver
+never blocks on the model, and whenever a newer request arrives while an
+older one is still waiting for the worker, the older one is marked stale. Stale
+requests skip ``process`` and go through ``on_stale`` instead, which should be
+cheap (e.g. repeat the previous result), so they are answered as soon as the
+frames ahead of them are sent and only the newest frame reaches the model.
+"""
+from __future__ import annotations
+
+import queue
+import threading
+from typing import Any, Callable, Optional
+
+_STOP = object()
+_POLL_SECONDS = 0.1
+
+
+class _Slot:
+    """Work-queue entry; ``claimed``/``stale`` are guarded by the pipeline lock."""
+
+    __slots__ = ("job", "claimed", "stale")
+
+    def __init__(self, job: Any) -> None:
+        self.job = job
+        self.claimed = False
+        self.stale = False
+
+
+class FramePipeline:
+    """Run receive -> process -> send for one connection on three threads.
+
+    ``receive()`` returns the next job or ``None`` once the peer is gone,
+    ``process(job)`` returns the job to send and ``send(job)`` writes it.
+    ``on_abort()`` is called when a stage fails so a blocked ``receive`` can be
+    woken up (typically by shutting the socket down). ``on_stale(job)`` builds
+    the reply for a frame skipped by the drop policy.
+
+    ``processed``, ``dropped`` and ``coalesced`` count frames that reached
+    ``process``, frames answered through ``on_stale``, and processed frames
+    that superseded at least one stale frame.
+    """
+
+    def __init__(
+        self,
+        *,
+        receive: Callable[[], Optional[Any]],
+        process: Callable[[Any], Any],
+        send: Callable[[Any], None],
+        on_abort: Optional[Callable[[], None]] = None,
+        on_stale: Optional[Callable[[Any], Any]] = None,
+        queue_size: int = 2,
+        drop_stale: bool = False,
+        name: str = "pipeline",
+    ) -> None:
+        if drop_stale and on_stale is None:
+            raise ValueError("drop_stale requires an on_stale callback")
+        self._receive = receive
+        self._process = process
+        self._send = send
+        self._on_abort = on_abort
+        self._on_stale = on_stale
+        self._drop_stale = bool(drop_stale)
+        self._name = name
+        depth = max(1, int(queue_size))
+        # In drop mode the receiver must keep draining the socket, so the work
+        # queue is unbounded; it only ever holds one live frame plus stale ones.
+        self._work_queue: "queue.Queue[Any]" = queue.Queue(maxsize=0 if self._drop_stale else depth)
+        self._send_queue: "queue.Queue[Any]" = queue.Queue(maxsize=depth)
+        self._stop = threading.Event()
+        self._fail_lock = threading.Lock()
+        self._slot_lock = threading.Lock()
+        self._pending: Optional[_Slot] = None
+        self._stale_since_claim = 0
+        self.processed = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.error: Optional[BaseException] = None
+
+    def run(self) -> None:
+        """Receive on the calling thread until the connection ends."""
+        worker = threading.Thread(target=self._worker_loop, name=f"{self._name}-worker", daemon=True)
+        sender = threading.Thread(target=self._sender_loop, name=f"{self._name}-sender", daemon=True)
+        worker.start()
+        sender.start()
+        try:
+            while not self._stop.is_set():
+                job = self._receive()
+                if job is None:
+                    break
+                if not self._put(self._work_queue, self._enqueue(job)):
+                    break
+        except Exception as exc:
+            self._fail(exc)
+        finally:
+            # Let queued frames drain to the client before the threads exit.
+            self._put(self._work_queue, _STOP, force=True)
+            worker.join()
+            sender.join()
+        if self.error is not None:
+            raise self.error
+
+    def _enqueue(self, job: Any) -> _Slot:
+        slot = _Slot(job)
+        if self._drop_stale:
+            with self._slot_lock:
+                pending = self._pending
+                if pending is not None and not pending.claimed and not pending.stale:
+                    pending.stale = True
+                    self.dropped += 1
+                    self._stale_since_claim += 1
+                self._pending = slot
+        return slot
+
+    def _claim(self, slot: _Slot) -> bool:
+        """Return True if the worker should process ``slot``, False if it is stale."""
+        if not self._drop_stale:
+            return True
+        with self._slot_lock:
+            if slot.stale:
+                return False
+            slot.claimed = True
+            if self._stale_since_claim:
+                self.coalesced += 1
+                self._stale_since_claim = 0
+            return True
+
+    def _worker_loop(self) -> None:
+        while True:
+            slot = self._work_queue.get()
+            if slot is _STOP:
+                self._put(self._send_queue, _STOP, force=True)
+                return
+            if self._stop.is_set():
+                continue
+            try:
+                if self._claim(slot):
+                    result = self._process(slot.job)
+                    self.processed += 1
+                else:
+                    result = self._on_stale(slot.job)  # type: ignore[misc]
+            except Exception as exc:
+                self._fail(exc)
+                continue
+            self._put(self._send_queue, result)
+
+    def _sender_loop(self) -> None:
+        while True:
+            job = self._send_queue.get()
+            if job is _STOP:
+                return
+            if self._stop.is_set():
+                continue
+            try:
+                self._send(job)
+            except Exception as exc:
+                self._fail(exc)
+
+    def _put(self, q: "queue.Queue[Any]", item: Any, force: bool = False) -> bool:
+        """Blocking put that gives up once the pipeline is stopping.
+
+        ``force`` is used for the stop marker, which must always get through;
+        the consumers keep draining after a failure so there is room for it.
+        """
+        while True:
+            if self._stop.is_set() and not force:
+                return False
+            try:
+                q.put(item, timeout=_POLL_SECONDS)
+                return True
+            except queue.Full:
+                continue
+
+    def _fail(self, exc: BaseException) -> None:
+        with self._fail_lock:
+            if self._stop.is_set():
+                return
+            self.error = exc
+            self._stop.set()
+        if self._on_abort is not None:
+            try:
+                self._on_abort()
+            except OSError:
+                pass
@@ -0,0 +1,485 @@
+"""Wire format shared by the RTMDet TCP servers.
+
+v1 (what Unity has always sent)::
+
+    request:  [img_len:u32][mask_fmt:u8 | mask_len:u24][JPEG][mask]
+    response: [img_len:u32][JPEG]
+
+The top byte of the v1 mask length selects the mask encoding; it is 0 (raw
+H*W bytes) for every client written before encodings existed, because a raw
+mask never reaches 16 MB.
+
+v2 carries the pixel format and frame size so that a client on the same PC
+can skip JPEG entirely and send the 8-bit IR buffer as is::
+
+    request:  [b"HRV2"][pixel_format:u8][reply_format:u8][mask_format:u8][flags:u8]
+              [width:u16][height:u16][payload_len:u32][mask_len:u32][payload][mask]
+    response: [b"HRV2"][pixel_format:u8][flags:u8][2 pad][width:u16][height:u16]
+              [payload_len:u32][payload]
+
+Masks are raw (0/255 bytes), bit-packed or COCO RLE, see mask_codec.py.
+All integers are big-endian. A v1 image length can never equal the magic
+(it would be a >1 GB JPEG), so both versions are served on the same port.
+Raw payloads are row-major, top row first (the orientation the JPEG had).
+
+Socket I/O avoids copies: the threaded servers receive with ``recv_into``
+(``MSG_WAITALL``) into per-connection pooled buffers (``ReceiveBuffers``) and
+pass views on to ``np.frombuffer``/``cv2.imdecode``; replies are lists of
+bytes-like chunks written with one ``sendmsg`` gather call where available.
+Servers set TCP_NODELAY on every connection.
+
+Shared-memory transport (v2 flags, see shm_ring.py): ``FLAG_SHM_ATTACH``
+requests carry the path of the client's ring file as payload and get no reply.
+``FLAG_SHM`` requests and replies are followed by a ``slot:u32`` instead of
+payload and mask, which live in that slot of the ring.
+
+ROI replies (v2): a request with ``FLAG_ROI`` asks for the inpainted rectangle
+only. The reply then has ``FLAG_ROI`` and ``[x:u16][y:u16][w:u16][h:u16]``
+(after the slot index, if any) and the payload covers just that rectangle;
+width/height in the header stay the full frame size. ``FLAG_UNCHANGED`` with
+an empty payload means nothing was inpainted and the client keeps its frame.
+
+Timing (v2): a request with ``FLAG_TIMING`` carries ``[frame_id:u32]
+[capture_us:u64]`` after the header (and slot). The reply echoes both, followed
+by the server's per-stage times in microseconds, ``[recv][decode][infer][post]
+[inpaint][encode]`` (u32 each), after the slot index and ROI if present.
+``capture_us`` is opaque to the server: clients use their own clock and get
+capture-to-reply latency as now - capture_us.
+"""
+from __future__ import annotations
+
+import asyncio
+import socket
+import struct
+import threading
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Tuple, Union
+
+import cv2
+import numpy as np
+
+from mask_codec import decode_rle, unpack_bits  # type: ignore
+
+MAGIC_V2 = b"HRV2"
+
+PIXEL_JPEG = 0
+PIXEL_GRAY8 = 1
+PIXEL_BGR24 = 2
+
+PIXEL_FORMAT_NAMES = {PIXEL_JPEG: "jpeg", PIXEL_GRAY8: "gray8", PIXEL_BGR24: "bgr24"}
+_CHANNELS = {PIXEL_GRAY8: 1, PIXEL_BGR24: 3}
+
+MASK_RAW = 0
+MASK_BITPACKED = 1
+MASK_RLE = 2
+
+MASK_FORMAT_NAMES = {MASK_RAW: "raw", MASK_BITPACKED: "bitpacked", MASK_RLE: "rle"}
+
+FLAG_SHM = 0x01
+FLAG_SHM_ATTACH = 0x02
+FLAG_ROI = 0x04
+FLAG_UNCHANGED = 0x08
+FLAG_TIMING = 0x10
+
+_V1_HEADER = struct.Struct("!II")
+_V2_HEADER = struct.Struct("!4sBBBBHHII")
+_V2_RESPONSE = struct.Struct("!4sBB2xHHI")
+_SLOT = struct.Struct("!I")
+_ROI = struct.Struct("!HHHH")
+_FRAME_INFO = struct.Struct("!IQ")
+_TIMING_REPLY = struct.Struct("!IQ6I")
+
+# Without sendmsg, chunks up to this size are joined into one sendall
+_COALESCE_BYTES = 64 * 1024
+
+# (x, y, width, height) of the changed rectangle
+Roi = Tuple[int, int, int, int]
+
+Payload = Union[bytes, memoryview, np.ndarray]
+
+
+class ProtocolError(ValueError):
+    """The peer sent a header this server cannot honour."""
+
+
+@dataclass
+class FrameHeader:
+    version: int
+    payload_length: int
+    mask_length: int
+    pixel_format: int = PIXEL_JPEG
+    reply_format: int = PIXEL_JPEG
+    mask_format: int = MASK_RAW
+    flags: int = 0
+    width: int = 0
+    height: int = 0
+    slot: int = -1
+    frame_id: int = 0
+    capture_us: int = 0
+
+    @property
+    def in_shm(self) -> bool:
+        return bool(self.flags & FLAG_SHM)
+
+    @property
+    def attaches_shm(self) -> bool:
+        return bool(self.flags & FLAG_SHM_ATTACH)
+
+    @property
+    def wants_roi(self) -> bool:
+        return bool(self.flags & FLAG_ROI)
+
+    @property
+    def wants_timings(self) -> bool:
+        return bool(self.flags & FLAG_TIMING)
+
+    @property
+    def is_raw(self) -> bool:
+        return self.pixel_format in _CHANNELS
+
+    def raw_shape(self) -> tuple:
+        channels = _CHANNELS[self.pixel_format]
+        return (self.height, self.width) if channels == 1 else (self.height, self.width, channels)
+
+
+@dataclass
+class StageTimings:
+    """Server-side milliseconds per stage of one frame (0 when a stage did not run)."""
+
+    recv: float = 0.0
+    decode: float = 0.0
+    infer: float = 0.0
+    post: float = 0.0
+    inpaint: float = 0.0
+    encode: float = 0.0
+
+    def update(self, stage_ms: dict) -> None:
+        for name, ms in stage_ms.items():
+            setattr(self, name, ms)
+
+    def micros(self) -> Tuple[int, ...]:
+        stages = (self.recv, self.decode, self.infer, self.post, self.inpaint, self.encode)
+        return tuple(min(max(int(ms * 1000.0), 0), 0xFFFFFFFF) for ms in stages)
+
+    def summary(self) -> str:
+        return (
+            f"recv={self.recv:5.1f} dec={self.decode:5.1f} det={self.infer:6.1f} "
+            f"post={self.post:5.1f} inp={self.inpaint:5.1f} enc={self.encode:5.1f}"
+        )
+
+
+def _parse_v1(data: bytes) -> FrameHeader:
+    img_length, mask_field = _V1_HEADER.unpack(data)
+    mask_format = mask_field >> 24
+    if mask_format not in MASK_FORMAT_NAMES:
+        raise ProtocolError(f"unknown mask format {mask_format}")
+    return FrameHeader(
+        version=1,
+        payload_length=img_length,
+        mask_length=mask_field & 0xFFFFFF,
+        mask_format=mask_format,
+    )
+
+
+def _parse_v2(data: bytes, shm: bool) -> FrameHeader:
+    _, pixel_format, reply_format, mask_format, flags, width, height, length, mask_length = _V2_HEADER.unpack(data)
+    header = FrameHeader(
+        version=2,
+        payload_length=length,
+        mask_length=mask_length,
+        pixel_format=pixel_format,
+        reply_format=reply_format,
+        mask_format=mask_format,
+        flags=flags,
+        width=width,
+        height=height,
+    )
+    _validate(header, shm)
+    return header
+
+
+def _validate(header: FrameHeader, shm: bool) -> None:
+    if header.flags & (FLAG_SHM | FLAG_SHM_ATTACH) and not shm:
+        raise ProtocolError("shared-memory transport is not supported by this server")
+    if header.attaches_shm:
+        return
+    for fmt in (header.pixel_format, header.reply_format):
+        if fmt not in PIXEL_FORMAT_NAMES:
+            raise ProtocolError(f"unknown pixel format {fmt}")
+    if header.mask_format not in MASK_FORMAT_NAMES:
+        raise ProtocolError(f"unknown mask format {header.mask_format}")
+    if header.is_raw:
+        expected = int(np.prod(header.raw_shape()))
+        if header.width <= 0 or header.height <= 0 or header.payload_length != expected:
+            raise ProtocolError(
+                f"{PIXEL_FORMAT_NAMES[header.pixel_format]} payload of {header.payload_length} bytes "
+                f"does not match {header.width}x{header.height}",
+            )
+
+
+# Lets one recv_into fill a whole payload instead of returning per TCP segment.
+_RECV_FLAGS = getattr(socket, "MSG_WAITALL", 0)
+
+
+def recv_exact(sock: socket.socket, size: int) -> bytearray:
+    data = bytearray(size)
+    recv_into_exact(sock, memoryview(data))
+    return data
+
+
+def recv_into_exact(sock: socket.socket, buffer: memoryview) -> None:
+    view = buffer.cast("B")
+    offset = 0
+    while offset < len(view):
+        received = sock.recv_into(view[offset:], 0, _RECV_FLAGS)
+        if not received:
+            raise ConnectionError("remote closed the connection")
+        offset += received
+
+
+class ReceiveBuffers:
+    """Per-connection pool of receive buffers (threaded servers).
+
+    ``recv`` reads into a pooled bytearray and returns a view of it, recording
+    the buffer in ``held``; the caller hands ``held`` back to ``release`` once
+    the frame's reply has been sent. Buffers that are never released are just
+    garbage collected, so an aborted connection cannot corrupt the pool.
+    """
+
+    _GRANULE = 64 * 1024
+
+    def __init__(self, keep: int = 8) -> None:
+        self._free: List[bytearray] = []
+        self._keep = keep
+        self._lock = threading.Lock()
+        self.allocated = 0
+
+    def take(self, size: int) -> bytearray:
+        with self._lock:
+            for i, buf in enumerate(self._free):
+                if len(buf) >= size:
+                    return self._free.pop(i)
+            self.allocated += 1
+        # Rounded up so JPEG sizes drifting from frame to frame still fit.
+        return bytearray(-(-size // self._GRANULE) * self._GRANULE)
+
+    def release(self, buffers: Iterable[bytearray]) -> None:
+        with self._lock:
+            for buf in buffers:
+                if len(self._free) < self._keep:
+                    self._free.append(buf)
+
+    def recv(self, sock: socket.socket, size: int, held: List[bytearray]) -> memoryview:
+        buf = self.take(size)
+        held.append(buf)
+        view = memoryview(buf)[:size]
+        recv_into_exact(sock, view)
+        return view
+
+
+def recv_header(sock: socket.socket, *, shm: bool = False) -> FrameHeader:
+    """Read a v1 or v2 request header; ``shm`` enables the shared-memory flags."""
+    head = recv_exact(sock, _V1_HEADER.size)
+    if head[:4] != MAGIC_V2:
+        return _parse_v1(head)
+    header = _parse_v2(head + recv_exact(sock, _V2_HEADER.size - len(head)), shm)
+    if header.in_shm:
+        (header.slot,) = _SLOT.unpack(recv_exact(sock, _SLOT.size))
+    if header.wants_timings:
+        header.frame_id, header.capture_us = _FRAME_INFO.unpack(recv_exact(sock, _FRAME_INFO.size))
+    return header
+
+
+async def read_header(reader: asyncio.StreamReader, *, shm: bool = False) -> FrameHeader:
+    head = await reader.readexactly(_V1_HEADER.size)
+    if head[:4] != MAGIC_V2:
+        return _parse_v1(head)
+    header = _parse_v2(head + await reader.readexactly(_V2_HEADER.size - len(head)), shm)
+    if header.in_shm:
+        (header.slot,) = _SLOT.unpack(await reader.readexactly(_SLOT.size))
+    if header.wants_timings:
+        header.frame_id, header.capture_us = _FRAME_INFO.unpack(await reader.readexactly(_FRAME_INFO.size))
+    return header
+
+
+def recv_payload(
+    sock: socket.socket,
+    header: FrameHeader,
+    pool: Optional[ReceiveBuffers] = None,
+    held: Optional[List[bytearray]] = None,
+) -> Payload:
+    """Raw frames come back as an HxW(x3) array, JPEG as a byte view for imdecode.
+
+    With ``pool`` the payload is a view of a pooled buffer, appended to ``held``.
+    """
+    if pool is None:
+        if not header.is_raw:
+            return recv_exact(sock, header.payload_length)
+        image = np.empty(header.raw_shape(), dtype=np.uint8)
+        recv_into_exact(sock, memoryview(image))
+        return image
+    view = pool.recv(sock, header.payload_length, held if held is not None else [])
+    if not header.is_raw:
+        return view
+    return np.frombuffer(view, dtype=np.uint8).reshape(header.raw_shape())
+
+
+async def read_payload(reader: asyncio.StreamReader, header: FrameHeader) -> Payload:
+    data = await reader.readexactly(header.payload_length)
+    if not header.is_raw:
+        return data
+    return np.frombuffer(data, dtype=np.uint8).reshape(header.raw_shape())
+
+
+def payload_size(payload: Payload) -> int:
+    return payload.nbytes if isinstance(payload, (np.ndarray, memoryview)) else len(payload)
+
+
+def decode_payload(header: FrameHeader, payload: Payload) -> Optional[np.ndarray]:
+    """Return the frame as HxWx3 BGR, which is what the inpainters expect."""
+    if header.pixel_format == PIXEL_GRAY8:
+        return cv2.cvtColor(payload, cv2.COLOR_GRAY2BGR)
+    if header.pixel_format == PIXEL_BGR24:
+        return payload  # type: ignore[return-value]
+    if payload_size(payload) == 0:
+        return None
+    arr = np.frombuffer(payload, dtype=np.uint8)
+    return cv2.imdecode(arr, cv2.IMREAD_COLOR)
+
+
+def decode_mask(header: FrameHeader, data: bytes, shape: tuple) -> Optional[np.ndarray]:
+    """Prior mask as HxW uint8 (0/255) for a frame of ``shape``; None if absent or malformed."""
+    if not data:
+        return None
+    h, w = shape[:2]
+    if header.mask_format == MASK_BITPACKED:
+        return unpack_bits(data, h, w)
+    if header.mask_format == MASK_RLE:
+        return decode_rle(data, h, w)
+    if len(data) != h * w:
+        return None
+    return np.frombuffer(data, dtype=np.uint8).reshape(h, w)
+
+
+def encode_pixels(pixel_format: int, image_bgr: np.ndarray, jpeg_quality: int) -> Optional[memoryview]:
+    """Reply pixels as a flat byte view over the converted/encoded array (no extra copy)."""
+    if pixel_format == PIXEL_GRAY8:
+        data = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2GRAY)
+    elif pixel_format == PIXEL_BGR24:
+        # Views (e.g. of a pooled receive buffer) must not outlive the request, so they are copied.
+        owned = image_bgr.flags.owndata and image_bgr.flags.c_contiguous
+        data = image_bgr if owned else image_bgr.copy(order="C")
+    else:
+        ok, data = cv2.imencode(".jpg", image_bgr, [int(cv2.IMWRITE_JPEG_QUALITY), int(jpeg_quality)])
+        if not ok:
+            return None
+    return memoryview(data).cast("B")
+
+
+def encode_reply(header: FrameHeader, image_bgr: np.ndarray, jpeg_quality: int) -> Optional[List[bytes]]:
+    """Frame ``image_bgr`` in the format the request asked for; None if JPEG encoding failed."""
+    fmt = header.reply_format if header.version >= 2 else PIXEL_JPEG
+    data = encode_pixels(fmt, image_bgr, jpeg_quality)
+    if data is None:
+        return None
+    h, w = image_bgr.shape[:2]
+    return frame_reply(header, data, fmt, w, h)
+
+
+def roi_reply(header: FrameHeader, image_bgr: np.ndarray, roi: Optional[Roi], jpeg_quality: int) -> Optional[List[bytes]]:
+    """Reply to a ``FLAG_ROI`` request with ``roi`` of ``image_bgr`` only (``FLAG_UNCHANGED`` if None)."""
+    if roi is None:
+        return unchanged_reply(header)
+    h, w = image_bgr.shape[:2]
+    x, y, rw, rh = roi
+    data = encode_pixels(header.reply_format, image_bgr[y : y + rh, x : x + rw], jpeg_quality)
+    if data is None:
+        return None
+    return [_V2_RESPONSE.pack(MAGIC_V2, header.reply_format, FLAG_ROI, w, h, len(data)) + _ROI.pack(*roi), data]
+
+
+def unchanged_reply(header: FrameHeader) -> List[bytes]:
+    """Tell a ``FLAG_ROI`` client to show the frame it sent as is."""
+    return [_V2_RESPONSE.pack(MAGIC_V2, header.reply_format, FLAG_UNCHANGED, header.width, header.height, 0)]
+
+
+def changed_roi(original: np.ndarray, processed: np.ndarray) -> Optional[Roi]:
+    """Bounding rectangle of the pixels that differ, for inpainters that do not report one."""
+    diff = original != processed
+    if diff.ndim == 3:
+        diff = diff.any(axis=2)
+    rows = np.flatnonzero(diff.any(axis=1))
+    if rows.size == 0:
+        return None
+    cols = np.flatnonzero(diff.any(axis=0))
+    return int(cols[0]), int(rows[0]), int(cols[-1] - cols[0] + 1), int(rows[-1] - rows[0] + 1)
+
+
+def echo_reply(header: FrameHeader, payload: Payload) -> List[bytes]:
+    """Send the request payload back unchanged (decode failures, passthrough)."""
+    data = memoryview(payload).cast("B")
+    return frame_reply(header, data, header.pixel_format, header.width, header.height)
+
+
+def frame_reply(header: FrameHeader, data: bytes, pixel_format: int, width: int, height: int) -> List[bytes]:
+    if header.version < 2:
+        return [struct.pack("!I", len(data)), data]
+    return [_V2_RESPONSE.pack(MAGIC_V2, pixel_format, 0, width, height, len(data)), data]
+
+
+def slot_reply(
+    header: FrameHeader,
+    length: int,
+    pixel_format: int,
+    width: int,
+    height: int,
+    *,
+    flags: int = 0,
+    roi: Optional[Roi] = None,
+) -> List[bytes]:
+    """Reply for a ``FLAG_SHM`` request whose result (or ROI) was written into its slot."""
+    reply = _V2_RESPONSE.pack(MAGIC_V2, pixel_format, FLAG_SHM | flags, width, height, length) + _SLOT.pack(header.slot)
+    if flags & FLAG_ROI and roi is not None:
+        reply += _ROI.pack(*roi)
+    return [reply]
+
+
+def stamp_reply(header: FrameHeader, buffers: List[bytes], timings: StageTimings) -> List[bytes]:
+    """Append frame id, capture time and ``timings`` to a v2 reply if the request asked for them."""
+    if not header.wants_timings:
+        return buffers
+    head = bytearray(buffers[0])
+    head[5] |= FLAG_TIMING
+    head += _TIMING_REPLY.pack(header.frame_id, header.capture_us, *timings.micros())
+    return [bytes(head), *buffers[1:]]
+
+
+def send_reply(sock: socket.socket, buffers: List[bytes]) -> None:
+    """Write header and payload in as few socket calls as possible.
+
+    On POSIX this is one zero-copy gather write (``sendmsg``). Windows has no
+    ``sendmsg``: there the header chunks, and the payload when it is under
+    64 KiB, are copied into one buffer per ``sendall``; a larger payload is
+    sent from its own buffer after the header.
+    """
+    views = [memoryview(buf).cast("B") for buf in buffers]
+    if not hasattr(sock, "sendmsg"):  # Windows
+        pending = bytearray()
+        for view in views:
+            if len(view) <= _COALESCE_BYTES:
+                pending += view
+                continue
+            if pending:
+                sock.sendall(pending)
+                pending = bytearray()
+            sock.sendall(view)
+        if pending:
+            sock.sendall(pending)
+        return
+    views = [view for view in views if len(view)]
+    while views:
+        sent = sock.sendmsg(views)
+        while sent and sent >= len(views[0]):
+            sent -= len(views.pop(0))
+        if sent:
+            views[0] = views[0][sent:]
@@ -0,0 +1,112 @@
+"""Compact encodings for the binary prior mask sent next to each frame.
+
+The skeleton/geometry mask is almost all zeros, yet raw it costs W*H bytes
+per frame (more than the JPEG it accompanies). Two encodings are supported:
+
+- bit-packed: ``np.packbits`` of the row-major mask, MSB first, W*H/8 bytes;
+- RLE: the compressed ``counts`` string of a COCO RLE (column-major runs,
+  starting with zeros), i.e. exactly what ``pycocotools.mask.encode`` returns
+  for ``np.asfortranarray(mask)``.
+
+Decoders write 0/255 into a caller-supplied (or new) HxW uint8 buffer, the
+same values the raw format carries.
+"""
+from __future__ import annotations
+
+from typing import Optional
+
+import numpy as np
+
+
+def unpack_bits(data: bytes, height: int, width: int, out: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+    count = height * width
+    if len(data) != (count + 7) // 8:
+        return None
+    if out is None:
+        out = np.empty((height, width), dtype=np.uint8)
+    bits = np.unpackbits(np.frombuffer(data, dtype=np.uint8), count=count)
+    np.multiply(bits.reshape(height, width), 255, out=out)
+    return out
+
+
+def pack_bits(mask: np.ndarray) -> bytes:
+    return np.packbits(np.asarray(mask, dtype=bool), axis=None).tobytes()
+
+
+def rle_counts(data: bytes) -> np.ndarray:
+    """Parse a pycocotools compressed counts string into run lengths.
+
+    Raises ValueError on a byte outside the encoding's range or a string that
+    ends in the middle of a value.
+    """
+    counts = []
+    pos = 0
+    n = len(data)
+    while pos < n:
+        value = 0
+        shift = 0
+        more = True
+        while more:
+            if pos >= n:
+                raise ValueError("RLE counts string ends mid-value")
+            c = data[pos] - 48
+            if not 0 <= c < 64:
+                raise ValueError(f"invalid RLE counts byte {data[pos]!r}")
+            value |= (c & 0x1F) << shift
+            more = bool(c & 0x20)
+            pos += 1
+            shift += 5
+            if not more and c & 0x10:
+                value |= -1 << shift
+        if len(counts) > 2:
+            value += counts[-2]
+        counts.append(value)
+    return np.asarray(counts, dtype=np.int64)
+
+
+def rle_string(counts: np.ndarray) -> bytes:
+    """Inverse of ``rle_counts`` (pycocotools ``rleToString``)."""
+    out = bytearray()
+    counts = [int(c) for c in counts]
+    for i, value in enumerate(counts):
+        if i > 2:
+            value -= counts[i - 2]
+        more = True
+        while more:
+            c = value & 0x1F
+            value >>= 5
+            more = (value != -1) if c & 0x10 else (value != 0)
+            if more:
+                c |= 0x20
+            out.append(c + 48)
+    return bytes(out)
+
+
+def decode_rle(data: bytes, height: int, width: int, out: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+    try:
+        counts = rle_counts(data)
+    except (ValueError, OverflowError):
+        return None
+    if counts.size == 0 or counts.min() < 0 or int(counts.sum()) != height * width:
+        return None
+    ends = np.cumsum(counts)
+    # +1 at the start of every foreground run, -1 after it; the running sum is the mask.
+    edges = np.zeros(height * width + 1, dtype=np.int8)
+    np.add.at(edges, ends[0::2][: len(ends) // 2], 1)
+    np.add.at(edges, ends[1::2], -1)
+    column_major = np.cumsum(edges[:-1], dtype=np.int8).view(np.uint8)
+    if out is None:
+        out = np.empty((height, width), dtype=np.uint8)
+    np.multiply(column_major.reshape(width, height).T, 255, out=out)
+    return out
+
+
+def encode_rle(mask: np.ndarray) -> bytes:
+    """COCO RLE counts string for an HxW mask (nonzero = foreground)."""
+    flat = (np.asarray(mask).T.reshape(-1) != 0).view(np.int8)
+    changes = np.flatnonzero(np.diff(flat)) + 1
+    bounds = np.concatenate(([0], changes, [flat.size]))
+    counts = np.diff(bounds)
+    if flat.size and flat[0]:
+        counts = np.concatenate(([0], counts))
+    return rle_string(counts)
@@ -0,0 +1,268 @@
+"""RTMDet-Ins on ONNX Runtime (CPU): letterbox, raw head outputs, numpy decoding.
+
+``export_onnx.py`` exports backbone + neck + head with the data_preprocessor's
+normalisation folded in, for one fixed input shape. The graph takes the padded
+BGR frame as uint8 NCHW and returns, flattened over all levels (row-major per
+level, levels in stride order):
+
+- ``cls_scores`` (1, N, num_classes): class logits per prior;
+- ``bbox_preds`` (1, N, 4): left/top/right/bottom distances in input pixels;
+- ``kernels`` (1, N, num_params): dynamic conv parameters per prior;
+- ``mask_feat`` (1, num_prototypes, H/s0, W/s0): mask prototypes.
+
+The rest of ``RTMDetInsHead.predict_by_feat`` is done here in numpy: per-level
+score threshold + ``nms_pre`` top-k, distance decoding, class-aware NMS,
+``max_per_img``, then the dynamic 1x1 convs over the prototypes (relative
+coordinates divided by ``stride * 8``) and one bilinear upsample to the input.
+Geometry and test_cfg travel with the graph as JSON in the ``rtmdet_ins``
+metadata property, so onnxruntime, numpy and OpenCV are all the runtime needs.
+"""
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+import cv2
+import numpy as np
+import onnxruntime as ort
+
+METADATA_KEY = "rtmdet_ins"
+OUTPUT_NAMES = ("cls_scores", "bbox_preds", "kernels", "mask_feat")
+
+
+def _logit(p: float) -> float:
+    """Inverse sigmoid, saturating to +-inf at 0 and 1."""
+    with np.errstate(divide="ignore"):
+        return float(np.log(p) - np.log1p(-p))
+
+
+def nms(boxes: np.ndarray, scores: np.ndarray, iou_threshold: float, limit: int = 0) -> np.ndarray:
+    """Greedy NMS; indices of the kept boxes, highest score first (mmcv ``nms`` semantics).
+
+    With ``limit`` it stops after that many boxes: the same result as truncating afterwards.
+    """
+    x1, y1, x2, y2 = boxes.T
+    areas = (x2 - x1) * (y2 - y1)
+    order = np.argsort(-scores, kind="stable")
+    keep = []
+    while order.size and not (limit and len(keep) == limit):
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        w = np.clip(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0, None)
+        h = np.clip(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0, None)
+        inter = w * h
+        iou = inter / np.maximum(areas[i] + areas[rest] - inter, np.finfo(np.float32).eps)
+        order = rest[iou <= iou_threshold]
+    return np.asarray(keep, dtype=np.int64)
+
+
+def batched_nms(
+    boxes: np.ndarray, scores: np.ndarray, labels: np.ndarray, iou_threshold: float, limit: int = 0,
+) -> np.ndarray:
+    """Class-aware NMS by offsetting each class's boxes apart (as mmcv ``batched_nms`` does)."""
+    offsets = labels.astype(boxes.dtype) * (boxes.max() + 1)
+    return nms(boxes + offsets[:, None], scores, iou_threshold, limit)
+
+
+class OnnxRTMDetIns:
+    """Run an exported RTMDet-Ins graph; ``detect`` returns the union of the kept instance masks."""
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        *,
+        score_threshold: Optional[float] = None,
+        max_detections: Optional[int] = None,
+        mask_threshold: Optional[float] = None,
+        num_threads: int = 0,
+    ) -> None:
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = int(num_threads)
+        self.session = ort.InferenceSession(str(path), options, providers=["CPUExecutionProvider"])
+        meta = json.loads(self.session.get_modelmeta().custom_metadata_map[METADATA_KEY])
+        self.input_name = self.session.get_inputs()[0].name
+        self.input_width, self.input_height = meta["input_size"]
+        self.class_names: Tuple[str, ...] = tuple(meta["classes"])
+        self.strides: List[int] = list(meta["strides"])
+        self.prior_offset = float(meta.get("prior_offset", 0.0))
+        self.pad_value = meta.get("pad_value", 0)
+        self.num_prototypes = int(meta["num_prototypes"])
+        self.dyconv_channels = int(meta["dyconv_channels"])
+        self.num_dyconvs = int(meta["num_dyconvs"])
+
+        test_cfg = meta["test_cfg"]
+        self.score_threshold = float(test_cfg["score_thr"] if score_threshold is None else score_threshold)
+        self.nms_pre = int(test_cfg.get("nms_pre", -1))
+        self.iou_threshold = float(test_cfg["iou_threshold"])
+        self.min_bbox_size = float(test_cfg.get("min_bbox_size", -1))
+        self.max_per_img = int(max_detections or test_cfg["max_per_img"])
+        mask_thr = float(test_cfg["mask_thr_binary"] if mask_threshold is None else mask_threshold)
+        # Thresholds compared in logit space: the sigmoid only runs on score candidates, never on masks.
+        self.score_logit_threshold = _logit(self.score_threshold)
+        self.mask_logit_threshold = _logit(mask_thr)
+        self.class_columns: Optional[np.ndarray] = None
+
+        self._priors, self._level_bounds = self._grid_priors()
+        self._weight_nums, self._bias_nums = self._dynamic_param_sizes()
+
+    def restrict_classes(self, label_ids: Optional[Iterable[int]]) -> None:
+        """Only score these classes (every class for None; nothing at all for an empty list)."""
+        if label_ids is None:
+            self.class_columns = None
+            return
+        num_classes = self.session.get_outputs()[0].shape[-1]
+        label_ids = sorted({int(i) for i in label_ids if 0 <= int(i) < num_classes})
+        self.class_columns = np.asarray(label_ids, dtype=np.int64)
+
+    def _grid_priors(self) -> Tuple[np.ndarray, List[Tuple[int, int]]]:
+        """(x, y, stride) per prior in output order, plus the [start, end) range of each level."""
+        priors = []
+        bounds = []
+        start = 0
+        for stride in self.strides:
+            h, w = -(-self.input_height // stride), -(-self.input_width // stride)
+            ys, xs = np.meshgrid(np.arange(h, dtype=np.float32), np.arange(w, dtype=np.float32), indexing="ij")
+            level = np.stack(
+                [(xs.ravel() + self.prior_offset) * stride, (ys.ravel() + self.prior_offset) * stride,
+                 np.full(h * w, stride, dtype=np.float32)],
+                axis=1,
+            )
+            priors.append(level)
+            bounds.append((start, start + h * w))
+            start += h * w
+        return np.concatenate(priors), bounds
+
+    def _dynamic_param_sizes(self) -> Tuple[List[int], List[int]]:
+        """Per-layer weight/bias counts, as ``RTMDetInsHead._init_layers`` lays them out."""
+        weight_nums, bias_nums = [], []
+        channels = self.dyconv_channels
+        for i in range(self.num_dyconvs):
+            if i == 0:
+                weight_nums.append((self.num_prototypes + 2) * channels)
+                bias_nums.append(channels)
+            elif i == self.num_dyconvs - 1:
+                weight_nums.append(channels)
+                bias_nums.append(1)
+            else:
+                weight_nums.append(channels * channels)
+                bias_nums.append(channels)
+        return weight_nums, bias_nums
+
+    def letterbox(self, image_bgr: np.ndarray) -> Tuple[np.ndarray, Tuple[int, int]]:
+        """Keep-ratio resize into the fixed input, padded bottom/right; uint8 CHW and the resized (h, w)."""
+        h, w = image_bgr.shape[:2]
+        scale = min(self.input_width / w, self.input_height / h)
+        new_w, new_h = min(int(w * scale + 0.5), self.input_width), min(int(h * scale + 0.5), self.input_height)
+        padded = np.empty((self.input_height, self.input_width, 3), dtype=np.uint8)
+        cv2.resize(image_bgr, (new_w, new_h), dst=padded[:new_h, :new_w], interpolation=cv2.INTER_LINEAR)
+        padded[new_h:] = self.pad_value
+        padded[:new_h, new_w:] = self.pad_value
+        planes = np.empty((3, self.input_height, self.input_width), dtype=np.uint8)
+        cv2.split(padded, list(planes))
+        return planes, (new_h, new_w)
+
+    def run(self, planes: np.ndarray) -> Dict[str, np.ndarray]:
+        outputs = self.session.run(list(OUTPUT_NAMES), {self.input_name: planes[None]})
+        return {name: value[0] for name, value in zip(OUTPUT_NAMES, outputs)}
+
+    def detect(self, image_bgr: np.ndarray) -> np.ndarray:
+        """Union of the kept instance masks over the resized (unpadded) input region."""
+        planes, valid_shape = self.letterbox(image_bgr)
+        outputs = self.run(planes)
+        instances = self.predict(outputs)
+        if instances is None:
+            return np.zeros(valid_shape, dtype=bool)
+        kernels, priors = instances
+        logits = self.mask_logits(outputs["mask_feat"], kernels, priors)
+        return self.union_mask(logits, valid_shape)
+
+    def predict(self, outputs: Dict[str, np.ndarray]) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """Kernels and priors of the instances that survive filtering and NMS (None if none do)."""
+        cls_scores = outputs["cls_scores"]
+        if self.class_columns is not None:
+            cls_scores = cls_scores[:, self.class_columns]
+        picked = []
+        for start, end in self._level_bounds:
+            logits = cls_scores[start:end]
+            rows, cols = np.nonzero(logits > self.score_logit_threshold)
+            if rows.size == 0:
+                continue
+            scores = 1.0 / (1.0 + np.exp(-logits[rows, cols]))
+            order = np.argsort(-scores, kind="stable")
+            if self.nms_pre > 0:
+                order = order[: self.nms_pre]
+            picked.append((rows[order] + start, cols[order], scores[order]))
+        if not picked:
+            return None
+        idx = np.concatenate([p[0] for p in picked])
+        labels = np.concatenate([p[1] for p in picked])
+        if self.class_columns is not None:
+            labels = self.class_columns[labels]
+        scores = np.concatenate([p[2] for p in picked])
+
+        priors = self._priors[idx]
+        dist = outputs["bbox_preds"][idx]
+        boxes = np.stack(
+            [priors[:, 0] - dist[:, 0], priors[:, 1] - dist[:, 1], priors[:, 0] + dist[:, 2], priors[:, 1] + dist[:, 3]],
+            axis=1,
+        )
+        np.clip(boxes[:, 0::2], 0, self.input_width, out=boxes[:, 0::2])
+        np.clip(boxes[:, 1::2], 0, self.input_height, out=boxes[:, 1::2])
+        if self.min_bbox_size >= 0:
+            valid = ((boxes[:, 2] - boxes[:, 0]) > self.min_bbox_size) & ((boxes[:, 3] - boxes[:, 1]) > self.min_bbox_size)
+            idx, labels, scores, priors, boxes = idx[valid], labels[valid], scores[valid], priors[valid], boxes[valid]
+            if idx.size == 0:
+                return None
+        keep = batched_nms(boxes, scores, labels, self.iou_threshold, self.max_per_img)
+        return outputs["kernels"][idx[keep]], priors[keep]
+
+    def mask_logits(self, mask_feat: np.ndarray, kernels: np.ndarray, priors: np.ndarray) -> np.ndarray:
+        """Dynamic 1x1 convs over [relative x, relative y, prototypes]; (n, H/s0, W/s0) logits."""
+        n = kernels.shape[0]
+        _, h, w = mask_feat.shape
+        stride = self.strides[0]
+        xs = (np.arange(w, dtype=np.float32) + self.prior_offset) * stride
+        ys = (np.arange(h, dtype=np.float32) + self.prior_offset) * stride
+        norm = (priors[:, 2] * 8.0)[:, None]
+        rel_x = (priors[:, 0:1] - xs[None, :]) / norm  # (n, w)
+        rel_y = (priors[:, 1:2] - ys[None, :]) / norm  # (n, h)
+        features = mask_feat.reshape(self.num_prototypes, h * w)
+
+        splits = np.cumsum(self._weight_nums + self._bias_nums)[:-1]
+        params = np.split(kernels, splits, axis=1)
+        weights, biases = params[: self.num_dyconvs], params[self.num_dyconvs:]
+        channels = self.dyconv_channels
+        x = None
+        for i, (weight, bias) in enumerate(zip(weights, biases)):
+            out_channels = channels if i < self.num_dyconvs - 1 else 1
+            weight = weight.reshape(n, out_channels, -1)
+            if i == 0:
+                # The coordinate channels are separable: broadcast rows/columns instead of building (n, 2, h, w).
+                x = np.einsum("nop,pk->nok", weight[:, :, 2:], features).reshape(n, out_channels, h, w)
+                x += weight[:, :, 0, None, None] * rel_x[:, None, None, :]
+                x += weight[:, :, 1, None, None] * rel_y[:, None, :, None]
+                x = x.reshape(n, out_channels, h * w)
+            else:
+                x = np.einsum("noc,nck->nok", weight, x)
+            x += bias.reshape(n, out_channels, 1)
+            if i < self.num_dyconvs - 1:
+                np.maximum(x, 0, out=x)
+        return x.reshape(n, h, w)
+
+    def union_mask(self, logits: np.ndarray, valid_shape: Tuple[int, int]) -> np.ndarray:
+        """Upsample the logits by the mask stride (bilinear, like the head), threshold, OR over instances."""
+        stride = self.strides[0]
+        n, h, w = logits.shape
+        valid_h, valid_w = valid_shape
+        union = np.zeros(valid_shape, dtype=bool)
+        # cv2.resize takes at most 512 channels.
+        for start in range(0, n, 512):
+            chunk = np.ascontiguousarray(logits[start:start + 512].transpose(1, 2, 0))
+            up = cv2.resize(chunk, (w * stride, h * stride), interpolation=cv2.INTER_LINEAR)
+            if up.ndim == 2:
+                up = up[..., None]
+            union |= (up[:valid_h, :valid_w] > self.mask_logit_threshold).any(axis=2)
+        return union
@@ -0,0 +1,206 @@
+"""INT8-quantize an exported RTMDet-Ins graph and check its masks against the float graph.
+
+    python quantize_onnx.py --model weights/rtmdet-ins_s_..._800x608.onnx \\
+        --debug-dir ../RTMDet_Realtime/debug --target-label arm --score-threshold 0.08
+
+Calibration and evaluation frames are the ``*_orig.jpg`` dumps a server writes
+with ``--debug-dir`` (sorted; even positions calibrate, odd positions
+evaluate, so the check runs on frames the ranges were not fitted to).
+
+- static (default): QDQ INT8 with activation ranges calibrated on the dumps.
+  The convs that produce the graph outputs (class/box/kernel predictors and
+  the prototype conv) stay float by default: their values feed thresholds and
+  the dynamic mask convs directly.
+- dynamic: weights only, no calibration (ConvInteger; usually the slower one
+  on CPU, kept for comparison).
+
+The check runs both graphs through ``OnnxRTMDetIns`` (same decoding as the
+server) and reports the IoU of the union masks per frame, plus latency.
+The result loads like any exported graph: ``--onnx <output>``.
+"""
+from __future__ import annotations
+
+import argparse
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import List, Optional, Sequence, Set
+
+import cv2
+import numpy as np
+import onnx
+from onnxruntime.quantization import (
+    CalibrationDataReader,
+    CalibrationMethod,
+    QuantFormat,
+    QuantType,
+    quantize_dynamic,
+    quantize_static,
+)
+from onnxruntime.quantization.shape_inference import quant_pre_process
+
+from onnx_backend import METADATA_KEY, OnnxRTMDetIns  # type: ignore
+
+CALIBRATION_METHODS = {
+    "minmax": CalibrationMethod.MinMax,
+    "entropy": CalibrationMethod.Entropy,
+    "percentile": CalibrationMethod.Percentile,
+}
+
+
+class DumpReader(CalibrationDataReader):
+    """Letterboxed dump frames, one graph input dict at a time."""
+
+    def __init__(self, backend: OnnxRTMDetIns, frames: Sequence[Path]) -> None:
+        self._backend = backend
+        self._frames = iter(frames)
+
+    def get_next(self) -> Optional[dict]:
+        for path in self._frames:
+            image = cv2.imread(str(path), cv2.IMREAD_COLOR)
+            if image is None:
+                continue
+            planes, _ = self._backend.letterbox(image)
+            return {self._backend.input_name: planes[None]}
+        return None
+
+
+def dump_frames(debug_dir: Path) -> List[Path]:
+    return sorted(debug_dir.glob("*_orig.jpg"))
+
+
+def output_convs(model: onnx.ModelProto) -> Set[str]:
+    """Conv nodes whose results reach a graph output through non-Conv ops only."""
+    producers = {out: node for node in model.graph.node for out in node.output}
+    pending = [output.name for output in model.graph.output]
+    seen: Set[str] = set()
+    convs: Set[str] = set()
+    while pending:
+        name = pending.pop()
+        node = producers.get(name)
+        if node is None or name in seen:
+            continue
+        seen.add(name)
+        if node.op_type == "Conv" and node.name:
+            convs.add(node.name)
+        else:
+            pending.extend(node.input)
+    return convs
+
+
+def quantize(args: argparse.Namespace, frames: Sequence[Path]) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        prepared = Path(tmp) / "prepared.onnx"
+        quant_pre_process(str(args.model), str(prepared))
+        float_graph = onnx.load(str(prepared))
+        if args.mode == "dynamic":
+            quantize_dynamic(str(prepared), str(args.output), per_channel=args.per_channel, weight_type=QuantType.QInt8)
+        else:
+            exclude = sorted(output_convs(float_graph)) if args.keep_float_heads else []
+            reader = DumpReader(OnnxRTMDetIns(args.model), frames)
+            quantize_static(
+                str(prepared),
+                str(args.output),
+                reader,
+                quant_format=QuantFormat.QDQ,
+                per_channel=args.per_channel,
+                activation_type=QuantType.QUInt8,
+                weight_type=QuantType.QInt8,
+                nodes_to_exclude=exclude,
+                calibrate_method=CALIBRATION_METHODS[args.calibration],
+            )
+            print(f"[quant] calibrated on {len(frames)} frames, {len(exclude)} output convs kept float")
+
+    # The quantizer does not carry metadata_props over; the backend needs them.
+    source = onnx.load(str(args.model))
+    quantized = onnx.load(str(args.output))
+    meta = {prop.key: prop.value for prop in source.metadata_props}
+    onnx.helper.set_model_props(quantized, {METADATA_KEY: meta[METADATA_KEY]})
+    onnx.save(quantized, str(args.output))
+    print(f"[quant] {args.mode} INT8 graph written to {args.output}")
+
+
+def mask_iou(a: np.ndarray, b: np.ndarray) -> float:
+    union = np.count_nonzero(a | b)
+    return 1.0 if union == 0 else np.count_nonzero(a & b) / union
+
+
+def timed_detect(backend: OnnxRTMDetIns, image: np.ndarray, samples: List[float]) -> np.ndarray:
+    start = time.perf_counter()
+    mask = backend.detect(image)
+    samples.append((time.perf_counter() - start) * 1000.0)
+    return mask
+
+
+def check(args: argparse.Namespace, frames: Sequence[Path]) -> None:
+    backends = []
+    for path in (args.model, args.output):
+        backend = OnnxRTMDetIns(
+            path,
+            score_threshold=args.score_threshold,
+            num_threads=args.threads,
+        )
+        labels = set(args.target_label or ())
+        if labels:
+            backend.restrict_classes(i for i, name in enumerate(backend.class_names) if name in labels)
+        backends.append(backend)
+    float_backend, int8_backend = backends
+
+    ious: List[float] = []
+    float_ms: List[float] = []
+    int8_ms: List[float] = []
+    disagree = 0
+    for path in frames:
+        image = cv2.imread(str(path), cv2.IMREAD_COLOR)
+        if image is None:
+            continue
+        reference = timed_detect(float_backend, image, float_ms)
+        mask = timed_detect(int8_backend, image, int8_ms)
+        ious.append(mask_iou(reference, mask))
+        disagree += int(reference.any() != mask.any())
+    if not ious:
+        print("[check] no evaluation frames")
+        return
+    print(
+        f"[check] {len(ious)} frames | mask IoU mean={statistics.mean(ious):.4f} "
+        f"median={statistics.median(ious):.4f} min={min(ious):.4f} | detection presence differs on {disagree}",
+    )
+    print(
+        f"[check] detect median: float={statistics.median(float_ms):.1f} ms "
+        f"int8={statistics.median(int8_ms):.1f} ms",
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="INT8 quantization for the onnxruntime RTMDet-Ins backend")
+    parser.add_argument("--model", type=Path, required=True, help="Float graph from export_onnx.py")
+    parser.add_argument("--output", type=Path, help="Quantized graph path (default: <model>_int8.onnx)")
+    parser.add_argument("--debug-dir", type=Path, required=True, help="Server --debug-dir with *_orig.jpg frame dumps")
+    parser.add_argument("--mode", choices=("static", "dynamic"), default="static", help="Static (calibrated activations) or dynamic (weights only)")
+    parser.add_argument("--calibration", choices=sorted(CALIBRATION_METHODS), default="minmax", help="Activation range estimator (static mode)")
+    parser.add_argument("--calib-frames", type=int, default=100, help="Frames used for calibration")
+    parser.add_argument("--eval-frames", type=int, default=100, help="Frames used for the accuracy check")
+    parser.add_argument("--per-channel", action="store_true", help="Per-channel weight scales")
+    parser.add_argument("--quantize-heads", dest="keep_float_heads", action="store_false", help="Also quantize the convs that produce the graph outputs")
+    parser.add_argument("--check-only", action="store_true", help="Skip quantization; compare --model against an existing --output")
+    parser.add_argument("--target-label", action="append", help="Label(s) counted in the check; repeat for multiple")
+    parser.add_argument("--score-threshold", type=float, default=0.3, help="Score threshold used in the check")
+    parser.add_argument("--threads", type=int, default=0, help="onnxruntime intra-op threads in the check (0 = default)")
+    args = parser.parse_args()
+
+    if args.output is None:
+        args.output = args.model.with_name(f"{args.model.stem}_int8.onnx")
+    frames = dump_frames(args.debug_dir)
+    if not frames:
+        raise SystemExit(f"no *_orig.jpg dumps in {args.debug_dir}")
+    calibration = frames[0::2][: args.calib_frames]
+    evaluation = frames[1::2][: args.eval_frames] or calibration
+
+    if not args.check_only:
+        quantize(args, calibration)
+    check(args, evaluation)
+
+
+if __name__ == "__main__":
+    main()
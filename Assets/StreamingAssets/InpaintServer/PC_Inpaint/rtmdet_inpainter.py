@@ -2,17 +2,40 @@
 
 This module wraps RTMDet instance segmentation together with OpenCV inpainting so
 other scripts (e.g. the TCP server) can reuse the logic without duplicating code.
+Inference runs on PyTorch/mmdet or, with ``onnx_path``, on onnxruntime (then
+torch and mmdet are optional).
 """
 from __future__ import annotations
 
 import threading
-from typing import Iterable, Optional, Sequence, Tuple
+import time
+from typing import Callable, Iterable, List, Optional, Sequence, Tuple, Union
 
 import cv2
 import numpy as np
-from mmdet.apis import DetInferencer
 from pycocotools import mask as mask_utils
 
+try:
+    import torch
+    from mmdet.apis import DetInferencer
+    from mmdet.structures import DetDataSample
+    from mmengine.dataset import pseudo_collate
+except ImportError:  # ONNX Runtime backend only (onnx_path)
+    torch = None
+    DetInferencer = None
+
+
+# Maps a prepared model input (see RTMDetInpainter.prepare_input) to the combined target mask.
+DetectFn = Callable[[np.ndarray], np.ndarray]
+
+
+def record_stage(stage_ms: Optional[dict], name: str, start: float) -> float:
+    """Store the ms since ``start`` as ``stage_ms[name]`` (when given); returns the new start."""
+    now = time.perf_counter()
+    if stage_ms is not None:
+        stage_ms[name] = (now - start) * 1000.0
+    return now
+
 
 def _normalize_labels(labels: Optional[Iterable[str]]) -> Sequence[str]:
     if not labels:
@@ -35,6 +58,25 @@ class RTMDetInpainter:
         inpaint_radius: int = 3,
         inpaint_flags: int = cv2.INPAINT_TELEA,
         warmup: bool = False,
+        # Run data_preprocessor + predict on the pipeline output, skipping DetInferencer's RLE round-trip
+        direct_inference: bool = False,
+        # Override the head's test_cfg (score_thr always follows score_threshold)
+        max_detections: Optional[int] = None,
+        mask_threshold: Optional[float] = None,
+        # OR instance masks at the model's input resolution; callers resize the union (implies direct)
+        native_masks: bool = False,
+        # One cv2.resize of the BGR frame into the padded model input, no mmcv pipeline (implies direct)
+        lean_preprocess: bool = False,
+        # Graph from export_onnx.py, run on onnxruntime's CPU provider instead of PyTorch
+        onnx_path: Optional[str] = None,
+        # NHWC weights and inputs (implies direct)
+        channels_last: bool = False,
+        # torch.compile the feature extractor and head forward; forces a warmup (implies direct)
+        compile_mode: Optional[str] = None,
+        # Intra-op threads of torch or onnxruntime (0 = library default)
+        num_threads: int = 0,
+        # False: prepare_input/inpaint(detect=...) only, e.g. when detection runs in worker processes
+        load_model: bool = True,
     ) -> None:
         self.inference_size = inference_size
         self.score_threshold = float(score_threshold)
@@ -43,34 +85,197 @@ class RTMDetInpainter:
         self.inpaint_flags = int(inpaint_flags)
         self._lock = threading.Lock()
 
-        self.inferencer = DetInferencer(
-            model=config_path,
-            weights=weights_path,
-            device=device,
+        self.onnx = None
+        self.inferencer = None
+        self.class_names: Tuple[str, ...] = ()
+        self.model_loaded = bool(load_model)
+        self._bgr_input = bool(onnx_path)
+        if self.model_loaded and onnx_path:
+            from onnx_backend import OnnxRTMDetIns  # type: ignore
+
+            self.onnx = OnnxRTMDetIns(
+                onnx_path,
+                score_threshold=self.score_threshold,
+                max_detections=max_detections,
+                mask_threshold=mask_threshold,
+                num_threads=num_threads,
+            )
+            self.class_names = self.onnx.class_names
+        elif self.model_loaded:
+            if DetInferencer is None:
+                raise ImportError("torch and mmdet are required unless onnx_path is given")
+            if num_threads:
+                torch.set_num_threads(int(num_threads))
+            self.inferencer = DetInferencer(
+                model=config_path,
+                weights=weights_path,
+                device=device,
+            )
+            meta = getattr(self.inferencer.model, "dataset_meta", {}) or {}
+            self.class_names = tuple(meta.get("classes", ()))
+
+        self.native_masks = bool(native_masks)
+        self.lean_preprocess = bool(lean_preprocess) and not self._bgr_input
+        self.channels_last = bool(channels_last) and not self._bgr_input
+        self.compile_mode = (compile_mode or None) if not self._bgr_input else None
+        self._host_transpose = device.split(":")[0] == "cpu"
+        self.direct_inference = (
+            bool(direct_inference)
+            or self.native_masks
+            or self.lean_preprocess
+            or self.channels_last
+            or self.compile_mode is not None
         )
-
-        meta = getattr(self.inferencer.model, "dataset_meta", {}) or {}
-        self.class_names = tuple(meta.get("classes", ()))
-
-        if warmup:
+        # Class names, or numeric ids for labels past the named classes (unnamed models).
+        self.target_label_ids = tuple(
+            i for i, name in enumerate(self.class_names) if name in self.target_labels
+        ) + tuple(
+            int(label) for label in self.target_labels if label.isdigit() and int(label) >= len(self.class_names)
+        )
+        self.warmup_ms: List[float] = []
+        if not self.model_loaded:
+            return
+        if self.onnx is not None:
+            self.onnx.restrict_classes(self.target_label_ids if self.target_labels else None)
+        else:
+            self._apply_test_cfg(max_detections, mask_threshold)
+        if self.lean_preprocess:
+            self._init_lean_preprocess()
+        if self.channels_last or self.compile_mode:
+            self._optimize_model()
+
+        if self.compile_mode:
+            # First pass compiles, the second may still recompile on guard failures.
+            self.warmup(passes=3)
+        elif warmup:
             self.warmup()
 
-    def warmup(self, width: int = 320, height: int = 240) -> None:
-        """Run one dry pass to hide the first-call latency spike."""
+    def _apply_test_cfg(self, max_detections: Optional[int], mask_threshold: Optional[float]) -> None:
+        """Filter in the head: score/count/mask thresholds and target classes before mask decoding."""
+        model = self.inferencer.model
+        head = getattr(model, "bbox_head", None)
+        for cfg in (getattr(head, "test_cfg", None), getattr(model, "test_cfg", None)):
+            if cfg is None:
+                continue
+            cfg["score_thr"] = self.score_threshold
+            if max_detections:
+                cfg["max_per_img"] = int(max_detections)
+            if mask_threshold is not None:
+                cfg["mask_thr_binary"] = float(mask_threshold)
+        if head is None or not self.target_label_ids:
+            return
+        num_classes = int(getattr(head, "num_classes", len(self.class_names)))
+        dropped = [i for i in range(num_classes) if i not in self.target_label_ids]
+        if not dropped:
+            return
+        predict_by_feat = head.predict_by_feat
+        dropped_ids = torch.as_tensor(dropped, dtype=torch.long)
+
+        def predict_target_classes(cls_scores, *args, **kwargs):
+            # Logits of -inf give sigmoid scores of 0, which never pass score_thr.
+            cls_scores = [
+                score.index_fill(1, dropped_ids.to(score.device), float("-inf")) for score in cls_scores
+            ]
+            return predict_by_feat(cls_scores, *args, **kwargs)
+
+        head.predict_by_feat = predict_target_classes
+
+    def _optimize_model(self) -> None:
+        """channels_last weights and ``torch.compile`` around the tensor-only parts of ``predict``."""
+        model = self.inferencer.model
+        if self.channels_last:
+            model.to(memory_format=torch.channels_last)
+        if self.compile_mode:
+            mode = None if self.compile_mode == "default" else self.compile_mode
+            model.extract_feat = torch.compile(model.extract_feat, mode=mode, dynamic=False)
+            head = model.bbox_head
+            head.forward = torch.compile(head.forward, mode=mode, dynamic=False)
+
+    def _init_lean_preprocess(self) -> None:
+        """Resize/Pad parameters of the config's test pipeline, applied by ``_lean_batch``."""
+        steps = {step["type"]: step for step in self.inferencer.cfg.test_dataloader.dataset.pipeline}
+        resize = steps.get("Resize")
+        if resize is None or not resize.get("keep_ratio", False):
+            raise ValueError("lean preprocessing needs a keep_ratio Resize in the test pipeline")
+        self._model_scale = (max(resize["scale"]), min(resize["scale"]))
+        pad = steps.get("Pad") or {}
+        self._pad_size = tuple(pad["size"]) if pad.get("size") else None
+        self._pad_divisor = int(pad.get("size_divisor") or 1)
+        pad_val = pad.get("pad_val", 0)
+        self._pad_value = pad_val.get("img", 0) if isinstance(pad_val, dict) else pad_val
+
+    def _lean_input(self, image_bgr: np.ndarray, max_scale: Optional[float] = None) -> dict:
+        """Same tensor and metainfo as Resize(keep_ratio) + Pad + PackDetInputs, in one resize."""
+        h, w = image_bgr.shape[:2]
+        long_edge, short_edge = self._model_scale
+        scale = min(long_edge / max(h, w), short_edge / min(h, w))
+        if max_scale is not None:
+            scale = min(scale, float(max_scale))
+        new_w, new_h = int(w * scale + 0.5), int(h * scale + 0.5)
+        if self._pad_size is not None:
+            pad_w, pad_h = self._pad_size
+        else:
+            divisor = self._pad_divisor
+            pad_w, pad_h = -(-new_w // divisor) * divisor, -(-new_h // divisor) * divisor
+        padded = np.empty((pad_h, pad_w, 3), dtype=np.uint8)
+        cv2.resize(image_bgr, (new_w, new_h), dst=padded[:new_h, :new_w], interpolation=cv2.INTER_LINEAR)
+        padded[new_h:] = self._pad_value
+        padded[:new_h, new_w:] = self._pad_value
+        sample = DetDataSample(metainfo=dict(
+            ori_shape=(h, w),
+            img_shape=(pad_h, pad_w),
+            pad_shape=(pad_h, pad_w),
+            scale_factor=(new_w / w, new_h / h),
+        ))
+        if self._host_transpose:
+            planes = np.empty((3, pad_h, pad_w), dtype=np.uint8)
+            cv2.split(padded, list(planes))
+            inputs = torch.from_numpy(planes)
+        else:
+            inputs = torch.from_numpy(padded).permute(2, 0, 1)
+        return dict(inputs=inputs, data_samples=sample)
+
+    def prepare_input(self, image_bgr: np.ndarray, *, resize: bool = True) -> np.ndarray:
+        """What ``detect`` takes for one BGR frame: the frame itself (lean path) or the resized RGB input."""
+        if self.lean_preprocess or self._bgr_input:
+            return image_bgr
+        h, w = image_bgr.shape[:2]
+        if resize and self.inference_size and (w, h) != self.inference_size:
+            image_bgr = cv2.resize(image_bgr, self.inference_size, interpolation=cv2.INTER_LINEAR)
+        return cv2.cvtColor(image_bgr, cv2.COLOR_BGR2RGB)
+
+    def warmup(self, width: int = 320, height: int = 240, passes: int = 1) -> None:
+        """Run dry passes to hide the first-call latency spike; their times go to ``warmup_ms``."""
         dummy_w = width
         dummy_h = height
         if self.inference_size:
             dummy_w, dummy_h = self.inference_size
         dummy = np.zeros((dummy_h, dummy_w, 3), dtype=np.uint8)
-        _ = self._run_inference(cv2.cvtColor(dummy, cv2.COLOR_BGR2RGB))
+        for _ in range(max(1, passes)):
+            start = time.perf_counter()
+            _ = self.detect(self.prepare_input(dummy))
+            self.warmup_ms.append((time.perf_counter() - start) * 1000.0)
 
-    def inpaint(self, image_bgr: np.ndarray, prior_mask: Optional[np.ndarray] = None) -> np.ndarray:
-        """Execute segmentation + inpainting on a BGR input image."""
+    def inpaint(
+        self,
+        image_bgr: np.ndarray,
+        prior_mask: Optional[np.ndarray] = None,
+        *,
+        detect: Optional[DetectFn] = None,
+        stage_ms: Optional[dict] = None,
+    ) -> np.ndarray:
+        """Execute segmentation + inpainting on a BGR input image.
+
+        ``detect`` replaces the built-in single-image detection, e.g. with
+        DetectionBatcher.detect to share one forward pass between connections.
+        ``stage_ms`` receives the "infer", "post" and "inpaint" times in ms.
+        """
         if image_bgr is None:
             raise ValueError("image_bgr must not be None")
         if image_bgr.ndim != 3 or image_bgr.shape[2] != 3:
             raise ValueError("image_bgr must have shape HxWx3")
 
+        start = time.perf_counter()
         original_h, original_w = image_bgr.shape[:2]
         crop_bounds = None
         working = image_bgr
@@ -94,31 +299,20 @@ class RTMDetInpainter:
             else:
                 prior_mask = None
 
-        if self.inference_size and (original_w, original_h) != self.inference_size:
-            infer_w, infer_h = self.inference_size
-            working_resized = cv2.resize(working, (infer_w, infer_h), interpolation=cv2.INTER_LINEAR)
-        else:
-            working_resized = working
-            infer_w, infer_h = working.shape[1], working.shape[0]
-
-        rgb_image = cv2.cvtColor(working_resized, cv2.COLOR_BGR2RGB)
-        result = self._run_inference(rgb_image)
-
-        if not result or "predictions" not in result or not result["predictions"]:
-            if prior_mask is not None:
-                return cv2.inpaint(image_bgr, prior_mask, self.inpaint_radius, self.inpaint_flags)
-            return image_bgr.copy()
-
-        preds = result["predictions"][0]
-        target_shape = (infer_h, infer_w)
-        combined_mask = self._build_combined_mask(preds, target_shape)
+        # A prior-mask crop keeps its resolution when the full frame already has the inference size.
+        resize = (original_w, original_h) != self.inference_size
+        combined_mask = (detect or self.detect)(self.prepare_input(working, resize=resize))
+        start = record_stage(stage_ms, "infer", start)
 
         if not combined_mask.any():
             if prior_mask is not None:
-                return cv2.inpaint(image_bgr, prior_mask, self.inpaint_radius, self.inpaint_flags)
-            return image_bgr.copy()
+                repaired = cv2.inpaint(image_bgr, prior_mask, self.inpaint_radius, self.inpaint_flags)
+            else:
+                repaired = image_bgr.copy()
+            record_stage(stage_ms, "inpaint", start)
+            return repaired
 
-        if (infer_h, infer_w) != working.shape[:2]:
+        if combined_mask.shape != working.shape[:2]:
             combined_mask = cv2.resize(
                 combined_mask.astype(np.uint8),
                 (working.shape[1], working.shape[0]),
@@ -153,53 +347,147 @@ class RTMDetInpainter:
             ).astype(bool)
 
         inpaint_mask = (union_mask.astype(np.uint8)) * 255
+        start = record_stage(stage_ms, "post", start)
         repaired = cv2.inpaint(image_bgr, inpaint_mask, self.inpaint_radius, self.inpaint_flags)
+        record_stage(stage_ms, "inpaint", start)
 
         return repaired
 
-    def _run_inference(self, image_rgb: np.ndarray) -> dict:
+    def detect(self, image_rgb: np.ndarray, *, scale: Optional[float] = None) -> np.ndarray:
+        """Return the combined target mask for one ``prepare_input`` result.
+
+        The mask has the input's shape, except with ``native_masks`` where it
+        is at the model's input resolution; resize it to whatever it is used on.
+        ``scale`` caps the resize factor of the lean path (ignored otherwise).
+        """
+        return self.detect_batch([image_rgb], scale=scale)[0]
+
+    def detect_batch(self, images_rgb: Sequence[np.ndarray], *, scale: Optional[float] = None) -> List[np.ndarray]:
+        """Run one forward pass over several prepared inputs; one mask per input."""
+        if not self.model_loaded:
+            raise RuntimeError("no model loaded (load_model=False); pass detect= to inpaint")
+        inputs = list(images_rgb)
+        if self.onnx is not None:
+            with self._lock:
+                return [self.onnx.detect(image) for image in inputs]
+        if self.direct_inference:
+            samples = self._run_model(inputs, scale)
+            return [
+                self._combine_instances(sample.pred_instances, self._mask_shape(sample, image))
+                for sample, image in zip(samples, inputs)
+            ]
+        result = self._run_inference(inputs, batch_size=len(inputs))
+        preds = (result or {}).get("predictions") or []
+        masks = []
+        for idx, image in enumerate(inputs):
+            target_shape = image.shape[:2]
+            if idx < len(preds):
+                masks.append(self._build_combined_mask(preds[idx], target_shape))
+            else:
+                masks.append(np.zeros(target_shape, dtype=bool))
+        return masks
+
+    def _run_inference(self, image_rgb: Union[np.ndarray, List[np.ndarray]], batch_size: int = 1) -> dict:
         with self._lock:
             return self.inferencer(
                 inputs=image_rgb,
+                batch_size=batch_size,
                 show=False,
                 no_save_pred=True,
                 no_save_vis=True,
                 out_dir=None,
             )
 
-    def _build_combined_mask(self, preds: dict, target_shape: Tuple[int, int]) -> np.ndarray:
-        masks = preds.get("masks") or []
-        labels = preds.get("labels") or []
-        scores = preds.get("scores")
-
-        combined = np.zeros(target_shape, dtype=bool)
-
-        if not len(masks):
-            return combined
-
-        for idx, label_id in enumerate(labels):
-            label_name = self._label_name(int(label_id))
-            if self.target_labels and label_name not in self.target_labels:
-                continue
-
-            if scores is not None and idx < len(scores) and scores[idx] < self.score_threshold:
-                continue
-
-            mask = self._decode_mask(masks[idx])
-            if mask.size == 0:
-                continue
-
-            if mask.shape != target_shape:
-                mask = cv2.resize(mask.astype(np.uint8), (target_shape[1], target_shape[0]), interpolation=cv2.INTER_NEAREST).astype(bool)
-
-            combined |= mask
-
+    def _run_model(self, images_rgb: List[np.ndarray], scale: Optional[float] = None) -> list:
+        """DetDataSamples from ``model.data_preprocessor`` + ``model.predict`` under ``inference_mode`` (no post-processing)."""
+        if self.lean_preprocess:
+            batch = pseudo_collate([self._lean_input(image, scale) for image in images_rgb])
+        else:
+            batch = pseudo_collate([self.inferencer.pipeline(image) for image in images_rgb])
+        model = self.inferencer.model
+        with self._lock, torch.inference_mode():
+            # Unlike test_step, this leaves the input layout and rescale under our control:
+            # native masks skip rescale=True and stay at the (padded) model input size.
+            data = model.data_preprocessor(batch, False)
+            inputs = data["inputs"]
+            if self.channels_last:
+                inputs = inputs.contiguous(memory_format=torch.channels_last)
+            return model.predict(inputs, data["data_samples"], rescale=not self.native_masks)
+
+    def _mask_shape(self, sample, image: np.ndarray) -> Tuple[int, int]:
+        if self.native_masks:
+            # Unpadded region of the resized input (Pad sets img_shape to the padded size);
+            # padding sits on the bottom/right.
+            h, w = sample.metainfo["ori_shape"][:2]
+            scale_w, scale_h = sample.metainfo["scale_factor"][:2]
+            return int(h * scale_h + 0.5), int(w * scale_w + 0.5)
+        return image.shape[:2]
+
+    def _combine_instances(self, instances, target_shape: Tuple[int, int]) -> np.ndarray:
+        """OR the masks of the kept instances on the device; one host copy of the union."""
+        if "masks" not in instances or len(instances) == 0:
+            return np.zeros(target_shape, dtype=bool)
+        keep = instances.scores >= self.score_threshold
+        if self.target_labels:
+            ids = torch.as_tensor(self.target_label_ids, dtype=instances.labels.dtype, device=instances.labels.device)
+            keep &= torch.isin(instances.labels, ids)
+        if not bool(keep.any()):
+            return np.zeros(target_shape, dtype=bool)
+        masks = instances.masks[keep]
+        if self.native_masks:
+            masks = masks[:, : target_shape[0], : target_shape[1]]
+        combined = masks.any(dim=0).cpu().numpy()
+        if combined.shape != target_shape:
+            combined = cv2.resize(
+                combined.astype(np.uint8), (target_shape[1], target_shape[0]), interpolation=cv2.INTER_NEAREST,
+            ).astype(bool)
         return combined
 
-    def _label_name(self, label_id: int) -> str:
-        if 0 <= label_id < len(self.class_names):
-            return self.class_names[label_id]
-        return str(label_id)
+    def _build_combined_mask(self, preds: dict, target_shape: Tuple[int, int]) -> np.ndarray:
+        """Union of the target-class masks that pass the score threshold in one DetInferencer prediction."""
+        masks = preds.get("masks")
+        labels = preds.get("labels")
+        scores = preds.get("scores")
+        if masks is None or labels is None or not len(masks):
+            return np.zeros(target_shape, dtype=bool)
+
+        labels = np.asarray(labels, dtype=np.int64).reshape(-1)[: len(masks)]
+        keep = np.ones(len(labels), dtype=bool)
+        if self.target_labels:
+            keep &= np.isin(labels, self.target_label_ids)
+        if scores is not None:
+            scores = np.asarray(scores, dtype=np.float64).reshape(-1)[: len(labels)]
+            # Instances without a score are kept, as are NaN scores (never "below" the threshold).
+            keep[: len(scores)] &= ~(scores < self.score_threshold)
+        kept = [masks[idx] for idx in np.flatnonzero(keep)]
+        if not kept:
+            return np.zeros(target_shape, dtype=bool)
+
+        return self._union_masks(kept, target_shape)
+
+    @classmethod
+    def _union_masks(cls, masks: Sequence, target_shape: Tuple[int, int]) -> np.ndarray:
+        """OR of RLE dicts or arrays at ``target_shape``; RLEs of one size are merged and decoded once."""
+        sizes = {
+            tuple(mask["size"]) if isinstance(mask, dict) and "size" in mask and "counts" in mask else None
+            for mask in masks
+        }
+        if len(sizes) == 1 and None not in sizes and 0 not in next(iter(sizes)):
+            rle = masks[0] if len(masks) == 1 else mask_utils.merge(list(masks), intersect=False)
+            masks = [mask_utils.decode(rle)]
+        # Nearest-neighbour resizing commutes with the union, so a merged RLE needs one resize.
+        decoded = [
+            mask if mask.shape == target_shape else cv2.resize(
+                mask.astype(np.uint8), (target_shape[1], target_shape[0]), interpolation=cv2.INTER_NEAREST,
+            ).astype(bool)
+            for mask in (cls._decode_mask(mask) for mask in masks)
+            if mask.size
+        ]
+        if not decoded:
+            return np.zeros(target_shape, dtype=bool)
+        if len(decoded) == 1:
+            return decoded[0]
+        return np.stack(decoded).any(axis=0)
 
     @staticmethod
     def _decode_mask(mask_obj) -> np.ndarray:
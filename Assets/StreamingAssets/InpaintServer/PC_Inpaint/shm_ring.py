@@ -0,0 +1,154 @@
+"""Memory-mapped ring of frame slots for a client on the same host.
+
+The client creates a file (under /dev/shm on Linux, any local path on
+Windows), maps it and tells the server the path with a v2 ``FLAG_SHM_ATTACH``
+request. From then on it writes each frame (and optional mask) into a slot and
+the TCP stream only carries the v2 header plus the slot index; the server
+reads the frame through a numpy view of the mapping, writes the result into
+the same slot's response area and answers with a header + slot index.
+
+File layout (big-endian, like the wire format)::
+
+    [b"HRSM"][version:u16][slot_count:u16][frame_capacity:u32]
+    [mask_capacity:u32][response_capacity:u32] ... padded to 64 bytes
+    slot 0: [frame][mask][response]
+    slot 1: ...
+
+A slot belongs to the server from the request until its reply has been read,
+so a client may have up to ``slot_count`` frames in flight.
+"""
+from __future__ import annotations
+
+import mmap
+import struct
+from pathlib import Path
+from typing import Optional, Union
+
+import cv2
+import numpy as np
+
+from frame_protocol import (  # type: ignore
+    PIXEL_BGR24,
+    PIXEL_GRAY8,
+    FrameHeader,
+    Payload,
+    ProtocolError,
+)
+
+RING_MAGIC = b"HRSM"
+RING_VERSION = 1
+_RING_HEADER = struct.Struct("!4sHHIII")
+RING_HEADER_SIZE = 64
+
+
+class SharedFrameRing:
+    """Slot views over a ring file created by the client (or by ``create`` for tools)."""
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        self.path = Path(path)
+        with open(self.path, "r+b") as fh:
+            self._mmap = mmap.mmap(fh.fileno(), 0)
+        magic, version, slot_count, frame_cap, mask_cap, response_cap = _RING_HEADER.unpack_from(self._mmap, 0)
+        if magic != RING_MAGIC or version != RING_VERSION:
+            self._mmap.close()
+            raise ProtocolError(f"{self.path} is not a v{RING_VERSION} frame ring")
+        self.slot_count = slot_count
+        self.frame_capacity = frame_cap
+        self.mask_capacity = mask_cap
+        self.response_capacity = response_cap
+        self.slot_size = frame_cap + mask_cap + response_cap
+        if len(self._mmap) < RING_HEADER_SIZE + slot_count * self.slot_size:
+            self._mmap.close()
+            raise ProtocolError(f"{self.path} is smaller than its {slot_count} slots")
+        self._buffer = np.frombuffer(self._mmap, dtype=np.uint8)
+
+    @classmethod
+    def create(
+        cls,
+        path: Union[str, Path],
+        *,
+        slot_count: int,
+        frame_capacity: int,
+        mask_capacity: int = 0,
+        response_capacity: Optional[int] = None,
+    ) -> "SharedFrameRing":
+        """Create and size a ring file (the client side of the transport)."""
+        if response_capacity is None:
+            response_capacity = frame_capacity
+        size = RING_HEADER_SIZE + slot_count * (frame_capacity + mask_capacity + response_capacity)
+        with open(path, "w+b") as fh:
+            fh.truncate(size)
+            fh.write(_RING_HEADER.pack(RING_MAGIC, RING_VERSION, slot_count, frame_capacity, mask_capacity, response_capacity))
+        return cls(path)
+
+    def _offset(self, slot: int) -> int:
+        if not 0 <= slot < self.slot_count:
+            raise ProtocolError(f"slot {slot} out of range (ring has {self.slot_count})")
+        return RING_HEADER_SIZE + slot * self.slot_size
+
+    def validate(self, header: FrameHeader) -> None:
+        self._offset(header.slot)
+        if (
+            header.payload_length > self.frame_capacity
+            or header.mask_length > self.mask_capacity
+            or header.payload_length > self.response_capacity  # echo must fit too
+        ):
+            raise ProtocolError(
+                f"frame of {header.payload_length}+{header.mask_length} bytes does not fit slot "
+                f"({self.frame_capacity}+{self.mask_capacity}, reply {self.response_capacity})",
+            )
+
+    def frame(self, slot: int, nbytes: int) -> np.ndarray:
+        start = self._offset(slot)
+        return self._buffer[start : start + nbytes]
+
+    def mask(self, slot: int, nbytes: int) -> np.ndarray:
+        start = self._offset(slot) + self.frame_capacity
+        return self._buffer[start : start + nbytes]
+
+    def response(self, slot: int, nbytes: int) -> np.ndarray:
+        if nbytes > self.response_capacity:
+            raise ProtocolError(f"reply of {nbytes} bytes does not fit slot ({self.response_capacity})")
+        start = self._offset(slot) + self.frame_capacity + self.mask_capacity
+        return self._buffer[start : start + nbytes]
+
+    def payload(self, header: FrameHeader) -> Payload:
+        """Zero-copy view of the request frame: HxW(x3) for raw formats, flat bytes for JPEG."""
+        view = self.frame(header.slot, header.payload_length)
+        return view.reshape(header.raw_shape()) if header.is_raw else view
+
+    def write_image(self, slot: int, pixel_format: int, image_bgr: np.ndarray, jpeg_quality: int) -> Optional[int]:
+        """Write ``image_bgr`` into the slot's response area.
+
+        Returns the byte count, or None if encoding failed or the result does not fit.
+        """
+        h, w = image_bgr.shape[:2]
+        if pixel_format == PIXEL_GRAY8:
+            if h * w > self.response_capacity:
+                return None
+            cv2.cvtColor(image_bgr, cv2.COLOR_BGR2GRAY, dst=self.response(slot, h * w).reshape(h, w))
+            return h * w
+        if pixel_format == PIXEL_BGR24:
+            if h * w * 3 > self.response_capacity:
+                return None
+            np.copyto(self.response(slot, h * w * 3).reshape(h, w, 3), image_bgr)
+            return h * w * 3
+        ok, buf = cv2.imencode(".jpg", image_bgr, [int(cv2.IMWRITE_JPEG_QUALITY), int(jpeg_quality)])
+        if not ok or buf.size > self.response_capacity:
+            return None
+        self.response(slot, buf.size)[:] = buf.reshape(-1)
+        return int(buf.size)
+
+    def echo(self, header: FrameHeader) -> int:
+        """Copy the request frame into the response area unchanged."""
+        self.response(header.slot, header.payload_length)[:] = self.frame(header.slot, header.payload_length)
+        return header.payload_length
+
+    def close(self) -> None:
+        # Views handed out earlier keep the mapping alive until they are released.
+        self._buffer = np.empty(0, dtype=np.uint8)
+        try:
+            self._mmap.close()
+        except BufferError:
+            pass
+
@@ -0,0 +1,274 @@
+"""Process pool of RTMDet detectors for CPU inference.
+
+One RTMDetInpainter behind a lock keeps a CPU server at one frame in flight,
+however many cores the machine has. DetectionWorkerPool starts N processes
+that each load the model once and run ``detect``; connection threads call
+``detect(image)`` (or ``submit`` for a future) exactly as they would call the
+inpainter or the DetectionBatcher, and only the detection leaves the process.
+
+Frames and masks never go through pickle: every worker has ``slots`` request
+slots, each backed by a ``multiprocessing.shared_memory`` block the server
+writes the frame into and one the worker writes the mask into. The pipe only
+carries ``(slot, block name, shape)``. Blocks are reallocated (and the new name
+sent along) when a frame or mask outgrows them, so no size is fixed up front.
+A worker unlinks the mask blocks it replaces; the server unlinks every other
+block on ``close``, including those of a worker that crashed or was killed.
+
+A frame goes to the worker with the fewest frames in flight
+(``least-loaded``) or to the next worker in turn (``round-robin``), among
+workers with a free slot; ``submit`` blocks while every slot is busy.
+"""
+from __future__ import annotations
+
+import multiprocessing as mp
+import threading
+from concurrent.futures import Future
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+POLICIES = ("least-loaded", "round-robin")
+
+
+def _remap(blocks: Dict[int, SharedMemory], slot: int, name: str) -> SharedMemory:
+    """The slot's block attached under ``name``, dropping a mapping the other side has replaced."""
+    block = blocks.get(slot)
+    if block is None or block.name != name:
+        if block is not None:
+            block.close()
+        # Spawned workers share the server's resource tracker, so attaching does
+        # not take over the block's cleanup; its creator unlinks it.
+        block = blocks[slot] = SharedMemory(name=name)
+    return block
+
+
+def _worker_main(index: int, inpainter_kwargs: dict, conn) -> None:
+    """Worker process: load the model, then answer ``(slot, name, shape)`` requests until ``None``."""
+    from rtmdet_inpainter import RTMDetInpainter  # type: ignore
+
+    try:
+        inpainter = RTMDetInpainter(**inpainter_kwargs)
+    except Exception as exc:
+        conn.send(("error", f"worker {index}: {exc!r}"))
+        return
+    conn.send(("ready", index))
+
+    inputs: Dict[int, SharedMemory] = {}
+    outputs: Dict[int, SharedMemory] = {}
+    try:
+        while True:
+            request = conn.recv()
+            if request is None:
+                break
+            slot, name, shape = request
+            frame = np.ndarray(shape, dtype=np.uint8, buffer=_remap(inputs, slot, name).buf)
+            try:
+                mask = inpainter.detect(frame)
+            except Exception as exc:
+                conn.send((slot, None, repr(exc)))
+                continue
+            finally:
+                del frame
+            block = outputs.get(slot)
+            if block is None or block.size < mask.size:
+                if block is not None:
+                    block.close()
+                    block.unlink()
+                block = outputs[slot] = SharedMemory(create=True, size=max(1, mask.size))
+            np.ndarray(mask.shape, dtype=bool, buffer=block.buf)[...] = mask
+            conn.send((slot, block.name, mask.shape))
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        # The server unlinks the current output blocks once this process is gone.
+        for block in inputs.values():
+            block.close()
+        for block in outputs.values():
+            block.close()
+
+
+class _Worker:
+    """Parent-side handle: process, pipe, slots and their shared-memory blocks."""
+
+    def __init__(self, index: int, process, conn, slots: int) -> None:
+        self.index = index
+        self.process = process
+        self.conn = conn
+        self.free: List[int] = list(range(slots))
+        self.inputs: List[Optional[SharedMemory]] = [None] * slots
+        self.futures: List[Optional[Future]] = [None] * slots
+        self.outputs: Dict[int, SharedMemory] = {}
+        self.in_flight = 0
+        self.frames = 0
+        self.alive = True
+        self.send_lock = threading.Lock()
+        self.reader: Optional[threading.Thread] = None
+
+
+class DetectionWorkerPool:
+    """``detect``/``submit`` over N worker processes, each with its own RTMDetInpainter."""
+
+    def __init__(
+        self,
+        inpainter_kwargs: dict,
+        *,
+        workers: int = 2,
+        slots: int = 2,
+        policy: str = "least-loaded",
+    ) -> None:
+        if policy not in POLICIES:
+            raise ValueError(f"policy must be one of {POLICIES}")
+        self.policy = policy
+        self._cond = threading.Condition()
+        self._next = 0
+        self._closed = False
+        # spawn everywhere: forking a process that already holds torch threads is unsafe.
+        ctx = mp.get_context("spawn")
+        self._workers: List[_Worker] = []
+        for index in range(max(1, int(workers))):
+            parent_conn, child_conn = ctx.Pipe()
+            process = ctx.Process(
+                target=_worker_main,
+                args=(index, inpainter_kwargs, child_conn),
+                name=f"detector-{index}",
+                daemon=True,
+            )
+            process.start()
+            child_conn.close()
+            self._workers.append(_Worker(index, process, parent_conn, max(1, int(slots))))
+        # Models load in parallel; wait for all of them before taking frames.
+        for worker in self._workers:
+            try:
+                status, detail = worker.conn.recv()
+            except EOFError:
+                status, detail = "error", f"worker {worker.index} exited during startup"
+            if status != "ready":
+                self.close()
+                raise RuntimeError(detail)
+            worker.reader = threading.Thread(
+                target=self._read_results, args=(worker,), name=f"detector-{worker.index}-results", daemon=True,
+            )
+            worker.reader.start()
+
+    @property
+    def workers(self) -> int:
+        return len(self._workers)
+
+    @property
+    def frames_per_worker(self) -> Tuple[int, ...]:
+        return tuple(worker.frames for worker in self._workers)
+
+    def detect(self, image: np.ndarray) -> np.ndarray:
+        """Blocking: the combined mask for one prepared input."""
+        return self.submit(image).result()
+
+    def submit(self, image: np.ndarray) -> Future:
+        """Hand one prepared input to a worker; the future resolves to its mask."""
+        image = np.ascontiguousarray(image, dtype=np.uint8)
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError("worker pool is closed")
+                if not any(worker.alive for worker in self._workers):
+                    raise RuntimeError("no detector processes left")
+                worker = self._pick()
+                if worker is not None:
+                    break
+                self._cond.wait()
+            slot = worker.free.pop()
+            worker.in_flight += 1
+            # Registered under the condition, so a worker exiting from here on fails it.
+            future: Future = Future()
+            worker.futures[slot] = future
+        # The slot is ours until its result has been read back.
+        block = worker.inputs[slot]
+        if block is None or block.size < image.nbytes:
+            if block is not None:
+                block.close()
+                block.unlink()
+            block = worker.inputs[slot] = SharedMemory(create=True, size=max(1, image.nbytes))
+        np.ndarray(image.shape, dtype=np.uint8, buffer=block.buf)[...] = image
+        try:
+            with worker.send_lock:
+                worker.conn.send((slot, block.name, image.shape))
+        except (OSError, ValueError) as exc:
+            with self._cond:
+                worker.futures[slot] = None
+                worker.in_flight -= 1
+                if worker.alive:
+                    worker.free.append(slot)
+                self._cond.notify_all()
+            raise RuntimeError(f"detector-{worker.index}: {exc!r}") from exc
+        return future
+
+    def _pick(self) -> Optional[_Worker]:
+        ready = [worker for worker in self._workers if worker.free]
+        if not ready:
+            return None
+        if self.policy == "least-loaded":
+            return min(ready, key=lambda worker: worker.in_flight)
+        count = len(self._workers)
+        for step in range(count):
+            worker = self._workers[(self._next + step) % count]
+            if worker.free:
+                self._next = (worker.index + 1) % count
+                return worker
+        return None
+
+    def _read_results(self, worker: _Worker) -> None:
+        while True:
+            try:
+                slot, name, detail = worker.conn.recv()
+            except (EOFError, OSError):
+                break
+            future = worker.futures[slot]
+            worker.futures[slot] = None
+            if name is None:
+                future.set_exception(RuntimeError(f"detector-{worker.index}: {detail}"))
+            else:
+                block = _remap(worker.outputs, slot, name)
+                mask = np.ndarray(detail, dtype=bool, buffer=block.buf).copy()
+                future.set_result(mask)
+            with self._cond:
+                worker.free.append(slot)
+                worker.in_flight -= 1
+                worker.frames += 1
+                self._cond.notify()
+        # Worker gone: fail whatever it still held.
+        with self._cond:
+            worker.alive = False
+            for slot, future in enumerate(worker.futures):
+                if future is not None and not future.done():
+                    future.set_exception(RuntimeError(f"detector-{worker.index} exited"))
+                    worker.futures[slot] = None
+            worker.free = []
+            self._cond.notify_all()
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        for worker in self._workers:
+            try:
+                with worker.send_lock:
+                    worker.conn.send(None)
+            except OSError:
+                pass
+        for worker in self._workers:
+            worker.process.join(timeout=5.0)
+            if worker.process.is_alive():
+                worker.process.terminate()
+            if worker.reader is not None:
+                worker.reader.join(timeout=1.0)
+            worker.conn.close()
+            for block in worker.inputs:
+                if block is not None:
+                    block.close()
+                    block.unlink()
+            for block in worker.outputs.values():
+                block.close()
+                try:
+                    block.unlink()
+                except FileNotFoundError:
+                    pass
@@ -2,16 +2,32 @@
 
 Receives JPEG frames from Unity, runs RTMDet instance segmentation and OpenCV
 inpainting using RTMDetInpainterStable, and returns the repaired frame.
+Frames arrive as JPEG (protocol v1) or, from a client on the same PC, as raw
+GRAY8/BGR24 (protocol v2, see PC_Inpaint/frame_protocol.py). With --shm a
+client on the same host can pass frames through a memory-mapped ring instead
+(PC_Inpaint/shm_ring.py); the socket then only carries slot notifications.
+v2 clients that set FLAG_ROI get back only the inpainted rectangle (or an
+"unchanged" reply when no hand was found) and composite it themselves.
+With --async-detect the receiver submits each decoded frame to the detector as
+soon as it arrives, so detection of frame N+1 runs while the worker
+post-processes and inpaints frame N.
+With --workers N detection runs in N model processes (PC_Inpaint/worker_pool.py)
+instead of behind one lock; combine it with --async-detect and a --queue-size
+of about N per connection to keep them busy from a single client.
 """
 from __future__ import annotations
 
 import argparse
+import asyncio
+import atexit
+import os
 import socket
-import struct
 import threading
 import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Optional, Sequence, Tuple
+from typing import List, Optional, Sequence, Tuple
 
 import cv2
 import numpy as np
@@ -22,7 +38,36 @@ import sys
 if str(PC_INPAINT) not in sys.path:
     sys.path.insert(0, str(PC_INPAINT))
 
-from rtmdet_inpainter_stable import RTMDetInpainterStable  # type: ignore
+from async_frame_server import AsyncFrameServer  # type: ignore
+from detection_batcher import DetectionBatcher  # type: ignore
+from frame_protocol import (  # type: ignore
+    FLAG_ROI,
+    FLAG_UNCHANGED,
+    FrameHeader,
+    Payload,
+    ProtocolError,
+    ReceiveBuffers,
+    Roi,
+    StageTimings,
+    decode_payload,
+    echo_reply,
+    encode_reply,
+    payload_size,
+    read_header,
+    read_payload,
+    recv_exact,
+    recv_header,
+    recv_payload,
+    roi_reply,
+    send_reply,
+    slot_reply,
+    stamp_reply,
+    unchanged_reply,
+)
+from frame_pipeline import FramePipeline  # type: ignore
+from rtmdet_inpainter_stable import RTMDetInpainterStable, TemporalState  # type: ignore
+from shm_ring import SharedFrameRing  # type: ignore
+from worker_pool import POLICIES, DetectionWorkerPool  # type: ignore
 
 
 def overlay_mask(image_bgr: np.ndarray, mask_u8: np.ndarray, color=(0, 0, 255), alpha: float = 0.4) -> np.ndarray:
@@ -51,6 +96,9 @@ def save_debug_frame(out_dir: Path, index: int, orig_bgr: np.ndarray, processed_
 
         if det_mask is not None:
             det_u8 = (det_mask.astype(np.uint8) * 255) if det_mask.max() <= 1 else det_mask.astype(np.uint8)
+            if det_u8.shape != orig_bgr.shape[:2]:
+                # --native-postprocess keeps the detection at the model's resolution
+                det_u8 = cv2.resize(det_u8, orig_bgr.shape[1::-1], interpolation=cv2.INTER_NEAREST)
             cv2.imwrite(str(out_dir / f"{stem}_det.png"), det_u8)
             cv2.imwrite(str(out_dir / f"{stem}_det_overlay.jpg"), overlay_mask(orig_bgr, det_u8, color=(0, 0, 255)))
 
@@ -62,36 +110,8 @@ def save_debug_frame(out_dir: Path, index: int, orig_bgr: np.ndarray, processed_
         print(f"[debug] failed to save frame {index}: {exc}")
 
 
-def recv_exact(sock: socket.socket, size: int) -> bytes:
-    data = bytearray()
-    while len(data) < size:
-        chunk = sock.recv(size - len(data))
-        if not chunk:
-            raise ConnectionError("remote closed the connection")
-        data.extend(chunk)
-    return bytes(data)
-
-
-def decode_image(data: bytes) -> Optional[np.ndarray]:
-    if not data:
-        return None
-    arr = np.frombuffer(data, dtype=np.uint8)
-    return cv2.imdecode(arr, cv2.IMREAD_COLOR)
-
-
-def encode_image(image: np.ndarray, quality: int) -> Optional[bytes]:
-    ok, buf = cv2.imencode(".jpg", image, [int(cv2.IMWRITE_JPEG_QUALITY), int(quality)])
-    if not ok:
-        return None
-    return buf.tobytes()
-
-
-def send_frame(conn: socket.socket, payload: bytes) -> None:
-    conn.sendall(struct.pack("!I", len(payload)))
-    conn.sendall(payload)
-
-
-def build_inpainter(args: argparse.Namespace) -> RTMDetInpainterStable:
+def detector_kwargs(args: argparse.Namespace) -> dict:
+    """RTMDetInpainter arguments shared by the server's inpainter and the --workers processes."""
     inference_size: Optional[Tuple[int, int]] = None
     if args.inference_width and args.inference_height:
         inference_size = (args.inference_width, args.inference_height)
@@ -102,92 +122,498 @@ def build_inpainter(args: argparse.Namespace) -> RTMDetInpainterStable:
     if not target_labels:
         target_labels = ("person",)
 
-    return RTMDetInpainterStable(
+    return dict(
         config_path=args.config,
         weights_path=args.weights,
         device=args.device,
         target_labels=target_labels,
         score_threshold=args.score_threshold,
         inference_size=inference_size,
+        warmup=args.warmup,
+        direct_inference=args.direct,
+        max_detections=args.max_detections,
+        mask_threshold=args.mask_threshold,
+        native_masks=args.native_masks,
+        lean_preprocess=args.lean_preprocess,
+        onnx_path=args.onnx,
+        channels_last=args.channels_last,
+        compile_mode=args.compile,
+        num_threads=args.threads,
+    )
+
+
+def build_inpainter(args: argparse.Namespace) -> RTMDetInpainterStable:
+    return RTMDetInpainterStable(
+        **detector_kwargs(args),
+        # With --workers the model lives in the worker processes only.
+        load_model=args.workers == 0,
         inpaint_radius=args.inpaint_radius,
         inpaint_flags=cv2.INPAINT_TELEA,
-        warmup=args.warmup,
         mask_dilate=args.mask_dilate,
         mask_close=args.mask_close,
         min_area=args.min_area,
         keep_frames=args.keep_frames,
         roi_margin=args.roi_margin,
+        flow_interval=args.flow_interval,
+        flow_scale=args.flow_scale,
+        flow_max_error=args.flow_max_error,
+        flow_motion_budget=args.flow_motion_budget,
+        track_redetect=args.track_redetect,
+        track_expand=args.track_expand,
+        track_scale=args.track_scale,
+        native_postprocess=args.native_postprocess,
     )
 
 
-def handle_client(
+@dataclass
+class FrameJob:
+    """One request travelling through the receive -> process -> send stages."""
+
+    index: int
+    header: FrameHeader
+    payload: Payload
+    recv_time: float
+    image: Optional[np.ndarray] = None
+    decoded: bool = False
+    processed: Optional[np.ndarray] = None
+    infer_ms: float = -1.0
+    stale: bool = False
+    timings: StageTimings = field(default_factory=StageTimings)
+    # Pooled receive buffers behind payload/mask, returned once the reply is sent.
+    buffers: List[bytearray] = field(default_factory=list)
+    # Inpainted rectangle for FLAG_ROI requests; None means the frame is unchanged.
+    roi: Optional[Roi] = None
+    # Set for shared-memory frames: payload is a view into this ring.
+    ring: Optional[SharedFrameRing] = None
+    # --async-detect: detection submitted at receive time, resolves to the raw mask.
+    detection: Optional[Future] = None
+
+
+def decode_frame(job: FrameJob) -> FrameJob:
+    if not job.decoded:
+        t0 = time.perf_counter()
+        job.image = decode_payload(job.header, job.payload)
+        job.decoded = True
+        job.timings.decode = (time.perf_counter() - t0) * 1000.0
+    return job
+
+
+def receive_frame(
     conn: socket.socket,
     addr: Tuple[str, int],
+    index: int,
+    *,
+    decode: bool = True,
+    shm: bool = False,
+    ring: Optional[SharedFrameRing] = None,
+    pool: Optional[ReceiveBuffers] = None,
+) -> Optional[FrameJob]:
+    """Read (and optionally decode) the next request; returns None when the stream should close.
+
+    Shared-memory attach requests are returned undecoded (the payload is the ring path).
+    """
+    try:
+        header = recv_header(conn, shm=shm)
+        recv_start = time.perf_counter()
+        if header.in_shm:
+            payload = ring_payload(header, ring)
+    except ProtocolError as exc:
+        print(f"[warn] {exc}, closing {addr}")
+        return None
+    if header.payload_length <= 0:
+        print(f"[warn] invalid frame length {header.payload_length}, closing {addr}")
+        return None
+
+    held: List[bytearray] = []
+    if not header.in_shm:
+        payload = recv_payload(conn, header, pool, held)
+        # Discard any mask payload (server is RTMDet-only)
+        if header.mask_length > 0:
+            if pool is not None:
+                pool.recv(conn, header.mask_length, held)
+            else:
+                recv_exact(conn, header.mask_length)
+
+    recv_time = time.perf_counter()
+    job = FrameJob(
+        index=index, header=header, payload=payload,
+        recv_time=recv_time,
+        timings=StageTimings(recv=(recv_time - recv_start) * 1000.0),
+        buffers=held,
+    )
+    if header.in_shm:
+        job.ring = ring
+    if decode and not header.attaches_shm:
+        decode_frame(job)
+    return job
+
+
+async def read_frame(
+    reader: asyncio.StreamReader,
+    addr: Tuple[str, int],
+    index: int,
+    *,
+    shm: bool = False,
+    ring: Optional[SharedFrameRing] = None,
+) -> Optional[FrameJob]:
+    """asyncio counterpart of receive_frame; decoding is left to an executor."""
+    try:
+        header = await read_header(reader, shm=shm)
+        recv_start = time.perf_counter()
+        if header.in_shm:
+            payload = ring_payload(header, ring)
+    except ProtocolError as exc:
+        print(f"[warn] {exc}, closing {addr}")
+        return None
+    if header.payload_length <= 0:
+        print(f"[warn] invalid frame length {header.payload_length}, closing {addr}")
+        return None
+
+    if not header.in_shm:
+        payload = await read_payload(reader, header)
+        # Discard any mask payload (server is RTMDet-only)
+        if header.mask_length > 0:
+            await reader.readexactly(header.mask_length)
+    recv_time = time.perf_counter()
+    job = FrameJob(
+        index=index, header=header, payload=payload,
+        recv_time=recv_time,
+        timings=StageTimings(recv=(recv_time - recv_start) * 1000.0),
+    )
+    if header.in_shm:
+        job.ring = ring
+    return job
+
+
+def ring_payload(header: FrameHeader, ring: Optional[SharedFrameRing]) -> Payload:
+    """Zero-copy view of a shared-memory frame; the slot stays ours until the reply is sent."""
+    if ring is None:
+        raise ProtocolError("slot notification before the ring was attached")
+    ring.validate(header)
+    return ring.payload(header)
+
+
+def bbox_roi(debug_info: Optional[dict]) -> Optional[Roi]:
+    """(x, y, w, h) from the inclusive [y0, y1, x0, x1] bbox RTMDetInpainterStable reports."""
+    if not debug_info or "bbox" not in debug_info:
+        return None
+    y0, y1, x0, x1 = (int(v) for v in debug_info["bbox"])
+    if y0 == y1 == x0 == x1 == 0:
+        return None  # no mask, nothing was inpainted
+    return x0, y0, x1 - x0 + 1, y1 - y0 + 1
+
+
+def process_frame(
+    job: FrameJob,
     *,
     inpainter: RTMDetInpainterStable,
     infer_lock: threading.Lock,
-    jpeg_quality: int,
     debug_dir: Optional[Path] = None,
     debug_every: int = 0,
-) -> None:
-    print(f"[+] connected from {addr}")
-    frame_index = 0
+    batcher: Optional[DetectionBatcher] = None,
+    state: Optional[TemporalState] = None,
+    pool: Optional[DetectionWorkerPool] = None,
+) -> FrameJob:
+    decode_frame(job)
+    if job.image is None:
+        return job
+
+    stage_ms: dict = {}
     try:
+        t0 = time.perf_counter()
+        if batcher is not None or pool is not None or job.detection is not None:
+            # Detection is serialized (and batched) by the batcher, the detector
+            # thread or the worker processes; the rest of inpaint only touches this
+            # connection's state and runs in parallel.
+            detect = batcher.detect if batcher is not None else pool.detect if pool is not None else None
+            job.processed = inpainter.inpaint(
+                job.image,
+                prior_mask=None,
+                detect=detect,
+                detection=job.detection,
+                state=state,
+                stage_ms=stage_ms,
+            )
+        else:
+            with infer_lock:
+                job.processed = inpainter.inpaint(job.image, prior_mask=None, state=state, stage_ms=stage_ms)
+        # Persistence, flow and tracking follow this connection's own stream.
+        debug_info = state.last_debug if state is not None else inpainter.last_debug
+        job.infer_ms = (time.perf_counter() - t0) * 1000.0
+        job.timings.update(stage_ms)
+    except Exception as exc:  # pragma: no cover
+        print(f"[error] inference failed: {exc}")
+        job.processed = job.image
+        job.infer_ms = -1.0
+        debug_info = None
+
+    if (
+        debug_dir is not None
+        and debug_every > 0
+        and job.index % debug_every == 0
+        and debug_info
+    ):
+        save_debug_frame(debug_dir, job.index, job.image, job.processed, debug_info)
+    if job.header.wants_roi:
+        job.roi = bbox_roi(debug_info)
+    return job
+
+
+def encode_result(addr: Tuple[str, int], job: FrameJob, *, jpeg_quality: int) -> Tuple[List[bytes], bool]:
+    """Return the framed reply for a processed job and whether it is a fresh inpainted frame."""
+    if job.image is None:
+        print(f"[warn] decode failed, echoing raw payload to {addr}")
+        return echo_reply(job.header, job.payload), False
+
+    t0 = time.perf_counter()
+    if job.header.wants_roi:
+        reply = roi_reply(job.header, job.processed, job.roi, jpeg_quality)
+    else:
+        reply = encode_reply(job.header, job.processed, jpeg_quality)
+    if reply is None:
+        print(f"[warn] encode failed, echoing raw payload to {addr}")
+        return echo_reply(job.header, job.payload), False
+    job.timings.encode = (time.perf_counter() - t0) * 1000.0
+    return reply, True
+
+
+def log_frame(job: FrameJob) -> None:
+    total_ms = (time.perf_counter() - job.recv_time) * 1000.0
+    fps = 1000.0 / total_ms if total_ms > 0 else 0.0
+    print(
+        f"[frame] size={payload_size(job.payload):6d} bytes | infer={job.infer_ms:6.1f} ms | total={total_ms:6.1f} ms | fps={fps:5.1f} | "
+        f"{job.timings.summary()}",
+    )
+
+
+class ClientSession:
+    """Per-connection state shared by the threaded and asyncio serving paths."""
+
+    def __init__(
+        self,
+        addr: Tuple[str, int],
+        *,
+        inpainter: RTMDetInpainterStable,
+        infer_lock: threading.Lock,
+        jpeg_quality: int,
+        debug_dir: Optional[Path] = None,
+        debug_every: int = 0,
+        drop_stale: bool = False,
+        stale_reply: str = "previous",
+        batcher: Optional[DetectionBatcher] = None,
+        shm: bool = False,
+        async_detect: bool = False,
+        pool: Optional[DetectionWorkerPool] = None,
+    ) -> None:
+        self.addr = addr
+        self.inpainter = inpainter
+        self.infer_lock = infer_lock
+        self.jpeg_quality = jpeg_quality
+        self.debug_dir = debug_dir
+        self.debug_every = debug_every
+        self.drop_stale = drop_stale
+        self.stale_reply = stale_reply
+        self.batcher = batcher
+        self.async_detect = async_detect
+        self.pool = pool
+        self.state = TemporalState()
+        self.frame_index = 0
+        if batcher is not None:
+            batcher.attach()
+        self.last_reply: Optional[List[bytes]] = None
+        self.receive_buffers = ReceiveBuffers()
+        self.shm = shm
+        self.ring: Optional[SharedFrameRing] = None
+        # Shared-memory replies are written into the request's slot, so "previous"
+        # keeps the image rather than the framed bytes.
+        self.last_processed: Optional[np.ndarray] = None
+
+    def receive(self, conn: socket.socket) -> Optional[FrameJob]:
         while True:
-            header = recv_exact(conn, 8)
-            img_length, mask_length = struct.unpack("!II", header)
-            if img_length <= 0:
-                print(f"[warn] invalid frame length {img_length}, closing {addr}")
+            # With the drop policy most frames never reach the model, so decoding
+            # is deferred to the worker instead of being paid for every frame.
+            job = receive_frame(
+                conn, self.addr, self.frame_index, decode=not self.drop_stale, shm=self.shm, ring=self.ring,
+                pool=self.receive_buffers,
+            )
+            if job is None or not job.header.attaches_shm:
                 break
-
-            payload = recv_exact(conn, img_length)
-            # Discard any mask payload (server is RTMDet-only)
-            if mask_length > 0:
-                _ = recv_exact(conn, mask_length)
-
-            recv_time = time.perf_counter()
-            image = decode_image(payload)
-            if image is None:
-                print(f"[warn] decode failed, echoing raw payload to {addr}")
-                send_frame(conn, payload)
-                continue
-
-            try:
-                t0 = time.perf_counter()
-                with infer_lock:
-                    processed = inpainter.inpaint(image, prior_mask=None)
-                infer_ms = (time.perf_counter() - t0) * 1000.0
-                debug_info = getattr(inpainter, "last_debug", None)
-            except Exception as exc:  # pragma: no cover
-                print(f"[error] inference failed: {exc}")
-                processed = image
-                infer_ms = -1.0
-                debug_info = None
-
-            if (
-                debug_dir is not None
-                and debug_every > 0
-                and frame_index % debug_every == 0
-                and debug_info
-            ):
-                save_debug_frame(debug_dir, frame_index, image, processed, debug_info)
-
-            encoded = encode_image(processed, jpeg_quality)
-            if encoded is None:
-                print(f"[warn] encode failed, echoing raw payload to {addr}")
-                send_frame(conn, payload)
-                continue
-
-            send_frame(conn, encoded)
-            total_ms = (time.perf_counter() - recv_time) * 1000.0
-            fps = 1000.0 / total_ms if total_ms > 0 else 0.0
+            if not self.attach_ring(job):
+                return None
+        self.frame_index += 1
+        if job is not None and self.async_detect and job.image is not None:
+            job.detection = self.submit_detection(job.image)
+        return job
+
+    def submit_detection(self, image: np.ndarray) -> Future:
+        if self.batcher is not None:
+            return self.batcher.submit(self.inpainter.prepare_input(image))
+        if self.pool is not None:
+            return self.pool.submit(self.inpainter.prepare_input(image))
+        return self.inpainter.submit_detect(image)
+
+    async def read(self, reader: asyncio.StreamReader) -> Optional[FrameJob]:
+        while True:
+            job = await read_frame(reader, self.addr, self.frame_index, shm=self.shm, ring=self.ring)
+            if job is None or not job.header.attaches_shm:
+                break
+            if not self.attach_ring(job):
+                return None
+        self.frame_index += 1
+        return job
+
+    def attach_ring(self, job: FrameJob) -> bool:
+        path = bytes(job.payload).decode("utf-8", errors="replace")
+        try:
+            ring = SharedFrameRing(path)
+        except (OSError, ValueError) as exc:
+            print(f"[warn] cannot map shared-memory ring {path!r}: {exc}, closing {self.addr}")
+            return False
+        # Frames already in flight keep their own reference to the old ring.
+        self.ring = ring
+        print(f"[shm] {self.addr} attached {path} slots={ring.slot_count} frame_capacity={ring.frame_capacity}")
+        return True
+
+    def decode(self, job: FrameJob) -> FrameJob:
+        return decode_frame(job)
+
+    def process(self, job: FrameJob) -> FrameJob:
+        return process_frame(
+            job,
+            inpainter=self.inpainter,
+            infer_lock=self.infer_lock,
+            debug_dir=self.debug_dir,
+            debug_every=self.debug_every,
+            batcher=self.batcher,
+            state=self.state,
+            pool=self.pool,
+        )
+
+    def mark_stale(self, job: FrameJob) -> FrameJob:
+        job.stale = True
+        return job
+
+    def reply(self, job: FrameJob) -> List[bytes]:
+        """Framed reply for a job, with its stage timings if the client asked for them."""
+        return stamp_reply(job.header, self.build_reply(job), job.timings)
+
+    def build_reply(self, job: FrameJob) -> List[bytes]:
+        """Unstamped reply; stale jobs are answered without touching the model."""
+        if job.ring is not None:
+            return self.reply_in_slot(job, job.ring)
+        if job.stale:
+            if job.header.wants_roi:
+                # An earlier frame's patch pasted over this one would leave the hand
+                # visible wherever it has moved since; the client keeps its own frame.
+                return unchanged_reply(job.header)
+            if self.stale_reply == "previous" and self.last_reply is not None:
+                return self.last_reply
+            return echo_reply(job.header, job.payload)
+        reply, fresh = encode_result(self.addr, job, jpeg_quality=self.jpeg_quality)
+        if fresh:
+            self.last_reply = reply
+            log_frame(job)
+        return reply
+
+    def reply_in_slot(self, job: FrameJob, ring: SharedFrameRing) -> List[bytes]:
+        header = job.header
+        if job.stale and header.wants_roi:
+            # Never re-send an earlier frame's patch over this one (see build_reply).
+            return slot_reply(header, 0, header.reply_format, header.width, header.height, flags=FLAG_UNCHANGED)
+        if job.stale:
+            image = self.last_processed if self.stale_reply == "previous" else None
+            roi = None
+        else:
+            image = job.processed if job.image is not None else None
+            roi = job.roi
+        if header.wants_roi and roi is None and image is not None:
+            # Nothing inpainted: the client keeps its frame.
+            self.last_processed = image
+            log_frame(job)
+            return slot_reply(header, 0, header.reply_format, header.width, header.height, flags=FLAG_UNCHANGED)
+        length = None
+        t0 = time.perf_counter()
+        if image is not None:
+            patch = image
+            if header.wants_roi:
+                x, y, rw, rh = roi
+                patch = image[y : y + rh, x : x + rw]
+            length = ring.write_image(header.slot, header.reply_format, patch, self.jpeg_quality)
+        if length is None:
+            if not job.stale:
+                print(f"[warn] no result for slot {header.slot}, echoing raw payload to {self.addr}")
+            return slot_reply(header, ring.echo(header), header.pixel_format, header.width, header.height)
+        if not job.stale:
+            job.timings.encode = (time.perf_counter() - t0) * 1000.0
+            self.last_processed = image
+            log_frame(job)
+        h, w = image.shape[:2]
+        if header.wants_roi:
+            return slot_reply(header, length, header.reply_format, w, h, flags=FLAG_ROI, roi=roi)
+        return slot_reply(header, length, header.reply_format, w, h)
+
+    def send(self, conn: socket.socket, job: FrameJob) -> None:
+        send_reply(conn, self.reply(job))
+        # The reply may reference the payload (echo), so the buffers go back only now.
+        self.receive_buffers.release(job.buffers)
+
+    def encode(self, job: FrameJob) -> List[bytes]:
+        return self.reply(job)
+
+    def close(self) -> None:
+        if self.ring is not None:
+            self.ring.close()
+        if self.inpainter.flow_interval > 1:
+            print(f"[flow] {self.addr} keyframes={self.state.keyframes} propagated={self.state.propagated}")
+        if self.inpainter.track_redetect > 1:
+            print(f"[track] {self.addr} detections={self.state.keyframes} on_crop={self.state.roi_detections}")
+        if self.batcher is not None:
+            self.batcher.detach()
             print(
-                f"[frame] size={img_length:6d} bytes | infer={infer_ms:6.1f} ms | total={total_ms:6.1f} ms | fps={fps:5.1f}",
+                f"[batch] {self.addr} batches={self.batcher.batches} mean_size={self.batcher.mean_batch_size:.2f}",
+            )
+
+
+def handle_client(
+    conn: socket.socket,
+    addr: Tuple[str, int],
+    *,
+    pipeline: bool = False,
+    queue_size: int = 2,
+    **session_kwargs,
+) -> None:
+    print(f"[+] connected from {addr}")
+    # Replies are one gather write; without this a small trailing segment can wait for a delayed ACK.
+    conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    session = ClientSession(addr, **session_kwargs)
+    runner: Optional[FramePipeline] = None
+    try:
+        if pipeline or session.drop_stale:
+            runner = FramePipeline(
+                receive=lambda: session.receive(conn),
+                process=session.process,
+                send=lambda job: session.send(conn, job),
+                on_abort=lambda: conn.shutdown(socket.SHUT_RDWR),
+                on_stale=session.mark_stale,
+                queue_size=queue_size,
+                drop_stale=session.drop_stale,
+                name=f"client-{addr[1]}",
             )
-            frame_index += 1
+            runner.run()
+        else:
+            while True:
+                job = session.receive(conn)
+                if job is None:
+                    break
+                session.send(conn, session.process(job))
     except ConnectionError as exc:
         print(f"[-] {addr} disconnected: {exc}")
     finally:
+        if runner is not None and session.drop_stale:
+            print(
+                f"[stats] {addr} processed={runner.processed} dropped={runner.dropped} coalesced={runner.coalesced}",
+            )
+        session.close()
         conn.close()
 
 
@@ -200,26 +626,112 @@ def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
     parser.add_argument("--device", default="cuda:0", help="Device for inference, e.g. cuda:0 or cpu")
     parser.add_argument("--target-label", dest="target_label", action="append", help="Label(s) to inpaint; repeat for multiple")
     parser.add_argument("--score-threshold", type=float, default=0.3, help="Ignore detections below this score")
+    parser.add_argument("--max-detections", type=int, help="Keep at most this many instances after NMS (overrides the config's max_per_img)")
+    parser.add_argument("--mask-threshold", type=float, help="Mask binarisation threshold (overrides the config's mask_thr_binary)")
     parser.add_argument("--inference-width", type=int, help="Optional resize width before inference")
     parser.add_argument("--inference-height", type=int, help="Optional resize height before inference")
     parser.add_argument("--inpaint-radius", type=int, default=3, help="OpenCV inpaint radius")
     parser.add_argument("--jpeg-quality", type=int, default=80, help="JPEG quality for response")
     parser.add_argument("--warmup", action="store_true", help="Run one warmup inference during startup")
+    parser.add_argument("--direct", action="store_true", help="Run the model's data_preprocessor and predict directly under inference_mode, skipping DetInferencer's RLE round-trip")
+    parser.add_argument("--native-masks", action="store_true", help="OR instance masks at the model's input resolution and upsample the union once (implies --direct)")
+    parser.add_argument("--lean-preprocess", action="store_true", help="Resize BGR frames once, straight to the padded model input, skipping the mmcv pipeline (implies --direct)")
+    parser.add_argument("--onnx", default="", help="Run this graph from export_onnx.py on onnxruntime (CPU) instead of PyTorch")
+    parser.add_argument("--channels-last", action="store_true", help="Run the model in channels_last (NHWC) memory format (implies --direct)")
+    parser.add_argument("--compile", nargs="?", const="default", default="", choices=("default", "reduce-overhead", "max-autotune"), help="torch.compile the backbone/neck and head, warmed up at startup (implies --direct)")
+    parser.add_argument("--threads", type=int, default=0, help="Intra-op threads for torch or onnxruntime (0 = library default)")
     # post-processing controls
     parser.add_argument("--mask-dilate", type=int, default=2, help="Dilate mask by k pixels (approx, via morphology)")
     parser.add_argument("--mask-close", type=int, default=3, help="Close small holes (approx radius in pixels)")
     parser.add_argument("--min-area", type=int, default=64, help="Filter blobs smaller than this many pixels")
+    parser.add_argument("--native-postprocess", action="store_true", help="Filter and morph the mask at the detection resolution (kernels and --min-area scaled to it), upsampling only the final mask")
     parser.add_argument("--keep-frames", type=int, default=2, help="Temporal persistence when a frame briefly misses")
     parser.add_argument("--roi-margin", type=int, default=20, help="Margin (pixels) around detected bbox for ROI inpaint")
+    parser.add_argument("--flow-interval", type=int, default=1, help="Detect at least every N frames, propagating the mask by optical flow in between (1 = detect every frame)")
+    parser.add_argument("--flow-scale", type=float, default=0.25, help="Downscale factor of the frames optical flow runs on")
+    parser.add_argument("--flow-max-error", type=float, default=12.0, help="Detect instead when the flow-warped frame differs by more grey levels under the mask")
+    parser.add_argument("--flow-motion-budget", type=float, default=48.0, help="Detect instead once the mask has moved this many pixels since the last keyframe")
+    parser.add_argument("--track-redetect", type=int, default=1, help="Detect on a crop around the tracked hand, with a full-frame detection every N detections (1 = always full frame)")
+    parser.add_argument("--track-expand", type=float, default=0.5, help="Crop margin around the tracked box, as a fraction of its size")
+    parser.add_argument("--track-scale", type=float, default=1.0, help="Max resize factor of the crop with --lean-preprocess (1 = native pixels)")
     parser.add_argument("--debug-dir", type=str, default="", help="Optional directory to dump debug frames/masks")
     parser.add_argument("--debug-every", type=int, default=0, help="Dump one frame every N frames (0=off)")
-    return parser.parse_args(argv)
+    # connection pipelining
+    parser.add_argument("--pipeline", action="store_true", help="Overlap receive/decode, inference and encode/send on separate threads")
+    parser.add_argument("--queue-size", type=int, default=2, help="Frames buffered between pipeline stages")
+    parser.add_argument("--drop-stale", action="store_true", help="Latest-frame-wins: only infer the newest pending frame (implies --pipeline)")
+    parser.add_argument(
+        "--stale-reply",
+        choices=("previous", "passthrough"),
+        default="previous",
+        help="Reply for dropped frames: last inpainted result or the untouched payload",
+    )
+    parser.add_argument("--async-detect", action="store_true", help="Detect frame N+1 on a detector thread while frame N is post-processed (implies --pipeline)")
+    parser.add_argument("--workers", type=int, default=0, help="Run detection in N model processes fed through shared memory (0 = in this process)")
+    parser.add_argument("--worker-slots", type=int, default=2, help="Frames in flight per worker process")
+    parser.add_argument("--worker-policy", choices=POLICIES, default="least-loaded", help="How frames are dispatched to worker processes")
+    parser.add_argument("--max-batch", type=int, default=1, help="Batch detection across up to N connections (e.g. 2 for stereo); 1 disables batching")
+    parser.add_argument("--batch-window-ms", type=float, default=4.0, help="How long a frame waits for frames from other connections")
+    parser.add_argument("--shm", action="store_true", help="Accept the shared-memory ring transport from clients on this host")
+    parser.add_argument("--asyncio", action="store_true", help="Serve all clients from one asyncio event loop instead of a thread each")
+    args = parser.parse_args(argv)
+    if args.async_detect and (args.drop_stale or args.asyncio):
+        parser.error("--async-detect works with the threaded pipeline only (not --drop-stale or --asyncio)")
+    if args.async_detect and (args.flow_interval > 1 or args.track_redetect > 1):
+        # Both decide how to detect a frame from the previous frame's final mask,
+        # which is not known yet when the next frame is submitted.
+        parser.error("--async-detect cannot be combined with --flow-interval or --track-redetect")
+    if args.workers > 0 and args.max_batch > 1:
+        parser.error("--workers and --max-batch are alternatives; use one of them")
+    return args
 
 
 def main(argv: Optional[Sequence[str]] = None) -> None:
     args = parse_args(argv)
     inpainter = build_inpainter(args)
+    atexit.register(inpainter.close)
+    if inpainter.warmup_ms:
+        passes = ", ".join(f"{ms:.0f}" for ms in inpainter.warmup_ms)
+        print(f"[*] warmup passes: {passes} ms")
     infer_lock = threading.Lock()
+    pool: Optional[DetectionWorkerPool] = None
+    if args.workers > 0:
+        kwargs = detector_kwargs(args)
+        kwargs["num_threads"] = args.threads or max(1, (os.cpu_count() or 1) // args.workers)
+        pool = DetectionWorkerPool(kwargs, workers=args.workers, slots=args.worker_slots, policy=args.worker_policy)
+        print(f"[*] {pool.workers} detector processes, {kwargs['num_threads']} threads each")
+        atexit.register(pool.close)
+    batcher: Optional[DetectionBatcher] = None
+    if args.max_batch > 1:
+        batcher = DetectionBatcher(
+            inpainter.detect_batch,
+            max_batch=args.max_batch,
+            window_ms=args.batch_window_ms,
+        )
+    session_kwargs = {
+        "inpainter": inpainter,
+        "infer_lock": infer_lock,
+        "jpeg_quality": args.jpeg_quality,
+        "debug_dir": Path(args.debug_dir) if args.debug_dir else None,
+        "debug_every": max(0, args.debug_every),
+        "drop_stale": args.drop_stale,
+        "stale_reply": args.stale_reply,
+        "batcher": batcher,
+        "shm": args.shm,
+        "async_detect": args.async_detect,
+        "pool": pool,
+    }
+
+    if args.asyncio:
+        AsyncFrameServer(
+            lambda addr: ClientSession(addr, **session_kwargs),
+            queue_size=args.queue_size,
+            drop_stale=args.drop_stale,
+            # With batching, concurrent process() calls are what fill a batch;
+            # with worker processes they are what keeps every slot busy.
+            infer_workers=max(1, args.max_batch, args.workers * args.worker_slots),
+        ).run(args.host, args.port)
+        return
 
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server:
         server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
@@ -232,11 +744,9 @@ def main(argv: Optional[Sequence[str]] = None) -> None:
                 target=handle_client,
                 args=(conn, addr),
                 kwargs={
-                    "inpainter": inpainter,
-                    "infer_lock": infer_lock,
-                    "jpeg_quality": args.jpeg_quality,
-                    "debug_dir": Path(args.debug_dir) if args.debug_dir else None,
-                    "debug_every": max(0, args.debug_every),
+                    "pipeline": args.pipeline or args.async_detect,
+                    "queue_size": max(1, args.queue_size),
+                    **session_kwargs,
                 },
                 daemon=True,
             )
@@ -7,13 +7,14 @@ back over the same TCP connection.
 from __future__ import annotations
 
 import argparse
+import asyncio
 import socket
-import struct
 import sys
 import threading
 import time
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Optional, Sequence, Tuple
+from typing import List, Optional, Sequence, Tuple
 
 import cv2
 import numpy as np
@@ -23,42 +24,34 @@ PC_INPAINT = SERVER_ROOT / "PC_Inpaint"
 if str(PC_INPAINT) not in sys.path:
     sys.path.insert(0, str(PC_INPAINT))
 
+from async_frame_server import AsyncFrameServer  # type: ignore
+from detection_batcher import DetectionBatcher  # type: ignore
+from frame_protocol import (  # type: ignore
+    FrameHeader,
+    Payload,
+    ProtocolError,
+    ReceiveBuffers,
+    StageTimings,
+    changed_roi,
+    decode_mask,
+    decode_payload,
+    echo_reply,
+    encode_reply,
+    payload_size,
+    read_header,
+    read_payload,
+    recv_exact,
+    recv_header,
+    recv_payload,
+    roi_reply,
+    send_reply,
+    stamp_reply,
+    unchanged_reply,
+)
+from frame_pipeline import FramePipeline  # type: ignore  # noqa: E402
 from rtmdet_inpainter import RTMDetInpainter  # type: ignore  # noqa: E402
 
 
-def recv_exact(sock: socket.socket, size: int) -> bytes:
-    data = bytearray()
-    while len(data) < size:
-        chunk = sock.recv(size - len(data))
-        if not chunk:
-            raise ConnectionError("remote closed the connection")
-        data.extend(chunk)
-    return bytes(data)
-
-
-def decode_image(data: bytes) -> Optional[np.ndarray]:
-    if not data:
-        return None
-    arr = np.frombuffer(data, dtype=np.uint8)
-    return cv2.imdecode(arr, cv2.IMREAD_COLOR)
-
-
-def encode_image(image: np.ndarray, quality: int) -> Optional[bytes]:
-    success, buffer = cv2.imencode(
-        ".jpg",
-        image,
-        [int(cv2.IMWRITE_JPEG_QUALITY), int(quality)],
-    )
-    if not success:
-        return None
-    return buffer.tobytes()
-
-
-def send_frame(conn: socket.socket, payload: bytes) -> None:
-    conn.sendall(struct.pack("!I", len(payload)))
-    conn.sendall(payload)
-
-
 def build_inpainter(args: argparse.Namespace) -> RTMDetInpainter:
     inference_size: Optional[Tuple[int, int]] = None
     if args.inference_width and args.inference_height:
@@ -78,78 +71,307 @@ def build_inpainter(args: argparse.Namespace) -> RTMDetInpainter:
         inpaint_radius=args.inpaint_radius,
         inpaint_flags=cv2.INPAINT_TELEA,
         warmup=args.warmup,
+        direct_inference=args.direct,
+        max_detections=args.max_detections,
+        mask_threshold=args.mask_threshold,
+        native_masks=args.native_masks,
+        lean_preprocess=args.lean_preprocess,
+        onnx_path=args.onnx,
+        channels_last=args.channels_last,
+        compile_mode=args.compile,
+        num_threads=args.threads,
+    )
+
+
+@dataclass
+class FrameJob:
+    """One request travelling through the receive -> process -> send stages."""
+
+    index: int
+    header: FrameHeader
+    payload: Payload
+    mask_payload: Payload
+    recv_time: float
+    image: Optional[np.ndarray] = None
+    decoded: bool = False
+    processed: Optional[np.ndarray] = None
+    infer_ms: float = -1.0
+    stale: bool = False
+    timings: StageTimings = field(default_factory=StageTimings)
+    # Pooled receive buffers behind payload/mask, returned once the reply is sent.
+    buffers: List[bytearray] = field(default_factory=list)
+
+
+def decode_frame(job: FrameJob) -> FrameJob:
+    if not job.decoded:
+        t0 = time.perf_counter()
+        job.image = decode_payload(job.header, job.payload)
+        job.decoded = True
+        job.timings.decode = (time.perf_counter() - t0) * 1000.0
+    return job
+
+
+def receive_frame(
+    conn: socket.socket,
+    addr: Tuple[str, int],
+    index: int,
+    *,
+    decode: bool = True,
+    pool: Optional[ReceiveBuffers] = None,
+) -> Optional[FrameJob]:
+    """Read (and optionally decode) the next request; returns None when the stream should close."""
+    try:
+        header = recv_header(conn)
+        recv_start = time.perf_counter()
+    except ProtocolError as exc:
+        print(f"[warn] {exc}, closing {addr}")
+        return None
+    if header.payload_length <= 0:
+        print(f"[warn] invalid frame length {header.payload_length}, closing {addr}")
+        return None
+
+    held: List[bytearray] = []
+    payload = recv_payload(conn, header, pool, held)
+    mask_payload: Payload = b""
+    if header.mask_length > 0:
+        if pool is not None:
+            mask_payload = pool.recv(conn, header.mask_length, held)
+        else:
+            mask_payload = recv_exact(conn, header.mask_length)
+    recv_time = time.perf_counter()
+    job = FrameJob(
+        index=index, header=header, payload=payload, mask_payload=mask_payload,
+        recv_time=recv_time,
+        timings=StageTimings(recv=(recv_time - recv_start) * 1000.0),
+        buffers=held,
     )
+    if decode:
+        decode_frame(job)
+    return job
 
 
-def decode_mask(data: bytes, shape: Tuple[int, int]) -> Optional[np.ndarray]:
-    if not data:
+async def read_frame(reader: asyncio.StreamReader, addr: Tuple[str, int], index: int) -> Optional[FrameJob]:
+    """asyncio counterpart of receive_frame; decoding is left to an executor."""
+    try:
+        header = await read_header(reader)
+        recv_start = time.perf_counter()
+    except ProtocolError as exc:
+        print(f"[warn] {exc}, closing {addr}")
         return None
-    expected = shape[0] * shape[1]
-    if len(data) != expected:
+    if header.payload_length <= 0:
+        print(f"[warn] invalid frame length {header.payload_length}, closing {addr}")
         return None
-    arr = np.frombuffer(data, dtype=np.uint8)
-    return arr.reshape(shape)
+
+    payload = await read_payload(reader, header)
+    mask_payload = await reader.readexactly(header.mask_length) if header.mask_length > 0 else b""
+    recv_time = time.perf_counter()
+    return FrameJob(
+        index=index, header=header, payload=payload, mask_payload=mask_payload,
+        recv_time=recv_time,
+        timings=StageTimings(recv=(recv_time - recv_start) * 1000.0),
+    )
+
+
+def process_frame(
+    job: FrameJob,
+    *,
+    inpainter: RTMDetInpainter,
+    infer_lock: threading.Lock,
+    batcher: Optional[DetectionBatcher] = None,
+) -> FrameJob:
+    decode_frame(job)
+    image = job.image
+    if image is None:
+        return job
+
+    prior_mask = None
+    if job.mask_payload:
+        t0 = time.perf_counter()
+        prior_mask = decode_mask(job.header, job.mask_payload, image.shape[:2])
+        if prior_mask is not None:
+            prior_mask = cv2.GaussianBlur(prior_mask, (15, 15), 0)
+            _, prior_mask = cv2.threshold(prior_mask, 32, 255, cv2.THRESH_BINARY)
+        job.timings.decode += (time.perf_counter() - t0) * 1000.0
+
+    stage_ms: dict = {}
+    try:
+        t0 = time.perf_counter()
+        if batcher is not None:
+            # RTMDetInpainter.inpaint is stateless; only detection needs serializing.
+            job.processed = inpainter.inpaint(image, prior_mask=prior_mask, detect=batcher.detect, stage_ms=stage_ms)
+        else:
+            with infer_lock:
+                job.processed = inpainter.inpaint(image, prior_mask=prior_mask, stage_ms=stage_ms)
+        job.infer_ms = (time.perf_counter() - t0) * 1000.0
+        job.timings.update(stage_ms)
+    except Exception as exc:  # pragma: no cover
+        print(f"[error] inference failed: {exc}")
+        job.processed = image
+        job.infer_ms = -1.0
+    return job
+
+
+def encode_result(addr: Tuple[str, int], job: FrameJob, *, jpeg_quality: int) -> Tuple[List[bytes], bool]:
+    """Return the framed reply for a processed job and whether it is a fresh inpainted frame."""
+    if job.image is None:
+        print(f"[warn] decode failed, echoing raw payload to {addr}")
+        return echo_reply(job.header, job.payload), False
+
+    t0 = time.perf_counter()
+    if job.header.wants_roi:
+        # RTMDetInpainter does not report where it painted, so diff against the input.
+        roi = changed_roi(job.image, job.processed)
+        reply = roi_reply(job.header, job.processed, roi, jpeg_quality)
+    else:
+        reply = encode_reply(job.header, job.processed, jpeg_quality)
+    if reply is None:
+        print(f"[warn] encode failed, echoing raw payload to {addr}")
+        return echo_reply(job.header, job.payload), False
+    job.timings.encode = (time.perf_counter() - t0) * 1000.0
+    return reply, True
+
+
+def log_frame(job: FrameJob) -> None:
+    total_ms = (time.perf_counter() - job.recv_time) * 1000.0
+    fps = 1000.0 / total_ms if total_ms > 0 else 0.0
+    print(
+        f"[frame] size={payload_size(job.payload):6d} bytes | mask={len(job.mask_payload):6d} | infer={job.infer_ms:6.1f} ms | "
+        f"total={total_ms:6.1f} ms | fps={fps:5.1f} | {job.timings.summary()}",
+    )
+
+
+class ClientSession:
+    """Per-connection state shared by the threaded and asyncio serving paths."""
+
+    def __init__(
+        self,
+        addr: Tuple[str, int],
+        *,
+        inpainter: RTMDetInpainter,
+        infer_lock: threading.Lock,
+        jpeg_quality: int,
+        drop_stale: bool = False,
+        stale_reply: str = "previous",
+        batcher: Optional[DetectionBatcher] = None,
+    ) -> None:
+        self.addr = addr
+        self.inpainter = inpainter
+        self.infer_lock = infer_lock
+        self.jpeg_quality = jpeg_quality
+        self.drop_stale = drop_stale
+        self.stale_reply = stale_reply
+        self.batcher = batcher
+        self.frame_index = 0
+        if batcher is not None:
+            batcher.attach()
+        self.last_reply: Optional[List[bytes]] = None
+        self.receive_buffers = ReceiveBuffers()
+
+    def receive(self, conn: socket.socket) -> Optional[FrameJob]:
+        # With the drop policy most frames never reach the model, so decoding
+        # is deferred to the worker instead of being paid for every frame.
+        job = receive_frame(
+            conn, self.addr, self.frame_index, decode=not self.drop_stale, pool=self.receive_buffers,
+        )
+        self.frame_index += 1
+        return job
+
+    async def read(self, reader: asyncio.StreamReader) -> Optional[FrameJob]:
+        job = await read_frame(reader, self.addr, self.frame_index)
+        self.frame_index += 1
+        return job
+
+    def decode(self, job: FrameJob) -> FrameJob:
+        return decode_frame(job)
+
+    def process(self, job: FrameJob) -> FrameJob:
+        return process_frame(
+            job,
+            inpainter=self.inpainter,
+            infer_lock=self.infer_lock,
+            batcher=self.batcher,
+        )
+
+    def mark_stale(self, job: FrameJob) -> FrameJob:
+        job.stale = True
+        return job
+
+    def reply(self, job: FrameJob) -> List[bytes]:
+        """Framed reply for a job, with its stage timings if the client asked for them."""
+        return stamp_reply(job.header, self.build_reply(job), job.timings)
+
+    def build_reply(self, job: FrameJob) -> List[bytes]:
+        """Unstamped reply; stale jobs are answered without touching the model."""
+        if job.stale:
+            if job.header.wants_roi:
+                # An earlier frame's patch pasted over this one would leave the hand
+                # visible wherever it has moved since; the client keeps its own frame.
+                return unchanged_reply(job.header)
+            if self.stale_reply == "previous" and self.last_reply is not None:
+                return self.last_reply
+            return echo_reply(job.header, job.payload)
+        reply, fresh = encode_result(self.addr, job, jpeg_quality=self.jpeg_quality)
+        if fresh:
+            self.last_reply = reply
+            log_frame(job)
+        return reply
+
+    def send(self, conn: socket.socket, job: FrameJob) -> None:
+        send_reply(conn, self.reply(job))
+        # The reply may reference the payload (echo), so the buffers go back only now.
+        self.receive_buffers.release(job.buffers)
+
+    def encode(self, job: FrameJob) -> List[bytes]:
+        return self.reply(job)
+
+    def close(self) -> None:
+        if self.batcher is not None:
+            self.batcher.detach()
+            print(
+                f"[batch] {self.addr} batches={self.batcher.batches} mean_size={self.batcher.mean_batch_size:.2f}",
+            )
 
 
 def handle_client(
     conn: socket.socket,
     addr: Tuple[str, int],
     *,
-    inpainter: RTMDetInpainter,
-    infer_lock: threading.Lock,
-    jpeg_quality: int,
+    pipeline: bool = False,
+    queue_size: int = 2,
+    **session_kwargs,
 ) -> None:
     print(f"[+] connected from {addr}")
+    # Replies are one gather write; without this a small trailing segment can wait for a delayed ACK.
+    conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    session = ClientSession(addr, **session_kwargs)
+    runner: Optional[FramePipeline] = None
     try:
-        while True:
-            header = recv_exact(conn, 8)
-            img_length, mask_length = struct.unpack("!II", header)
-            if img_length <= 0:
-                print(f"[warn] invalid frame length {img_length}, closing {addr}")
-                break
-
-            payload = recv_exact(conn, img_length)
-            mask_payload = recv_exact(conn, mask_length) if mask_length > 0 else b""
-            recv_time = time.perf_counter()
-            image = decode_image(payload)
-            if image is None:
-                print(f"[warn] decode failed, echoing raw payload to {addr}")
-                send_frame(conn, payload)
-                continue
-
-            prior_mask = None
-            if mask_payload:
-                prior_mask = decode_mask(mask_payload, image.shape[:2])
-                if prior_mask is not None:
-                    prior_mask = cv2.GaussianBlur(prior_mask, (15, 15), 0)
-                    _, prior_mask = cv2.threshold(prior_mask, 32, 255, cv2.THRESH_BINARY)
-
-            try:
-                t0 = time.perf_counter()
-                with infer_lock:
-                    processed = inpainter.inpaint(image, prior_mask=prior_mask)
-                infer_ms = (time.perf_counter() - t0) * 1000.0
-            except Exception as exc:  # pragma: no cover
-                print(f"[error] inference failed: {exc}")
-                processed = image
-                infer_ms = -1.0
-
-            encoded = encode_image(processed, jpeg_quality)
-            if encoded is None:
-                print(f"[warn] encode failed, echoing raw payload to {addr}")
-                send_frame(conn, payload)
-                continue
-
-            send_frame(conn, encoded)
-            total_ms = (time.perf_counter() - recv_time) * 1000.0
-            fps = 1000.0 / total_ms if total_ms > 0 else 0.0
-            print(
-                f"[frame] size={img_length:6d} bytes | mask={mask_length:6d} | infer={infer_ms:6.1f} ms | "
-                f"total={total_ms:6.1f} ms | fps={fps:5.1f}",
+        if pipeline or session.drop_stale:
+            runner = FramePipeline(
+                receive=lambda: session.receive(conn),
+                process=session.process,
+                send=lambda job: session.send(conn, job),
+                on_abort=lambda: conn.shutdown(socket.SHUT_RDWR),
+                on_stale=session.mark_stale,
+                queue_size=queue_size,
+                drop_stale=session.drop_stale,
+                name=f"client-{addr[1]}",
             )
+            runner.run()
+        else:
+            while True:
+                job = session.receive(conn)
+                if job is None:
+                    break
+                session.send(conn, session.process(job))
     except ConnectionError as exc:
         print(f"[-] {addr} disconnected: {exc}")
     finally:
+        if runner is not None and session.drop_stale:
+            print(
+                f"[stats] {addr} processed={runner.processed} dropped={runner.dropped} coalesced={runner.coalesced}",
+            )
+        session.close()
         conn.close()
 
 
@@ -181,18 +403,89 @@ def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
         default=0.3,
         help="Ignore detections below this score",
     )
+    parser.add_argument("--max-detections", type=int, help="Keep at most this many instances after NMS (overrides the config's max_per_img)")
+    parser.add_argument("--mask-threshold", type=float, help="Mask binarisation threshold (overrides the config's mask_thr_binary)")
     parser.add_argument("--inference-width", type=int, help="Optional resize width before inference")
     parser.add_argument("--inference-height", type=int, help="Optional resize height before inference")
     parser.add_argument("--inpaint-radius", type=int, default=3, help="OpenCV inpaint radius")
     parser.add_argument("--jpeg-quality", type=int, default=80, help="JPEG quality for response")
     parser.add_argument("--warmup", action="store_true", help="Run one warmup inference during startup")
+    parser.add_argument("--direct", action="store_true", help="Run the model's data_preprocessor and predict directly under inference_mode, skipping DetInferencer's RLE round-trip")
+    parser.add_argument("--native-masks", action="store_true", help="OR instance masks at the model's input resolution and upsample the union once (implies --direct)")
+    parser.add_argument("--lean-preprocess", action="store_true", help="Resize BGR frames once, straight to the padded model input, skipping the mmcv pipeline (implies --direct)")
+    parser.add_argument("--onnx", default="", help="Run this graph from export_onnx.py on onnxruntime (CPU) instead of PyTorch")
+    parser.add_argument("--channels-last", action="store_true", help="Run the model in channels_last (NHWC) memory format (implies --direct)")
+    parser.add_argument("--compile", nargs="?", const="default", default="", choices=("default", "reduce-overhead", "max-autotune"), help="torch.compile the backbone/neck and head, warmed up at startup (implies --direct)")
+    parser.add_argument("--threads", type=int, default=0, help="Intra-op threads for torch or onnxruntime (0 = library default)")
+    parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        help="Overlap receive/decode, inference and encode/send on separate threads",
+    )
+    parser.add_argument("--queue-size", type=int, default=2, help="Frames buffered between pipeline stages")
+    parser.add_argument(
+        "--drop-stale",
+        action="store_true",
+        help="Latest-frame-wins: only infer the newest pending frame (implies --pipeline)",
+    )
+    parser.add_argument(
+        "--stale-reply",
+        choices=("previous", "passthrough"),
+        default="previous",
+        help="Reply for dropped frames: last inpainted result or the untouched payload",
+    )
+    parser.add_argument(
+        "--max-batch",
+        type=int,
+        default=1,
+        help="Batch detection across up to N connections (e.g. 2 for stereo); 1 disables batching",
+    )
+    parser.add_argument(
+        "--batch-window-ms",
+        type=float,
+        default=4.0,
+        help="How long a frame waits for frames from other connections",
+    )
+    parser.add_argument(
+        "--asyncio",
+        action="store_true",
+        help="Serve all clients from one asyncio event loop instead of a thread each",
+    )
     return parser.parse_args(argv)
 
 
 def main(argv: Optional[Sequence[str]] = None) -> None:
     args = parse_args(argv)
     inpainter = build_inpainter(args)
+    if inpainter.warmup_ms:
+        passes = ", ".join(f"{ms:.0f}" for ms in inpainter.warmup_ms)
+        print(f"[*] warmup passes: {passes} ms")
     infer_lock = threading.Lock()
+    batcher: Optional[DetectionBatcher] = None
+    if args.max_batch > 1:
+        batcher = DetectionBatcher(
+            inpainter.detect_batch,
+            max_batch=args.max_batch,
+            window_ms=args.batch_window_ms,
+        )
+    session_kwargs = {
+        "inpainter": inpainter,
+        "infer_lock": infer_lock,
+        "jpeg_quality": args.jpeg_quality,
+        "drop_stale": args.drop_stale,
+        "stale_reply": args.stale_reply,
+        "batcher": batcher,
+    }
+
+    if args.asyncio:
+        AsyncFrameServer(
+            lambda addr: ClientSession(addr, **session_kwargs),
+            queue_size=args.queue_size,
+            drop_stale=args.drop_stale,
+            # With batching, concurrent process() calls are what fill a batch.
+            infer_workers=max(1, args.max_batch),
+        ).run(args.host, args.port)
+        return
 
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server:
         server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
@@ -205,9 +498,9 @@ def main(argv: Optional[Sequence[str]] = None) -> None:
                 target=handle_client,
                 args=(conn, addr),
                 kwargs={
-                    "inpainter": inpainter,
-                    "infer_lock": infer_lock,
-                    "jpeg_quality": args.jpeg_quality,
+                    "pipeline": args.pipeline,
+                    "queue_size": max(1, args.queue_size),
+                    **session_kwargs,
                 },
                 daemon=True,
             )